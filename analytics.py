@@ -0,0 +1,176 @@
+""" Аналитика охвата проверками водоисточников
+Водоисточники (снимок слоя snapshot.py) и проверки (список sync.syncer.checkups) один раз
+загружаются в DataFrame, дальше всё считается векторно:
+ - дата последней проверки каждого водоисточника и просроченные (не проверялись дольше
+   Config.inspection_interval_days);
+ - охват проверками по поселениям и хозяйствующим субъектам (ИД_хоз_субъекта);
+ - доля отказов по последней проверке: нет воды (Наличие_воды), невозможен подъезд (Подъезд_ПА).
+Результат кэшируется до следующего изменения данных (событие sync.py).
+В боте - команда администратора /coverage (handlers/admin_handlers.py).
+"""
+import datetime
+import time
+from html import escape
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+import executors
+import metrics
+import nextgis
+import snapshot
+import sync
+from config import Config
+from models import Checkup
+
+NO_WATER = 'отсутствует'
+NO_ENTRANCE = 'невозможен'
+
+
+@dataclass
+class Coverage:
+    """ Результат расчёта: сводка и таблицы (DataFrame) """
+    created: float
+    totals: dict
+    by_locality: pd.DataFrame
+    by_company: pd.DataFrame
+    overdue: pd.DataFrame
+
+
+def sources_frame(layer: snapshot.Snapshot) -> pd.DataFrame:
+    """ Водоисточники из колонок снимка (без построения объектов по одному) """
+    columns = (layer.compacted() if layer.overlay else layer).columns
+    company = np.asarray(columns['company_id'])
+    return pd.DataFrame({
+        'id': np.asarray(columns['id']),
+        'name': np.asarray(columns['name']),
+        'locality': pd.Series(np.asarray(columns['locality'])).replace('', 'не указано'),
+        'company_id': pd.Series(company).where(company != snapshot.NULL_INT).astype('Int64'),
+    })
+
+
+def checkups_frame(checkups: List[Checkup]) -> pd.DataFrame:
+    rows = [(item.fields.source_id, item.fields.date_time, item.fields.water, item.fields.entrance)
+            for item in checkups if item.fields.source_id is not None and item.fields.date_time is not None]
+    frame = pd.DataFrame(rows, columns=['source_id', 'date_time', 'water', 'entrance'])
+    moments = frame.pop('date_time')
+    parts = {part: [getattr(moment, part) for moment in moments]
+             for part in ('year', 'month', 'day', 'hour', 'minute')}
+    frame['date'] = pd.to_datetime(pd.DataFrame(parts), errors='coerce') if len(frame) else pd.Series(
+        dtype='datetime64[ns]')
+    return frame
+
+
+def _rates(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    """ Охват (доля проверенных) и отказы (доля проверенных с отказом) по группам """
+    grouped = frame.groupby(key, dropna=False)
+    result = pd.DataFrame({
+        'sources': grouped['id'].size(),
+        'inspected': grouped['inspected'].sum(),
+        'failed': grouped['failed'].sum(),
+    })
+    result['coverage'] = result['inspected'] / result['sources']
+    result['failure'] = (result['failed'] / result['inspected'].where(result['inspected'] > 0)).fillna(0.0)
+    return result.sort_values(['coverage', 'sources'], ascending=[True, False])
+
+
+def compute(sources: pd.DataFrame, checkups: pd.DataFrame, organizations: dict,
+            interval_days: int, now: datetime.datetime = None) -> Coverage:
+    now = pd.Timestamp(now or datetime.datetime.now())
+    threshold = now - pd.Timedelta(days=interval_days)
+
+    latest = (checkups.sort_values('date').drop_duplicates('source_id', keep='last')
+              .set_index('source_id')[['date', 'water', 'entrance']])
+    frame = sources.join(latest, on='id')
+    frame['inspected'] = frame['date'] >= threshold
+    frame['no_water'] = frame['inspected'] & (frame['water'] == NO_WATER)
+    frame['no_entrance'] = frame['inspected'] & (frame['entrance'] == NO_ENTRANCE)
+    frame['failed'] = frame['no_water'] | frame['no_entrance']
+    frame['company'] = frame['company_id'].map(organizations).fillna('не указан')
+
+    overdue = frame.loc[~frame['inspected'], ['id', 'name', 'locality', 'company', 'date']]
+    overdue = overdue.sort_values('date', na_position='first').rename(columns={'date': 'last_inspection'})
+    inspected = int(frame['inspected'].sum())
+    totals = {
+        'sources': len(frame),
+        'inspected': inspected,
+        'coverage': inspected / len(frame) if len(frame) else 0.0,
+        'overdue': len(overdue),
+        'never': int(frame['date'].isna().sum()),
+        'no_water': int(frame['no_water'].sum()),
+        'no_entrance': int(frame['no_entrance'].sum()),
+        'interval_days': interval_days,
+    }
+    return Coverage(created=time.time(), totals=totals, by_locality=_rates(frame, 'locality'),
+                    by_company=_rates(frame, 'company'), overdue=overdue)
+
+
+# --- Кэш до следующей синхронизации ---
+_cache: Optional[Coverage] = None
+_organizations: Optional[dict] = None
+# Номер версии данных: увеличивается при каждом изменении (_invalidate)
+_generation = 0
+
+
+def _load_organizations() -> dict:
+    return {item.id: item.fields.name for item in nextgis.get_organizations(geom='no', extensions='none')}
+
+
+async def coverage() -> Coverage:
+    """ Результат расчёта из кэша или новый расчёт (в пуле потоков для вычислений).
+    Если данные изменились во время расчёта, результат возвращается, но не кэшируется """
+    global _cache, _organizations
+    if _cache is not None:
+        metrics.inc('analytics.cache.hits')
+        return _cache
+    metrics.inc('analytics.cache.misses')
+    generation = _generation
+    organizations = _organizations
+    if organizations is None:
+        organizations = await executors.ngw.run(_load_organizations)
+        if generation == _generation:
+            _organizations = organizations
+    # Копии данных берутся в цикле событий: снимок и последние проверки изменяет sync, пока идёт расчёт
+    layer, checkups = snapshot.layer.copy(), sync.syncer.checkups
+    started = time.perf_counter()
+    result = await executors.cpu.run(
+        lambda: compute(sources_frame(layer), checkups_frame(checkups), organizations,
+                        Config.inspection_interval_days))
+    logger.info(f'Аналитика охвата рассчитана за {(time.perf_counter() - started) * 1000:.0f} мс')
+    if generation == _generation:
+        _cache = result
+    return result
+
+
+@sync.subscribe
+def _invalidate(change: sync.Change):
+    global _cache, _organizations, _generation
+    _generation += 1
+    _cache = None
+    if change.reloaded:
+        _organizations = None
+
+
+def summary(result: Coverage, top: int = 10) -> str:
+    """ Текст сводки для Telegram (HTML) """
+    totals = result.totals
+    lines = [
+        f"<b>Охват проверками за {totals['interval_days']} дн.</b>",
+        f"Водоисточников: {totals['sources']}, проверено: {totals['inspected']} ({totals['coverage']:.0%})",
+        f"Просрочено: {totals['overdue']} (ни разу не проверялись: {totals['never']})",
+        f"Нет воды: {totals['no_water']}, подъезд невозможен: {totals['no_entrance']}",
+    ]
+    for title, table in (('Поселения', result.by_locality), ('Хоз. субъекты', result.by_company)):
+        lines.append(f"\n<b>{title}</b> (охват / отказы / всего)")
+        rows = [f"{escape(str(item.Index)[:22]):22} {item.coverage:4.0%} {item.failure:4.0%} {item.sources:5d}"
+                for item in table.head(top).itertuples()]
+        lines.append('<pre>' + '\n'.join(rows) + '</pre>')
+    if len(result.overdue):
+        lines.append('\n<b>Дольше всех без проверки</b>')
+        for item in result.overdue.head(top).itertuples():
+            last = item.last_inspection.date() if pd.notna(item.last_inspection) else 'никогда'
+            lines.append(f"ИД {item.id} {escape(item.name)}, {escape(item.locality)} - {last}")
+    return '\n'.join(lines)
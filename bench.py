@@ -0,0 +1,329 @@
+""" Микробенчмарки горячих участков бота
+Замеряются участки, выполняемые на каждом запросе:
+ - nextgis.get_features: построение URL и разбор JSON для слоя реалистичного размера
+ - nextgis.get_water_sources: то же с разбором в модели (models.py)
+ - templates.description_water_intake: формирование описания водоисточника
+ - преобразование координат EPSG:4326 -> EPSG:3857
+ - inline-поиск по локальному индексу (20000 водоисточников)
+ - построение клавиатур keyboards.py
+ - FSM: update_data/get_data
+ - полный cmd_save с подменёнными внешними сервисами
+Сетевые запросы подменяются (unittest.mock), измеряется только код бота.
+
+    python bench.py                          - замер, результаты в JSON (bench_results.json)
+    python bench.py --save-baseline          - замер и сохранение базовой линии (bench_baseline.json)
+    python bench.py --compare                - сравнение с базовой линией, код выхода 1 при регрессии
+                                               или бенчмарке, которого нет в базовой линии (обновите её)
+    python bench.py --filter fsm --quick     - только выбранные бенчмарки, короткий замер
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from unittest import mock
+
+from loguru import logger
+
+from config import Config
+
+BASELINE_FILE = 'bench_baseline.json'
+RESULTS_FILE = 'bench_results.json'
+LAYER_SIZE = 2000
+
+_benchmarks = {}
+
+
+def benchmark(name: str):
+    """ Регистрация бенчмарка: функция-фабрика возвращает замеряемую функцию (или корутину) без аргументов """
+    def register(factory):
+        _benchmarks[name] = factory
+        return factory
+    return register
+
+
+def _response(payload, status_code: int = 200):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    response.text = response.content.decode('utf-8')
+    response.json.return_value = payload
+    return response
+
+
+def _layer(size: int = LAYER_SIZE) -> list:
+    from fakes.ngw import make_water_sources
+    return [{'id': fid, **feature} for fid, feature in make_water_sources(size).items()]
+
+
+# --- Бенчмарки ---
+@benchmark('nextgis.get_features')
+def bench_get_features():
+    import nextgis
+    response = _response(_layer())
+    patcher = mock.patch('nextgis.requests.get', return_value=response)
+    patcher.start()
+
+    def run():
+        nextgis.get_features(Config.ngw_resource_wi_points, fields=['name', 'Поселение', 'Улица', 'Дом'],
+                             fld_filter=['fld_Поселение__ilike=%Сургут%'], order_by=['name'], limit=5000,
+                             geom='no', extensions='none')
+    return run, patcher.stop
+
+
+@benchmark('nextgis.get_water_sources')
+def bench_get_water_sources():
+    import nextgis
+    response = _response(_layer())
+    patcher = mock.patch('nextgis.requests.get', return_value=response)
+    patcher.start()
+
+    def run():
+        nextgis.get_water_sources(fld_filter=['fld_Поселение__ilike=%Сургут%'], order_by=['name'], limit=5000,
+                                  geom='no', extensions='none')
+    return run, patcher.stop
+
+
+@benchmark('nextgis.get_feature')
+def bench_get_feature():
+    import nextgis
+    response = _response(_layer(1)[0])
+    patcher = mock.patch('nextgis.requests.get', return_value=response)
+    patcher.start()
+
+    def run():
+        nextgis.get_feature(Config.ngw_resource_wi_points, 1, geom='no')
+    return run, patcher.stop
+
+
+@benchmark('templates.description_water_intake')
+def bench_description():
+    import templates
+    response = _response({'id': 3, 'fields': {'Хоз_субъект': 'ООО "Водоканал"'}})
+    patcher = mock.patch('nextgis.requests.get', return_value=response)
+    patcher.start()
+    fields = _layer(1)[0]['fields']
+
+    def run():
+        templates.description_water_intake(1, fields['Поселение'], fields['Улица'], fields['Дом'],
+                                           fields['Ориентир'], fields['Исполнение'], fields['Водоотдача_сети'],
+                                           'folder-id', 'https://maps.google.com', fields['ИД_хоз_субъекта'])
+    return run, patcher.stop
+
+
+@benchmark('geo.transform_with_new_transformer')
+def bench_transform_new():
+    from pyproj import Transformer
+
+    def run():
+        Transformer.from_crs("EPSG:4326", "EPSG:3857").transform(61.25, 73.39)
+    return run, None
+
+
+@benchmark('geo.transform')
+def bench_transform():
+    import geo
+
+    def run():
+        geo.wgs84_to_web_mercator(61.25, 73.39)
+    return run, None
+
+
+@benchmark('search.inline_query')
+def bench_search():
+    import search
+    from models import WaterSource, decode
+    index = search.SearchIndex.build(decode(WaterSource, json.dumps(_layer(20000), ensure_ascii=False).encode(),
+                                            many=True))
+
+    def run():
+        index.search('сургут ленина 12')
+        index.search('ленена')
+    return run, None
+
+
+@benchmark('keyboards.all')
+def bench_keyboards():
+    import keyboards
+
+    def run():
+        keyboards.get_checkout_keyboard()
+        keyboards.get_water_keyboard()
+        keyboards.get_workable_keyboard()
+        keyboards.get_entrance_keyboard()
+        keyboards.get_plate_keyboard()
+    return run, None
+
+
+@benchmark('fsm.update_get_data')
+def bench_fsm():
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1))
+
+    async def run():
+        await state.update_data(fid=1, name='ПГ-1\nСургут, Ленина, 1', checkout='осмотр внешний')
+        await state.update_data(shot_medium_id='AgACAgIAAxkBAAIBZ2Zm')
+        await state.get_data()
+    return run, None
+
+
+@benchmark('survey.cmd_save')
+def bench_cmd_save():
+    from aiogram import Bot
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Chat, File, Message, User
+    from fakes.ngw import make_organizations
+    from handlers import survey_handlers
+
+    feature = _layer(1)[0]
+    organization = make_organizations(1)[1]
+    bot = Bot(token='123456789:AABBCCDDEEFFaabbccddeeff-123456789')
+
+    def get(url, **kwargs):
+        # Хоз.субъект для описания папки; набор объектов - поиск проверки (не найдена); иначе водоисточник
+        if f'/resource/{Config.ngw_resource_organization}/' in url:
+            return _response(organization)
+        return _response([] if '/feature/?' in url else feature)
+
+    patchers = [
+        mock.patch('nextgis.requests.get', side_effect=get),
+        mock.patch('nextgis.requests.post', return_value=_response({'id': 10})),
+        mock.patch('nextgis.requests.put', return_value=_response({'id': 10})),
+        mock.patch('nextgis.requests.patch', return_value=_response([{'id': 10}])),
+        mock.patch('pydrive.create_folder', return_value='folder-id'),
+        mock.patch('pydrive.create_file_from_url', return_value=None),
+        mock.patch.object(Bot, 'get_file', mock.AsyncMock(return_value=File(
+            file_id='photo', file_unique_id='u', file_size=200 * 1024, file_path='photos/photo.jpg'))),
+        mock.patch.object(Bot, 'send_message', mock.AsyncMock()),
+        mock.patch.object(Message, 'answer', mock.AsyncMock(return_value=mock.MagicMock(
+            edit_text=mock.AsyncMock(), delete=mock.AsyncMock()))),
+        mock.patch('handlers.survey_handlers.asyncio.sleep', mock.AsyncMock()),
+        mock.patch.object(Config, 'progress_interval', 0),
+        mock.patch.object(Config, 'trace_file', None),
+    ]
+    for patcher in patchers:
+        patcher.start()
+
+    storage = MemoryStorage()
+    state = FSMContext(storage=storage, key=StorageKey(bot_id=bot.id, chat_id=1, user_id=1))
+    message = Message(message_id=1, date=1, chat=Chat(id=1, type='private'),
+                      from_user=User(id=1, is_bot=False, first_name='Test'), text='/save')
+    data = {'fid': 1, 'name': 'ПГ-1', 'date_time': {'year': 2025, 'month': 8, 'day': 15, 'hour': 12, 'minute': 30},
+            'EPSG_3857': 'POINT(8171735.6 8680155.0)', 'checkout': 'осмотр внешний', 'water': 'имеется',
+            'workable': 'возможна', 'entrance': 'возможен', 'plate_exist': 'есть (по ГОСТ)',
+            'shot_medium_id': 'p1', 'shot_full_id': 'p2', 'shot_long_id': 'p3', 'shot_plate': 'p4'}
+
+    async def run():
+        await state.set_state('BotStates:save')
+        await state.set_data(data)
+        await survey_handlers.cmd_save(message, state, bot)
+        # Ошибка сохранения перехватывается cmd_save: без проверки замерялся бы путь ошибки
+        if await state.get_state() is not None:
+            raise RuntimeError('сохранение не завершено')
+
+    def stop():
+        for patcher in reversed(patchers):
+            patcher.stop()
+    return run, stop
+
+
+# --- Замер ---
+def measure(func, min_time: float, repeat: int) -> list:
+    """ Время одного вызова (мкс) в repeat сериях; размер серии подбирается под min_time секунд """
+    is_async = asyncio.iscoroutinefunction(func)
+    loop = asyncio.new_event_loop() if is_async else None
+
+    def series(number: int) -> float:
+        if is_async:
+            async def many():
+                started = time.perf_counter()
+                for _ in range(number):
+                    await func()
+                return time.perf_counter() - started
+            return loop.run_until_complete(many())
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - started
+
+    try:
+        series(1)  # Прогрев
+        number = 1
+        while True:
+            elapsed = series(number)
+            if elapsed >= min_time / repeat or number >= 1_000_000:
+                break
+            number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / repeat / elapsed) + 1))
+        return [series(number) / number * 1e6 for _ in range(repeat)]
+    finally:
+        if loop:
+            loop.close()
+
+
+def run_benchmarks(names: list, min_time: float = 1.0, repeat: int = 5) -> dict:
+    results = {}
+    for name in names:
+        func, cleanup = _benchmarks[name]()
+        try:
+            timings = measure(func, min_time, repeat)
+        finally:
+            if cleanup:
+                cleanup()
+        results[name] = {'median_us': round(statistics.median(timings), 2), 'min_us': round(min(timings), 2),
+                         'stdev_us': round(statistics.stdev(timings), 2) if len(timings) > 1 else 0.0}
+        print(f"{name:40} {results[name]['median_us']:12.2f} мкс  (min {results[name]['min_us']:.2f})",
+              file=sys.stderr)
+    return {'python': platform.python_version(), 'machine': platform.machine(),
+            'timestamp': int(time.time()), 'layer_size': LAYER_SIZE, 'results': results}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> tuple:
+    """ Сравнение с базовой линией по медиане. Возвращает текст отчёта и признак регрессии.
+    Бенчмарк без базовой линии - тоже сбой: базовую линию нужно сохранить заново (--save-baseline) """
+    lines = [f"{'Бенчмарк':40} {'база, мкс':>12} {'сейчас, мкс':>12} {'изменение':>10}"]
+    regression = False
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            lines.append(f"{name:40} {'—':>12} {result['median_us']:12.2f} {'новый':>10}  нет в базовой линии")
+            regression = True
+            continue
+        change = (result['median_us'] - base['median_us']) / base['median_us']
+        mark = ''
+        if change > threshold:
+            mark, regression = '  регрессия', True
+        elif change < -threshold:
+            mark = '  ускорение'
+        lines.append(f"{name:40} {base['median_us']:12.2f} {result['median_us']:12.2f} {change * 100:+9.1f}%{mark}")
+    return '\n'.join(lines), regression
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Микробенчмарки горячих участков бота')
+    parser.add_argument('--filter', default='', help='Только бенчмарки, имя которых содержит строку')
+    parser.add_argument('--quick', action='store_true', help='Короткий замер (для проверки работоспособности)')
+    parser.add_argument('--output', default=RESULTS_FILE, help='Файл результатов в JSON')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Сохранить результаты в {BASELINE_FILE}')
+    parser.add_argument('--compare', action='store_true', help=f'Сравнить с {BASELINE_FILE}')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Порог регрессии (доля), по умолчанию 0.10')
+    args = parser.parse_args()
+
+    logger.remove()
+    selected = [name for name in _benchmarks if args.filter in name]
+    current = run_benchmarks(selected, min_time=0.2 if args.quick else 1.0, repeat=3 if args.quick else 5)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(current, file, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as file:
+            json.dump(current, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(BASELINE_FILE, encoding='utf-8') as file:
+            report, regression = compare(current, json.load(file), args.threshold)
+        print(report)
+        sys.exit(1 if regression else 0)
@@ -10,6 +10,8 @@ class Config:
     # Параметры Telegram бота
     bot_token = os.environ.get('BOT_TOKEN')
     bot_url: str = 'https://t.me/surgutfire_ppv_bot?start'
+    # Адрес сервера Bot API (пусто - api.telegram.org), например поддельного из fakes/telegram.py
+    tg_api_server: str = os.environ.get('TG_API_SERVER')
 
     # Параметры Telegram группы
 
@@ -17,10 +19,12 @@ class Config:
     tg_canal_id: str = '-1002389637778' # ППВ СгМПСГ (канал)
     tg_error_id: str = '-1002015129960' # Ошибки ботов (канал)
     tg_admin_id: str = '478031430'      # @SurgutFire
+    # Администраторы бота (команды /export и др.): ИД через запятую в TG_ADMIN_IDS
+    tg_admin_ids: tuple = tuple(int(item) for item in os.environ.get('TG_ADMIN_IDS', tg_admin_id).split(','))
     tg_admin_chat: str = '-1002015129960' # Ошибки ботов (канал)
 
     # Параметры NextGIS WEB (ngw)
-    ngw_host: str = 'https://spt-surgut.nextgis.com'
+    ngw_host: str = os.environ.get('NGW_HOST', 'https://spt-surgut.nextgis.com')
     ngw_user: str = os.environ.get('NGW_USER')
     ngw_password: str =  os.environ.get('NGW_PASSWORD')
     # ИД ресурса - основной таблицы > точки забора воды (Водоисточники)
@@ -38,4 +42,127 @@ class Config:
     url_map = 'https://spt-surgut.nextgis.com/resource/1/display?panel=none'
 
     # ИД родительской папки на Googke диске, в которой расположены подпапки водоисточников
-    parent_folder_id = '1qESxdsWZ0R-2D9IszYW0JfCNHNdtw_UH'
\ No newline at end of file
+    parent_folder_id = '1qESxdsWZ0R-2D9IszYW0JfCNHNdtw_UH'
+    # Адрес совместимого с Drive API v2 сервиса (пусто - Google Drive через PyDrive2),
+    # например поддельного из fakes/drive.py
+    drive_api_url: str = os.environ.get('DRIVE_API_URL')
+
+    # Файл трасс конвейера сохранения (JSON-lines в формате OpenTelemetry), пусто - трассировка отключена
+    trace_file: str = os.environ.get('TRACE_FILE', 'logs/traces.jsonl')
+
+    # Размер скользящих окон метрик (количество последних наблюдений)
+    metrics_window: int = 1000
+
+    # Пулы потоков для блокирующих вызовов (executors.py): потоков и максимальная очередь
+    executor_ngw_workers: int = int(os.environ.get('EXECUTOR_NGW_WORKERS', 8))
+    executor_ngw_queue: int = int(os.environ.get('EXECUTOR_NGW_QUEUE', 32))
+    executor_drive_workers: int = int(os.environ.get('EXECUTOR_DRIVE_WORKERS', 4))
+    executor_drive_queue: int = int(os.environ.get('EXECUTOR_DRIVE_QUEUE', 64))
+    executor_cpu_workers: int = int(os.environ.get('EXECUTOR_CPU_WORKERS', 2))
+    executor_cpu_queue: int = int(os.environ.get('EXECUTOR_CPU_QUEUE', 32))
+    executor_hedge_workers: int = int(os.environ.get('EXECUTOR_HEDGE_WORKERS', 8))
+    executor_hedge_queue: int = int(os.environ.get('EXECUTOR_HEDGE_QUEUE', 0))
+    executor_ngw_fanout_workers: int = int(os.environ.get('EXECUTOR_NGW_FANOUT_WORKERS', 8))
+    executor_ngw_fanout_queue: int = int(os.environ.get('EXECUTOR_NGW_FANOUT_QUEUE', 64))
+    executor_export_workers: int = int(os.environ.get('EXECUTOR_EXPORT_WORKERS', 1))
+    executor_export_queue: int = int(os.environ.get('EXECUTOR_EXPORT_QUEUE', 0))
+
+    # Минимальный интервал между правками сообщения о ходе сохранения в одном чате, секунд
+    progress_interval: float = 1.0
+
+    # Устойчивость запросов к NextGIS WEB: таймауты (соединение, чтение) в секундах,
+    # отказов подряд до размыкания выключателя, пауза до пробного запроса,
+    # задержка страхующего повтора чтения get_feature (0 - без повтора)
+    ngw_timeout: tuple = (3.05, float(os.environ.get('NGW_READ_TIMEOUT', 15)))
+    ngw_breaker_failures: int = 5
+    ngw_breaker_reset: float = 30.0
+    ngw_hedge_delay: float = float(os.environ.get('NGW_HEDGE_DELAY', 0))
+
+    # Запись обезличенных входящих обновлений для воспроизведения (replay.py), пусто - не записывать.
+    # Соль псевдонимов ИД пользователей: одинаковая соль - одинаковые псевдонимы в разных журналах
+    record_updates_file: str = os.environ.get('RECORD_UPDATES')
+    record_salt: str = os.environ.get('RECORD_SALT')
+    record_flush_interval: float = 10.0
+
+    # Локальный снимок слоя водоисточников (snapshot.py): каталог (пусто - не использовать),
+    # размер страницы полного чтения слоя, возраст снимка, после которого он пересобирается полностью
+    snapshot_dir: str = os.environ.get('SNAPSHOT_DIR', 'data/snapshot')
+    snapshot_page: int = 1000
+    snapshot_max_age: float = float(os.environ.get('SNAPSHOT_MAX_AGE', 7 * 24 * 3600))
+
+    # Инкрементальная синхронизация с NextGIS WEB (sync.py): интервал опроса, интервал проверки удалений,
+    # поле даты изменения водоисточника (пусто - отслеживаются только новые объекты по полю ИД, а изменения
+    # существующих попадают в снимок при полной пересборке раз в sync_rebuild_interval секунд)
+    sync_interval: float = float(os.environ.get('SYNC_INTERVAL', 60))
+    sync_id_scan_interval: float = float(os.environ.get('SYNC_ID_SCAN_INTERVAL', 900))
+    sync_modified_field: str = os.environ.get('NGW_MODIFIED_FIELD')
+    sync_rebuild_interval: float = float(os.environ.get('SYNC_REBUILD_INTERVAL', 3600))
+    sync_id_field: str = 'ИД'
+
+    # Inline-поиск водоисточников (search.py): количество результатов в ответе
+    search_limit: int = 20
+
+    # Выгрузка проверок (export.py): объектов на страницу запроса к NextGIS WEB,
+    # страниц, запрашиваемых параллельно
+    export_page: int = 1000
+    export_prefetch: int = 4
+
+    # Аналитика охвата (analytics.py): водоисточник должен проверяться не реже, чем раз в столько дней
+    inspection_interval_days: int = int(os.environ.get('INSPECTION_INTERVAL_DAYS', 183))
+
+    # Бюджет запуска бота (импорт, создание бота и диспетчера), секунд - см. startup.py
+    startup_budget: float = float(os.environ.get('STARTUP_BUDGET', 5.0))
+
+    # Прогрев при запуске (health.py): шаги через запятую из telegram, ngw, organizations, features, drive, geo
+    # (пусто - без прогрева); порт HTTP сервера /healthz и /readyz (0 - не запускать),
+    # интервал фоновой проверки зависимостей, секунд
+    warmup_steps: str = os.environ.get('WARMUP', 'telegram,ngw,organizations,features,drive,geo')
+    health_port: int = int(os.environ.get('HEALTH_PORT', 8080))
+    health_interval: float = float(os.environ.get('HEALTH_INTERVAL', 30))
+
+    # Время, в течение которого подтверждённое участие пользователя в канале не перепроверяется, секунд
+    member_cache_ttl: float = float(os.environ.get('MEMBER_CACHE_TTL', 300))
+
+    # Журнал (logsetup.py): уровень вывода в консоль, файл (пусто - не писать), его уровень и формат JSON,
+    # размер файла до ротации и количество хранимых архивов, длина превью данных запросов,
+    # доли записываемых записей по категориям ("категория=доля,...")
+    log_level: str = os.environ.get('LOG_LEVEL', 'INFO')
+    log_file: str = os.environ.get('LOG_FILE', 'logs/log_aiogram.log')
+    log_file_level: str = os.environ.get('LOG_FILE_LEVEL', 'WARNING')
+    log_json: bool = os.environ.get('LOG_JSON', '1') == '1'
+    log_rotation: str = '10 MB'
+    log_retention: int = 10
+    log_preview: int = 300
+    log_sampling: str = os.environ.get('LOG_SAMPLING', 'ngw.read=0.05,ngw.payload=0.1')
+
+    # Завершение бота (shutdown.py): время на завершение начатых сохранений и задач пулов потоков, секунд;
+    # файл незавершённых сохранений - после запуска пользователи могут повторить /save
+    shutdown_timeout: float = float(os.environ.get('SHUTDOWN_TIMEOUT', 25))
+    pending_saves_file: str = os.environ.get('PENDING_SAVES_FILE', 'data/pending_saves.jsonl')
+
+    # Поле таблицы проверок для ключа идемпотентности записи (повтор /save не создаёт вторую проверку).
+    # Отдельное текстовое поле слоя; пусто - ключ не записывается, повтор определяется по водоисточнику
+    # и дате-времени опроса (поля ИД_ВИ и Дата_время, точность - минута)
+    checkup_key_field: str = os.environ.get('NGW_CHECKUP_KEY_FIELD', '')
+
+    # Пакетная запись объектов в NextGIS WEB (nextgis.ngw_write_features): объектов в запросе PATCH,
+    # повторов неудачно записанных и пауза между ними. Одиночные запросы, если пакет не принят, -
+    # в пуле executors.ngw_fanout
+    ngw_batch_size: int = int(os.environ.get('NGW_BATCH_SIZE', 100))
+    ngw_batch_retries: int = 2
+    ngw_batch_backoff: float = 1.0
+
+    # Пакетный опрос (/next): водоисточников в одной сессии, одновременных передач снимков при сохранении
+    batch_max_items: int = int(os.environ.get('BATCH_MAX_ITEMS', 20))
+    save_photo_concurrency: int = 8
+
+    # Альбом снимков: время ожидания всех сообщений альбома, секунд; каталог снимков, скачанных
+    # заранее (staging.py), пусто - снимки скачиваются только при сохранении
+    album_window: float = float(os.environ.get('ALBUM_WINDOW', 1.0))
+    staging_dir: str = os.environ.get('STAGING_DIR', 'data/staging')
+
+    # Срок жизни незавершённых опросов (sessions.py): "состояние=секунд,..." ("*" - остальные состояния,
+    # 0 - без срока), напоминание за session_reminder секунд до сброса (0 - без напоминания), период проверки
+    session_ttl: str = os.environ.get('SESSION_TTL', '*=7200,save=86400')
+    session_reminder: int = int(os.environ.get('SESSION_REMINDER', 600))
+    session_sweep_interval: int = int(os.environ.get('SESSION_SWEEP_INTERVAL', 60))
@@ -14,9 +14,13 @@ headers_str = ['Поселение', 'Улица', 'Дом', 'Вид_ВИ', 'Н
 headers_date = ['Дефект_выявлен', 'Дефект_устранён', 'Дата_испытания', 'Регистрация_дата', 'Исключение_дата']
 headers_geom = ['Широта', 'Долгота']
 
-fields_dict = {}
-fields_geom = {}
+# Преобразование географических координат в систему координат NextGIS WEB
+transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857")
+
+features = []  # Создаваемые водоисточники: поля и геометрия
 for ind in data.index:  # Перебор строк
+    fields_dict = {}
+    fields_geom = {}
     for column in data:  # Перебор столбцов
         if column in headers_int:
             if pd.notnull(data[column][ind]):
@@ -36,36 +40,41 @@ for ind in data.index:  # Перебор строк
         elif column == 'Долгота':
             fields_geom['lon'] = float(data[column][ind])
 
-    # Преобразование географических координат в систему координат NextGIS WEB
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857")
     sm = transformer.transform(fields_geom['lat'], fields_geom['lon'])
     geom = f'POINT({str(sm[0])} {str(sm[1])})'
+    features.append({'fields': fields_dict, 'geom': geom})
 
-    result = nextgis.ngw_post_feature(resource_id=91, fields_values=fields_dict, geom=geom)
-    print(fields_dict)
-    if result:
-        type = fields_dict.get('Вид_ВИ', None)
-        num = fields_dict.get('Номер', None)
-        specification = fields_dict.get('Характеристика', None)
-        name = type
-        if num: name += f'-{num}'
-        if specification: name += f' ({specification})'
+# Создание водоисточников пакетами, затем - подпись, описание и копия ИД для созданных
+created = nextgis.ngw_write_features(resource_id=91, features=features)
+updates = []
+for result in created:
+    if not result.ok:
+        print(f'Строка {result.index}: водоисточник не создан ({result.error})')
+        continue
+    fields_dict = features[result.index]['fields']
+    type = fields_dict.get('Вид_ВИ', None)
+    num = fields_dict.get('Номер', None)
+    specification = fields_dict.get('Характеристика', None)
+    name = type
+    if num: name += f'-{num}'
+    if specification: name += f' ({specification})'
 
-        description = templates.description_water_intake(fid=result,
-                                                         locality=fields_dict.get('Поселение', None),
-                                                         street=fields_dict.get('Улица', None),
-                                                         building=fields_dict.get('Дом', None),
-                                                         landmark=fields_dict.get('Ориентир', None),
-                                                         specification=fields_dict.get('Исполнение', None),
-                                                         flow_rate_water=fields_dict.get('Водоотдача_сети', None),
-                                                         google_folder=fields_dict.get('ИД_папки_Гугл_диск', None),
-                                                         google_street=fields_dict.get('Ссылка_Гугл_улицы', None),
-                                                         fid_wi_company=fields_dict.get('ИД_хоз_субъекта', None))
+    description = templates.description_water_intake(fid=result.feature_id,
+                                                     locality=fields_dict.get('Поселение', None),
+                                                     street=fields_dict.get('Улица', None),
+                                                     building=fields_dict.get('Дом', None),
+                                                     landmark=fields_dict.get('Ориентир', None),
+                                                     specification=fields_dict.get('Исполнение', None),
+                                                     flow_rate_water=fields_dict.get('Водоотдача_сети', None),
+                                                     google_folder=fields_dict.get('ИД_папки_Гугл_диск', None),
+                                                     google_street=fields_dict.get('Ссылка_Гугл_улицы', None),
+                                                     fid_wi_company=fields_dict.get('ИД_хоз_субъекта', None))
 
-        if description:
-            fields_values = {'name': name, 'description': description, 'ИД': result}
-            nextgis.ngw_put_feature(resource_id=91, feature_id=result, fields_values=fields_values,
-                                    description=description)
+    if description:
+        updates.append({'id': result.feature_id,
+                        'fields': {'name': name, 'description': description, 'ИД': result.feature_id},
+                        'extensions': {'description': description}})
 
-    fields_dict.clear()
-    fields_geom.clear()
+updated = nextgis.ngw_write_features(resource_id=91, features=updates)
+print(f'Создано: {sum(result.ok for result in created)} из {len(features)}, '
+      f'описания: {sum(result.ok for result in updated)} из {len(updates)}')
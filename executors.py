@@ -0,0 +1,145 @@
+""" Отдельные пулы потоков для блокирующих вызовов
+Вместо общего пула по умолчанию (loop.run_in_executor(None, ...)) каждый внешний сервис получает
+собственный пул ограниченного размера с ограниченной очередью:
+ - ngw   - запросы к NextGIS WEB (короткие, нужны интерактивным шагам)
+ - drive - обращения к Google Drive (долгие загрузки снимков)
+ - cpu   - вычисления (преобразование координат и т.п.)
+ - hedge - страхующие повторы чтений NextGIS WEB (вызов из потока - submit)
+ - export - выгрузка проверок (/export): одна одновременно, страницы читаются через ngw_fanout
+ - ngw_fanout - параллельные запросы к NextGIS WEB внутри задачи пула ngw (пакетная запись,
+   проверка ключей, страницы выгрузки) - вместо собственного ThreadPoolExecutor в каждой задаче
+Если пул и его очередь заполнены, вызов сразу завершается исключением ExecutorSaturated,
+а не ждёт неограниченно. Время ожидания в очереди пишется в метрики executor.<имя>.queue_wait_ms,
+количество вызовов и ошибок - в executor.<имя>.calls и executor.<имя>.errors.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from loguru import logger
+
+import metrics
+from config import Config
+
+
+class ExecutorSaturated(Exception):
+    """ Пул потоков и его очередь заполнены """
+
+
+class BoundedExecutor:
+    """ Пул потоков с ограниченной очередью и учётом ожидания """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{name}-')
+        self._pending = 0
+        # Счётчик задач изменяется и из цикла asyncio (run), и из потоков других пулов (submit)
+        self._lock = threading.Lock()
+        metrics.gauge(f'executor.{name}.active', lambda: self.active)
+        metrics.gauge(f'executor.{name}.queue', lambda: self.queue_depth)
+
+    @property
+    def active(self) -> int:
+        return min(self._pending, self.max_workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.max_workers)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                metrics.inc(f'executor.{self.name}.rejected')
+                logger.warning(f'Пул {self.name} перегружен: {self._pending} задач')
+                raise ExecutorSaturated(f'Сервис {self.name} перегружен, повторите попытку позже')
+            self._pending += 1
+        metrics.inc(f'executor.{self.name}.calls')
+
+    def _release(self, failed: bool = False):
+        with self._lock:
+            self._pending -= 1
+        if failed:
+            metrics.inc(f'executor.{self.name}.errors')
+
+    def _wrap(self, func, *args, **kwargs):
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def call():
+            metrics.observe(f'executor.{self.name}.queue_wait_ms', (time.perf_counter() - submitted) * 1000)
+            return context.run(func, *args, **kwargs)
+        return call
+
+    async def run(self, func, *args, **kwargs):
+        """ Выполнить блокирующую функцию в пуле. Контекст (трассировка) передаётся в поток """
+        self._acquire()
+        failed = False
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, self._wrap(func, *args, **kwargs))
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._release(failed)
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """ То же из потока (например, параллельные запросы внутри задачи пула ngw): Future без ожидания.
+        Пул и очередь заполнены - ExecutorSaturated """
+        self._acquire()
+        try:
+            future = self._pool.submit(self._wrap(func, *args, **kwargs))
+        except BaseException:
+            self._release(True)
+            raise
+        future.add_done_callback(lambda done: self._release(done.cancelled() or done.exception() is not None))
+        return future
+
+    def spawn(self, func, *args, **kwargs) -> Future:
+        """ Как submit, но при заполненном пуле функция выполняется сразу в текущем потоке:
+        параллельность снижается, а вызов не завершается ошибкой """
+        try:
+            return self.submit(func, *args, **kwargs)
+        except ExecutorSaturated:
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+
+    def map(self, func, *iterables) -> list:
+        """ func для каждого набора аргументов параллельно (spawn), результаты по порядку """
+        futures = [self.spawn(func, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+ngw = BoundedExecutor('ngw', Config.executor_ngw_workers, Config.executor_ngw_queue)
+drive = BoundedExecutor('drive', Config.executor_drive_workers, Config.executor_drive_queue)
+cpu = BoundedExecutor('cpu', Config.executor_cpu_workers, Config.executor_cpu_queue)
+# Страхующие повторы чтений NextGIS WEB (вызываются из задач пула ngw, поэтому отдельный пул)
+hedge = BoundedExecutor('hedge', Config.executor_hedge_workers, Config.executor_hedge_queue)
+# Параллельные запросы из задач пула ngw (отдельный пул - задача не ждёт потоков своего же пула)
+ngw_fanout = BoundedExecutor('ngw_fanout', Config.executor_ngw_fanout_workers, Config.executor_ngw_fanout_queue)
+export = BoundedExecutor('export', Config.executor_export_workers, Config.executor_export_queue)
+
+
+async def shutdown_all(timeout: float) -> bool:
+    """ Остановка пулов при завершении бота: задачи из очереди отменяются, выполняющиеся - дожидаются
+    не дольше timeout секунд. False - не все задачи успели завершиться """
+    pools = (ngw, drive, cpu, hedge, ngw_fanout, export)
+    for pool in pools:
+        pool._pool.shutdown(wait=False, cancel_futures=True)
+    try:
+        await asyncio.wait_for(asyncio.gather(*(asyncio.to_thread(pool.shutdown, True) for pool in pools)), timeout)
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(f'Пулы потоков не завершились за {timeout:.0f} с: '
+                       f'{", ".join(f"{pool.name}={pool._pending}" for pool in pools)}')
+        return False
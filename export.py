@@ -0,0 +1,211 @@
+""" Выгрузка проверок водоисточников (ресурс 90) с атрибутами водоисточников (ресурс 91)
+Проверки читаются из NextGIS WEB постранично (несколько следующих страниц - параллельно) и сразу
+пишутся в файл - объём памяти не зависит от периода. Атрибуты водоисточника и наименование
+хоз.субъекта берутся из локальных справочников (снимок слоя snapshot.py и один запрос списка
+субъектов), а не запросом на каждую строку.
+Форматы: xlsx (openpyxl, режим write-only), csv (UTF-8 с BOM - открывается в Excel), geojson.
+
+    python export.py --from 2025-08-01 --to 2025-09-01 --format xlsx --output checkups_2025-08.xlsx
+
+В боте - команда администратора /export (handlers/admin_handlers.py).
+"""
+import argparse
+import csv
+import datetime
+import json
+import re
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+from loguru import logger
+
+import executors
+import models
+import nextgis
+import snapshot
+from config import Config
+from models import Checkup, WaterSource
+
+FORMATS = ('xlsx', 'csv', 'geojson')
+COLUMNS = ['ИД проверки', 'Дата и время', 'ИД водоисточника', 'Наименование', 'Поселение', 'Улица', 'Дом',
+           'Ориентир', 'Хоз. субъект', 'Вид контроля', 'Наличие воды', 'Установка ПА', 'Подъезд ПА',
+           'Указатель', 'Температура', 'Примечание']
+_POINT = re.compile(r'POINT\s*\(\s*([-\d.eE]+)\s+([-\d.eE]+)\s*\)')
+
+
+def iter_checkups(date_from: datetime.date, date_to: datetime.date, geom: bool = False,
+                  page: int = None, prefetch: int = None) -> Iterator[Checkup]:
+    """ Проверки за период [date_from, date_to) постранично. Следующие страницы (до prefetch штук)
+    запрашиваются параллельно в пуле executors.ngw_fanout, пока пишется текущая -
+    в памяти не больше prefetch + 1 страниц. Неполученная страница - исключение RuntimeError
+    (пустой ответ означал бы последнюю страницу и неполную выгрузку) """
+    page = page or Config.export_page
+    prefetch = prefetch or Config.export_prefetch
+    query = [f'fld_Дата_время__ge={date_from.isoformat()}', f'fld_Дата_время__lt={date_to.isoformat()}']
+
+    def fetch(offset: int) -> list:
+        # Порядок по ИД: без него страницы limit/offset, читаемые параллельно, могут пропускать
+        # и повторять проверки
+        content = nextgis.fetch_features(Config.ngw_resource_wi_checkup, fld_filter=query, order_by=['id'],
+                                         limit=page, offset=offset, geom='yes' if geom else 'no',
+                                         extensions='none')
+        if content is None:
+            raise RuntimeError(f'проверки не получены из NextGIS WEB (страница с {offset})')
+        return models.decode(Checkup, content, many=True)
+
+    pending = deque(executors.ngw_fanout.spawn(fetch, number * page) for number in range(prefetch))
+    next_offset = prefetch * page
+    try:
+        while pending:
+            chunk = pending.popleft().result()
+            yield from chunk
+            if len(chunk) < page:
+                return
+            pending.append(executors.ngw_fanout.spawn(fetch, next_offset))
+            next_offset += page
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def load_organizations() -> dict:
+    return {item.id: item.fields.name for item in nextgis.get_organizations(geom='no', extensions='none')}
+
+
+def load_sources() -> snapshot.Snapshot:
+    """ Справочник водоисточников: действующий снимок, снимок с диска или (если его нет) полное чтение слоя """
+    if len(snapshot.layer):
+        return snapshot.layer
+    layer = snapshot.Snapshot.load(Config.snapshot_dir) if Config.snapshot_dir else None
+    return layer if layer is not None else snapshot.Snapshot.from_sources(snapshot.fetch_all())
+
+
+def row(checkup: Checkup, source: Optional[WaterSource], organizations: dict) -> list:
+    fields = checkup.fields
+    when = fields.date_time
+    return [
+        checkup.id,
+        datetime.datetime(when.year, when.month, when.day, when.hour, when.minute, when.second) if when else None,
+        fields.source_id,
+        source.fields.name if source else None,
+        source.fields.locality if source else None,
+        source.fields.street if source else None,
+        source.fields.building if source else None,
+        source.fields.landmark if source else None,
+        organizations.get(source.fields.company_id) if source else None,
+        fields.checkout, fields.water, fields.workable, fields.entrance, fields.plate,
+        fields.temperature, fields.note,
+    ]
+
+
+# --- Запись ---
+class CsvWriter:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file, delimiter=';')
+        self.writer.writerow(COLUMNS)
+
+    def write(self, values: list, geom: Optional[str]):
+        self.writer.writerow(['' if value is None else value for value in values])
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxWriter:
+    def __init__(self, path: str):
+        from openpyxl import Workbook
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Проверки')
+        self.sheet.append(COLUMNS)
+
+    def write(self, values: list, geom: Optional[str]):
+        self.sheet.append(values)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class GeoJsonWriter:
+    """ FeatureCollection пишется по одному объекту; координаты переводятся из EPSG:3857 в WGS 84 """
+
+    def __init__(self, path: str):
+        from pyproj import Transformer
+        self.transformer = Transformer.from_crs('EPSG:3857', 'EPSG:4326', always_xy=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('{"type": "FeatureCollection", "features": [\n')
+        self.count = 0
+
+    def write(self, values: list, geom: Optional[str]):
+        geometry = None
+        match = _POINT.search(geom or '')
+        if match:
+            lon, lat = self.transformer.transform(float(match.group(1)), float(match.group(2)))
+            geometry = {'type': 'Point', 'coordinates': [round(lon, 7), round(lat, 7)]}
+        properties = {name: value.isoformat() if isinstance(value, datetime.datetime) else value
+                      for name, value in zip(COLUMNS, values)}
+        feature = {'type': 'Feature', 'id': values[0], 'geometry': geometry, 'properties': properties}
+        self.file.write((',\n' if self.count else '') + json.dumps(feature, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        self.file.write('\n]}\n')
+        self.file.close()
+
+
+_WRITERS = {'xlsx': XlsxWriter, 'csv': CsvWriter, 'geojson': GeoJsonWriter}
+
+
+def export(path: str, fmt: str, date_from: datetime.date, date_to: datetime.date) -> int:
+    """ Выгрузить проверки за период [date_from, date_to) в файл, вернуть количество строк.
+    Блокирующая функция: в боте выполняется в отдельном пуле executors.export, чтобы долгая выгрузка
+    не занимала поток пула ngw, нужный интерактивным шагам опроса """
+    started = time.perf_counter()
+    sources = load_sources()
+    organizations = load_organizations()
+    writer = _WRITERS[fmt](path)
+    count = 0
+    try:
+        for checkup in iter_checkups(date_from, date_to, geom=fmt == 'geojson'):
+            source = sources.get(checkup.fields.source_id) if checkup.fields.source_id is not None else None
+            writer.write(row(checkup, source, organizations), checkup.geom or (source.geom if source else None))
+            count += 1
+    finally:
+        writer.close()
+    logger.info(f'Выгрузка {date_from}..{date_to} в {path}: {count} проверок, '
+                f'{time.perf_counter() - started:.1f} с')
+    return count
+
+
+def parse_period(args: list, today: datetime.date = None) -> tuple:
+    """ Период выгрузки из аргументов команды: 'ГГГГ-ММ' (месяц), 'ГГГГ-ММ-ДД ГГГГ-ММ-ДД' (обе даты
+    включительно) или ничего (прошлый месяц). Возвращает (date_from, date_to) с date_to не включительно """
+    dates = [datetime.date.fromisoformat(arg) for arg in args if re.fullmatch(r'\d{4}-\d{2}-\d{2}', arg)]
+    months = [arg for arg in args if re.fullmatch(r'\d{4}-\d{2}', arg)]
+    if dates:
+        date_from = dates[0]
+        date_to = (dates[1] if len(dates) > 1 else dates[0]) + datetime.timedelta(days=1)
+        return date_from, date_to
+    if months:
+        date_from = datetime.date.fromisoformat(f'{months[0]}-01')
+    else:
+        first = (today or datetime.date.today()).replace(day=1)
+        date_from = (first - datetime.timedelta(days=1)).replace(day=1)
+    date_to = (date_from + datetime.timedelta(days=32)).replace(day=1)
+    return date_from, date_to
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Выгрузка проверок водоисточников')
+    parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, required=True,
+                        help='Начало периода (ГГГГ-ММ-ДД)')
+    parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat, required=True,
+                        help='Конец периода, не включительно (ГГГГ-ММ-ДД)')
+    parser.add_argument('--format', choices=FORMATS, default='xlsx')
+    parser.add_argument('--output', help='Файл выгрузки (по умолчанию checkups_<начало>_<конец>.<формат>)')
+    args = parser.parse_args()
+
+    output = args.output or f'checkups_{args.date_from}_{args.date_to}.{args.format}'
+    print(f'{export(output, args.format, args.date_from, args.date_to)} проверок -> {output}')
@@ -0,0 +1,90 @@
+""" Поддельный Google Drive для автономного тестирования и нагрузочных замеров
+Упрощённое подмножество Drive API v2, достаточное для модуля pydrive (режим Config.drive_api_url):
+    POST /drive/v2/files                 - создать папку/файл по метаданным (title, parents, mimeType)
+    GET  /drive/v2/files/{id}            - метаданные (id, title, parents, mimeType, labels.trashed, fileSize)
+    PUT  /drive/v2/files/{id}            - изменить метаданные (для отсутствующего ИД - 404)
+    POST /upload/drive/v2/files?title=&parent=&mimeType=  - загрузить содержимое (тело запроса)
+    POST /drive/v2/files/{id}/trash      - переместить в корзину (для сценариев с удалёнными папками)
+Содержимое файлов не хранится - учитывается только размер.
+"""
+import secrets
+
+from aiohttp import web
+
+from fakes import knobs
+
+# Ключ приложения: загруженные файлы и папки по ИД
+FILES = web.AppKey('files', dict)
+
+
+def _new_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+async def create_file(request: web.Request):
+    metadata = await request.json()
+    file_id = _new_id()
+    request.app[FILES][file_id] = {
+        'id': file_id,
+        'title': metadata.get('title', 'Не указано'),
+        'parents': metadata.get('parents', []),
+        'mimeType': metadata.get('mimeType'),
+        'labels': {'trashed': False},
+        'fileSize': '0',
+    }
+    return web.json_response(request.app[FILES][file_id])
+
+
+async def get_file(request: web.Request):
+    item = request.app[FILES].get(request.match_info['file_id'])
+    if item is None:
+        return web.json_response({'error': {'code': 404, 'message': 'File not found'}}, status=404)
+    return web.json_response(item)
+
+
+async def update_file(request: web.Request):
+    item = request.app[FILES].get(request.match_info['file_id'])
+    if item is None:
+        return web.json_response({'error': {'code': 404, 'message': 'File not found'}}, status=404)
+    metadata = await request.json()
+    for key in ('title', 'parents', 'mimeType'):
+        if key in metadata:
+            item[key] = metadata[key]
+    return web.json_response(item)
+
+
+async def trash_file(request: web.Request):
+    item = request.app[FILES].get(request.match_info['file_id'])
+    if item is None:
+        return web.json_response({'error': {'code': 404, 'message': 'File not found'}}, status=404)
+    item['labels']['trashed'] = True
+    return web.json_response(item)
+
+
+async def upload_file(request: web.Request):
+    size = 0
+    async for chunk in request.content.iter_chunked(64 * 1024):
+        size += len(chunk)
+    file_id = _new_id()
+    request.app[FILES][file_id] = {
+        'id': file_id,
+        'title': request.query.get('title', 'Не указано'),
+        'parents': [{'id': request.query['parent']}] if request.query.get('parent') else [],
+        'mimeType': request.query.get('mimeType', 'application/octet-stream'),
+        'labels': {'trashed': False},
+        'fileSize': str(size),
+    }
+    request.app[knobs.STATS]['uploaded_bytes'] = request.app[knobs.STATS].get('uploaded_bytes', 0) + size
+    return web.json_response(request.app[FILES][file_id])
+
+
+def create_app(settings: knobs.Knobs = None) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app[FILES] = {}
+    knobs.setup(app, settings, error_body=lambda status: {'error': {'code': status, 'message': 'Injected error'}})
+    app.router.add_post('/drive/v2/files', create_file)
+    app.router.add_get('/drive/v2/files/{file_id}', get_file)
+    app.router.add_put('/drive/v2/files/{file_id}', update_file)
+    app.router.add_post('/drive/v2/files/{file_id}/trash', trash_file)
+    app.router.add_post('/upload/drive/v2/files', upload_file)
+    return app
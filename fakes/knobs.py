@@ -0,0 +1,77 @@
+""" Общие настройки поддельных сервисов: задержка, ошибки, пропускная способность
+Настройки можно менять на ходу запросом POST /_knobs с JSON {"latency": 0.2, "error_rate": 0.1, ...},
+текущие значения и счётчики - GET /_knobs.
+"""
+import asyncio
+import random
+from dataclasses import asdict, dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class Knobs:
+    latency: float = 0.0        # Базовая задержка ответа, секунд
+    jitter: float = 0.0         # Случайная добавка к задержке (равномерно от 0 до jitter), секунд
+    error_rate: float = 0.0     # Доля запросов, завершающихся ошибкой (0..1)
+    error_status: int = 500     # HTTP статус ошибки
+    max_concurrency: int = 0    # Одновременно обслуживаемых запросов (0 - без ограничения)
+
+    def update(self, values: dict):
+        for key, value in values.items():
+            if hasattr(self, key):
+                setattr(self, key, type(getattr(self, key))(value))
+
+
+# Ключи приложения: настройки, счётчики запросов, ограничитель одновременных запросов
+KNOBS = web.AppKey('knobs', Knobs)
+STATS = web.AppKey('stats', dict)
+LIMITER = web.AppKey('limiter', dict)
+
+
+def setup(app: web.Application, knobs: Knobs = None, error_body=None):
+    """ Подключить к приложению настройки и промежуточный обработчик, который их применяет.
+    error_body(status) - тело ответа об ошибке в формате сервиса """
+    app[KNOBS] = knobs or Knobs()
+    app[STATS] = {'requests': 0, 'errors': 0, 'in_flight': 0}
+    app[LIMITER] = {'semaphore': None, 'size': 0}
+
+    @web.middleware
+    async def apply_knobs(request: web.Request, handler):
+        if request.path == '/_knobs':
+            return await handler(request)
+        current = request.app[KNOBS]
+        stats = request.app[STATS]
+        stats['requests'] += 1
+        limiter = request.app[LIMITER]
+        if current.max_concurrency and limiter['size'] != current.max_concurrency:
+            limiter.update(semaphore=asyncio.Semaphore(current.max_concurrency), size=current.max_concurrency)
+        semaphore = limiter['semaphore'] if current.max_concurrency else None
+        if semaphore:
+            await semaphore.acquire()
+        stats['in_flight'] += 1
+        try:
+            delay = current.latency + random.uniform(0, current.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if current.error_rate and random.random() < current.error_rate:
+                stats['errors'] += 1
+                body = error_body(current.error_status) if error_body else {'error': 'injected'}
+                return web.json_response(body, status=current.error_status)
+            return await handler(request)
+        finally:
+            stats['in_flight'] -= 1
+            if semaphore:
+                semaphore.release()
+
+    async def get_knobs(request: web.Request):
+        return web.json_response({'knobs': asdict(request.app[KNOBS]), 'stats': request.app[STATS]})
+
+    async def post_knobs(request: web.Request):
+        request.app[KNOBS].update(await request.json())
+        return await get_knobs(request)
+
+    app.middlewares.append(apply_knobs)
+    app.router.add_get('/_knobs', get_knobs)
+    app.router.add_post('/_knobs', post_knobs)
+    return app
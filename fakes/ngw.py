@@ -0,0 +1,210 @@
+""" Поддельный NextGIS WEB для автономного тестирования и нагрузочных замеров
+Реализует используемую ботом часть REST API ресурсов-таблиц:
+    GET   /api/resource/{id}/feature/{fid}   - объект
+    GET   /api/resource/{id}/feature/        - набор объектов (limit, offset, order_by, fields, fld_*, geom)
+    POST  /api/resource/{id}/feature/        - создание объекта
+    PUT   /api/resource/{id}/feature/{fid}   - изменение объекта
+    PATCH /api/resource/{id}/feature/        - изменение/создание набора объектов
+    DELETE /api/resource/{id}/feature/{fid}  - удаление объекта
+Данные хранятся в памяти и генерируются детерминированно (seed) для водоисточников (91),
+проверок (90, изначально пусто) и хозяйствующих субъектов (88).
+"""
+import random
+
+from aiohttp import web
+
+from config import Config
+from fakes import knobs
+
+SETTLEMENTS = ['Сургут', 'Белый Яр', 'Лянтор', 'Фёдоровский', 'Барсово', 'Солнечный', 'Нижнесортымский']
+STREETS = ['Ленина', 'Мира', 'Энергетиков', 'Магистральная', 'Нефтяников', 'Центральная', 'Школьная',
+           'Набережная', 'Молодёжная', 'Строителей', 'Таёжная', 'Комсомольская']
+LANDMARKS = ['у ворот', 'напротив подъезда 2', 'у котельной', 'за магазином', 'у перекрёстка', 'во дворе']
+SPECIFICATIONS = ['подземный', 'наземный']
+
+# Ключ приложения: объекты по ИД ресурса
+RESOURCES = web.AppKey('resources', dict)
+
+
+def make_organizations(count: int = 20) -> dict:
+    return {fid: {'id': fid, 'geom': None, 'extensions': {'description': None, 'attachment': None},
+                  'fields': {'Хоз_субъект': f'ООО "Водоканал-{fid}"'}}
+            for fid in range(1, count + 1)}
+
+
+def make_water_sources(count: int = 2000, organizations: int = 20, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    features = {}
+    for fid in range(1, count + 1):
+        kind = rnd.choice(['ПГ', 'ПГ', 'ПГ', 'ПВ', 'ПК'])
+        features[fid] = {
+            'id': fid,
+            'geom': f'POINT({8171735.6 + rnd.uniform(-40000, 40000):.6f} {8680155.0 + rnd.uniform(-40000, 40000):.6f})',
+            'extensions': {'description': None, 'attachment': None},
+            'fields': {
+                'ИД': fid,
+                'name': f'{kind}-{fid}',
+                'Вид_ВИ': kind,
+                'Номер': str(fid),
+                'Поселение': rnd.choice(SETTLEMENTS),
+                'Улица': rnd.choice(STREETS),
+                'Дом': str(rnd.randint(1, 120)),
+                'Ориентир': rnd.choice(LANDMARKS),
+                'Исполнение': rnd.choice(SPECIFICATIONS),
+                'Водоотдача_сети': f'{rnd.randint(10, 80)} л/с',
+                'ИД_папки_Гугл_диск': None,
+                'Ссылка_Гугл_улицы': None,
+                'ИД_хоз_субъекта': rnd.randint(1, organizations),
+                'description': None,
+            },
+        }
+    return features
+
+
+def _comparable(value):
+    """ Значение поля для сравнения в фильтрах: дата/время объектом JSON -> ISO строка """
+    if isinstance(value, dict) and 'year' in value:
+        return (f"{int(value['year']):04d}-{int(value.get('month', 1)):02d}-{int(value.get('day', 1)):02d}"
+                f"T{int(value.get('hour', 0)):02d}:{int(value.get('minute', 0)):02d}:{int(value.get('second', 0)):02d}")
+    return value
+
+
+def _match(feature: dict, name: str, operation: str, expected: str) -> bool:
+    value = feature['id'] if name == 'id' and 'id' not in feature['fields'] else feature['fields'].get(name)
+    value = _comparable(value)
+    if expected == 'Null':
+        return (value is None) == (operation == 'eq') if operation in ('eq', 'ne') else False
+    if value is None:
+        return operation == 'ne'
+    if operation in ('like', 'ilike'):
+        pattern = expected.replace('%', '')
+        text, pattern = (str(value).lower(), pattern.lower()) if operation == 'ilike' else (str(value), pattern)
+        if expected.startswith('%') and expected.endswith('%'):
+            return pattern in text
+        if expected.endswith('%'):
+            return text.startswith(pattern)
+        if expected.startswith('%'):
+            return text.endswith(pattern)
+        return text == pattern
+    if isinstance(value, (int, float)):
+        try:
+            expected = type(value)(expected)
+        except ValueError:
+            value = str(value)
+    else:
+        value = str(value)
+    return {'eq': value == expected, 'ne': value != expected, 'gt': value > expected,
+            'lt': value < expected, 'ge': value >= expected, 'le': value <= expected}.get(operation, False)
+
+
+def _present(feature: dict, query) -> dict:
+    result = {'id': feature['id'], 'fields': dict(feature['fields']),
+              'extensions': feature['extensions']}
+    if query.get('fields'):
+        keep = query['fields'].split(',')
+        result['fields'] = {key: value for key, value in result['fields'].items() if key in keep}
+    if query.get('geom', 'yes') != 'no':
+        result['geom'] = feature['geom']
+    return result
+
+
+def _resource(request: web.Request) -> dict:
+    resource_id = int(request.match_info['resource_id'])
+    if resource_id not in request.app[RESOURCES]:
+        raise web.HTTPNotFound(text='{"message": "Resource not found"}', content_type='application/json')
+    return request.app[RESOURCES][resource_id]
+
+
+async def get_feature(request: web.Request):
+    features = _resource(request)
+    feature = features.get(int(request.match_info['feature_id']))
+    if feature is None:
+        return web.json_response({'message': 'Feature not found'}, status=404)
+    return web.json_response(_present(feature, request.query))
+
+
+async def get_features(request: web.Request):
+    features = list(_resource(request).values())
+    query = request.query
+    for key, expected in query.items():
+        if key.startswith('fld_'):
+            name, _, operation = key[4:].partition('__')
+            features = [item for item in features if _match(item, name, operation or 'eq', expected)]
+    if query.get('order_by'):
+        for field in reversed(query['order_by'].split(',')):
+            reverse = field.startswith('-')
+            field = field.lstrip('-')
+            if field == 'id':
+                # ИД объекта (а не поле слоя с таким именем)
+                features.sort(key=lambda item: item['id'], reverse=reverse)
+            else:
+                features.sort(key=lambda item: (item['fields'].get(field) is None, str(item['fields'].get(field))),
+                              reverse=reverse)
+    offset = int(query.get('offset', 0))
+    limit = int(query['limit']) if query.get('limit') else None
+    features = features[offset:offset + limit if limit is not None else None]
+    return web.json_response([_present(item, query) for item in features])
+
+
+def _store(request: web.Request, features: dict, item: dict, feature_id: int = None) -> int:
+    if feature_id is None:
+        feature_id = max(features, default=0) + 1
+        features[feature_id] = {'id': feature_id, 'geom': None, 'fields': {},
+                                'extensions': {'description': None, 'attachment': None}}
+    feature = features[feature_id]
+    feature['fields'].update(item.get('fields') or {})
+    if item.get('geom'):
+        feature['geom'] = item['geom']
+    if (item.get('extensions') or {}).get('description') is not None:
+        feature['extensions']['description'] = item['extensions']['description']
+    return feature_id
+
+
+async def post_feature(request: web.Request):
+    features = _resource(request)
+    return web.json_response({'id': _store(request, features, await request.json())})
+
+
+async def put_feature(request: web.Request):
+    features = _resource(request)
+    feature_id = int(request.match_info['feature_id'])
+    if feature_id not in features:
+        return web.json_response({'message': 'Feature not found'}, status=404)
+    return web.json_response({'id': _store(request, features, await request.json(), feature_id)})
+
+
+async def patch_features(request: web.Request):
+    features = _resource(request)
+    result = []
+    for item in await request.json():
+        feature_id = item.get('id')
+        if feature_id is not None and int(feature_id) not in features:
+            return web.json_response({'message': f'Feature {feature_id} not found'}, status=404)
+        result.append({'id': _store(request, features, item, int(feature_id) if feature_id is not None else None)})
+    return web.json_response(result)
+
+
+async def delete_feature(request: web.Request):
+    features = _resource(request)
+    if features.pop(int(request.match_info['feature_id']), None) is None:
+        return web.json_response({'message': 'Feature not found'}, status=404)
+    return web.json_response({})
+
+
+def create_app(sources: int = 2000, organizations: int = 20, seed: int = 1,
+               settings: knobs.Knobs = None) -> web.Application:
+    app = web.Application(client_max_size=32 * 1024 ** 2)
+    app[RESOURCES] = {
+        Config.ngw_resource_wi_points: make_water_sources(sources, organizations, seed),
+        Config.ngw_resource_wi_checkup: {},
+        Config.ngw_resource_organization: make_organizations(organizations),
+    }
+    knobs.setup(app, settings, error_body=lambda status: {'message': 'Injected error', 'status_code': status})
+    base = '/api/resource/{resource_id:\\d+}/feature'
+    app.router.add_get(base + '/{feature_id:\\d+}', get_feature)
+    app.router.add_put(base + '/{feature_id:\\d+}', put_feature)
+    app.router.add_delete(base + '/{feature_id:\\d+}', delete_feature)
+    app.router.add_get(base + '/', get_features)
+    app.router.add_post(base + '/', post_feature)
+    app.router.add_patch(base + '/', patch_features)
+    return app
@@ -0,0 +1,87 @@
+""" Запуск поддельных NextGIS WEB, Google Drive и Telegram на локальном компьютере
+
+    python -m fakes.run --latency 0.05 --jitter 0.1 --error-rate 0.01
+
+Затем бот запускается с переменными окружения, которые выводит команда:
+    NGW_HOST=http://127.0.0.1:8081 DRIVE_API_URL=http://127.0.0.1:8082 TG_API_SERVER=http://127.0.0.1:8083 \
+    BOT_TOKEN=123456789:fake python main.py
+Настройки задержек и ошибок можно менять на ходу: POST http://127.0.0.1:<порт>/_knobs
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+
+from aiohttp import web
+
+from fakes import drive, ngw, telegram
+from fakes.knobs import Knobs
+
+
+@dataclass
+class FakeServices:
+    ngw_url: str
+    drive_url: str
+    telegram_url: str
+    runners: list
+
+    @property
+    def environment(self) -> dict:
+        """ Переменные окружения для подключения бота к поддельным сервисам """
+        return {'NGW_HOST': self.ngw_url, 'DRIVE_API_URL': self.drive_url, 'TG_API_SERVER': self.telegram_url}
+
+    async def close(self):
+        for runner in self.runners:
+            await runner.cleanup()
+
+
+async def _serve(app: web.Application, host: str, port: int):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    # Порт 0 - выбирается свободный
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+async def start(host: str = '127.0.0.1', ngw_port: int = 0, drive_port: int = 0, telegram_port: int = 0,
+                ngw_knobs: Knobs = None, drive_knobs: Knobs = None, telegram_knobs: Knobs = None,
+                sources: int = 2000, photo_size: int = 200 * 1024) -> FakeServices:
+    """ Запустить все поддельные сервисы в текущем цикле asyncio """
+    ngw_runner, ngw_url = await _serve(ngw.create_app(sources=sources, settings=ngw_knobs), host, ngw_port)
+    drive_runner, drive_url = await _serve(drive.create_app(settings=drive_knobs), host, drive_port)
+    tg_runner, tg_url = await _serve(telegram.create_app(photo_size=photo_size, settings=telegram_knobs),
+                                     host, telegram_port)
+    return FakeServices(ngw_url, drive_url, tg_url, [ngw_runner, drive_runner, tg_runner])
+
+
+async def main(args):
+    settings = Knobs(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     max_concurrency=args.max_concurrency)
+    services = await start(args.host, args.ngw_port, args.drive_port, args.telegram_port,
+                           ngw_knobs=settings, drive_knobs=Knobs(**vars(settings)),
+                           telegram_knobs=Knobs(**vars(settings)),
+                           sources=args.sources, photo_size=args.photo_size)
+    print(' '.join(f'{key}={value}' for key, value in services.environment.items()))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await services.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Поддельные NextGIS WEB, Google Drive и Telegram')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ngw-port', type=int, default=8081)
+    parser.add_argument('--drive-port', type=int, default=8082)
+    parser.add_argument('--telegram-port', type=int, default=8083)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, секунд')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Случайная добавка к задержке, секунд')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов с ошибкой (0..1)')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='Одновременных запросов (0 - без ограничения)')
+    parser.add_argument('--sources', type=int, default=2000, help='Количество водоисточников')
+    parser.add_argument('--photo-size', type=int, default=200 * 1024, help='Размер снимка, байт')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
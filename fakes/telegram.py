@@ -0,0 +1,119 @@
+""" Поддельный Telegram Bot API и файловый сервер
+Отвечает на методы, которые использует бот (getMe, getChatMember, sendMessage, editMessageText,
+deleteMessage, getFile, sendDocument, answerCallbackQuery, answerInlineQuery, getUpdates ...),
+и отдаёт содержимое "снимков" по адресу /file/bot{token}/{file_path}.
+Бот подключается к нему через Config.tg_api_server (TelegramAPIServer.from_base).
+
+Для работы бота в режиме polling обновления можно поставить в очередь: POST /_updates (JSON Update
+или список Update), getUpdates вернёт их боту. Все участники считаются членами канала.
+"""
+import asyncio
+import time
+
+from aiohttp import web
+
+from fakes import knobs
+
+# Ключи приложения
+COUNTERS = web.AppKey('counters', dict)
+PHOTO_SIZE = web.AppKey('photo_size', int)
+PHOTO = web.AppKey('photo', bytes)
+MEMBER_STATUS = web.AppKey('member_status', str)
+UPDATES = web.AppKey('updates', list)
+UPDATES_EVENT = web.AppKey('updates_event', asyncio.Event)
+
+
+def _chat(chat_id) -> dict:
+    chat_id = int(chat_id)
+    return {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup',
+            **({'first_name': 'Inspector'} if chat_id > 0 else {'title': 'Канал'})}
+
+
+def _message(app: web.Application, chat_id, message_id: int = None, **content) -> dict:
+    if message_id is None:
+        app[COUNTERS]['message_id'] += 1
+        message_id = app[COUNTERS]['message_id']
+    return {'message_id': message_id, 'date': int(time.time()), 'chat': _chat(chat_id), **content}
+
+
+async def _params(request: web.Request) -> dict:
+    if request.content_type == 'application/json':
+        return await request.json()
+    return dict(await request.post())
+
+
+async def call_method(request: web.Request):
+    app = request.app
+    method = request.match_info['method']
+    params = await _params(request)
+    app[knobs.STATS].setdefault('methods', {})
+    app[knobs.STATS]['methods'][method] = app[knobs.STATS]['methods'].get(method, 0) + 1
+
+    if method == 'getMe':
+        result = {'id': 123456789, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_ppv_bot'}
+    elif method == 'getChatMember':
+        result = {'status': app[MEMBER_STATUS],
+                  'user': {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'Inspector'}}
+        if app[MEMBER_STATUS] == 'restricted':
+            result.update(is_member=True, until_date=0)
+    elif method == 'sendMessage':
+        result = _message(app, params['chat_id'], text=params.get('text', ''))
+    elif method == 'editMessageText':
+        result = _message(app, params['chat_id'], int(params['message_id']), text=params.get('text', ''))
+    elif method == 'sendDocument':
+        document = params.get('document')
+        size = len(document.file.read()) if hasattr(document, 'file') else 0
+        result = _message(app, params['chat_id'], document={'file_id': f'doc-{app[COUNTERS]["message_id"]}',
+                                                            'file_unique_id': f'udoc-{app[COUNTERS]["message_id"]}',
+                                                            'file_size': size})
+    elif method == 'getFile':
+        file_id = params['file_id']
+        result = {'file_id': file_id, 'file_unique_id': f'u-{file_id}',
+                  'file_size': app[PHOTO_SIZE], 'file_path': f'photos/{file_id}.jpg'}
+    elif method == 'getUpdates':
+        result = await _get_updates(app, params)
+    else:
+        # deleteMessage, answerCallbackQuery, answerInlineQuery, deleteWebhook и т.п.
+        result = True
+    return web.json_response({'ok': True, 'result': result})
+
+
+async def _get_updates(app: web.Application, params: dict) -> list:
+    offset = int(params.get('offset') or 0)
+    app[UPDATES][:] = [update for update in app[UPDATES] if update['update_id'] >= offset]
+    if not app[UPDATES]:
+        app[UPDATES_EVENT].clear()
+        try:
+            await asyncio.wait_for(app[UPDATES_EVENT].wait(), timeout=min(float(params.get('timeout') or 0), 1.0))
+        except asyncio.TimeoutError:
+            pass
+    return app[UPDATES][:int(params.get('limit') or 100)]
+
+
+async def put_updates(request: web.Request):
+    updates = await request.json()
+    request.app[UPDATES].extend(updates if isinstance(updates, list) else [updates])
+    request.app[UPDATES_EVENT].set()
+    return web.json_response({'queued': len(request.app[UPDATES])})
+
+
+async def get_file(request: web.Request):
+    return web.Response(body=request.app[PHOTO], content_type='image/jpeg')
+
+
+def create_app(photo_size: int = 200 * 1024, member_status: str = 'member',
+               settings: knobs.Knobs = None) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app[COUNTERS] = {'message_id': 0}
+    app[PHOTO_SIZE] = photo_size
+    app[PHOTO] = b'\xff\xd8' + b'\x00' * max(0, photo_size - 4) + b'\xff\xd9'
+    app[MEMBER_STATUS] = member_status
+    app[UPDATES] = []
+    app[UPDATES_EVENT] = asyncio.Event()
+    knobs.setup(app, settings, error_body=lambda status: {'ok': False, 'error_code': status,
+                                                          'description': 'Injected error'})
+    app.router.add_post('/bot{token}/{method}', call_method)
+    app.router.add_get('/bot{token}/{method}', call_method)
+    app.router.add_get('/file/bot{token}/{path:.+}', get_file)
+    app.router.add_post('/_updates', put_updates)
+    return app
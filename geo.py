@@ -0,0 +1,28 @@
+""" Преобразование координат
+pyproj загружается при первом преобразовании, а не при запуске бота. Построение Transformer
+занимает миллисекунды, поэтому он создаётся один раз на поток (объекты pyproj не следует
+использовать из нескольких потоков одновременно) и дальше переиспользуется.
+"""
+import threading
+
+_local = threading.local()
+
+
+def _transformer(source: str, target: str):
+    cache = getattr(_local, 'transformers', None)
+    if cache is None:
+        cache = _local.transformers = {}
+    if (source, target) not in cache:
+        from pyproj import Transformer
+        cache[source, target] = Transformer.from_crs(source, target)
+    return cache[source, target]
+
+
+def wgs84_to_web_mercator(latitude: float, longitude: float) -> tuple:
+    """ Широта/долгота (EPSG:4326) -> x/y в проекции NextGIS WEB (EPSG:3857) """
+    return _transformer('EPSG:4326', 'EPSG:3857').transform(latitude, longitude)
+
+
+def warm_up():
+    """ Построить преобразователь в текущем потоке заранее (прогрев при запуске, см. health.py) """
+    _transformer('EPSG:4326', 'EPSG:3857')
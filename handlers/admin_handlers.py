@@ -0,0 +1,64 @@
+import datetime
+import os
+import tempfile
+
+from aiogram import Bot, F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile, Message
+from loguru import logger
+
+import executors
+import export
+import stats
+from config import Config
+
+# Команды администраторов (Config.tg_admin_ids); сообщения остальных пользователей роутер пропускает дальше
+router = Router()
+router.message.filter(F.from_user.id.in_(Config.tg_admin_ids))
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject, bot: Bot):
+    """Выгрузка проверок: /export [ГГГГ-ММ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [xlsx|csv|geojson]."""
+    args = (command.args or "").split()
+    fmt = next((arg.lower() for arg in args if arg.lower() in export.FORMATS), "xlsx")
+    try:
+        date_from, date_to = export.parse_period(args)
+    except ValueError:
+        await message.answer(
+            "<i>Формат: /export [ГГГГ-ММ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД] [xlsx|csv|geojson]</i>"
+        )
+        return
+
+    last_day = date_to - datetime.timedelta(days=1)
+    msg = await message.answer(f"<i>Выгрузка проверок {date_from} - {last_day} ...</i>")
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, f"checkups_{date_from}_{last_day}.{fmt}")
+            count = await executors.export.run(export.export, path, fmt, date_from, date_to)
+            await bot.send_document(
+                message.chat.id, FSInputFile(path), caption=f"Проверок: {count} ({date_from} - {last_day})"
+            )
+        await msg.delete()
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки проверок: {e!r}")
+        await msg.edit_text(f"<b>Ошибка выгрузки.</b>\n<code>{e}</code>")
+
+
+@router.message(Command("coverage"))
+async def cmd_coverage(message: Message):
+    """Сводка охвата проверками: по поселениям, хоз. субъектам и просроченные водоисточники."""
+    import analytics  # pandas загружается при первом запросе, а не при запуске бота
+
+    try:
+        result = await analytics.coverage()
+        await message.answer(analytics.summary(result))
+    except Exception as e:
+        logger.error(f"Ошибка расчёта охвата: {e!r}")
+        await message.answer(f"<b>Ошибка расчёта охвата.</b>\n<code>{e}</code>")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Сводка производительности: задержки, ошибки сервисов, кэши, пулы потоков, опросы, время работы."""
+    await message.answer(stats.render(stats.collect()))
@@ -4,7 +4,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
 from loguru import logger
 
-from keyboards import get_help_keyboard
+from keyboards import get_help_keyboard, get_search_keyboard
 from lexicon import bot_states
 from states import BotStates
 from handlers import survey_handlers
@@ -44,6 +44,7 @@ async def cmd_start(message: Message, state: FSMContext):
                  f'id - {message.from_user.id}')
 
     current_state = await state.get_state()
+    # /start <ИД> на шаге 1 (выбор в inline-поиске) обрабатывает survey_handlers.process_step_fid_selected
     if current_state is not None:
         state_name = bot_states.get(current_state, "Неизвестное состояние")
         await message.answer(f'<i>Диалог ввода данных уже запущен.\n'
@@ -56,13 +57,10 @@ async def cmd_start(message: Message, state: FSMContext):
         fid = args[1]
         await message.answer(f'🆔 <b>1. Числовой идентификатор:</b> {fid}')
         await state.set_state(BotStates.fid)
-        # Создаем "фейковое" сообщение, чтобы передать его в следующий шаг
-        fake_message = message
-        fake_message.text = fid
-        await survey_handlers.process_step_fid(fake_message, state)
+        await survey_handlers.select_source(message, state, int(fid))
     else:
         await state.set_state(BotStates.fid)
-        await message.answer('🆔 <b>1. Числовой идентификатор </b>')
+        await message.answer('🆔 <b>1. Числовой идентификатор </b>', reply_markup=get_search_keyboard())
 
 
 @router.message()
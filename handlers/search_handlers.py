@@ -0,0 +1,25 @@
+from aiogram import Router
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+
+import search
+from config import Config
+
+router = Router()
+
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    """Inline-поиск водоисточника по наименованию и адресу: выбор результата отправляет /start <ИД>."""
+    query = inline_query.query.strip()
+    sources = search.search(query, limit=Config.search_limit) if len(query) >= 2 else []
+    results = [
+        InlineQueryResultArticle(
+            id=str(source.id),
+            title=f"{source.fields.name} (ИД {source.id})",
+            description=f"{source.address}\n{source.fields.landmark or ''}".strip(),
+            input_message_content=InputTextMessageContent(message_text=f"/start {source.id}"),
+        )
+        for source in sources
+    ]
+    # Результаты персональные: иначе Telegram отдаст их из кэша и не участникам канала
+    await inline_query.answer(results, cache_time=30, is_personal=True)
@@ -1,17 +1,23 @@
 import asyncio
 import datetime
+import os
 import pytz
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State
 from aiogram.types import Message, CallbackQuery
 from loguru import logger
-from pyproj import Transformer
 
+import executors
+import geo
 import nextgis
 import pydrive
+import shutdown
+import snapshot
+import staging
 import templates
+import tracing
 from config import Config
 from keyboards import (
     get_checkout_keyboard,
@@ -19,11 +25,18 @@ from keyboards import (
     get_workable_keyboard,
     get_entrance_keyboard,
     get_plate_keyboard,
+    get_search_keyboard,
 )
 from lexicon import bot_states
+from middlewares import collect_album
+from progress import ProgressReporter
 from states import BotStates
 
 router = Router()
+# Альбом снимков обрабатывается одним вызовом обработчика (шаги 7-9 за одно сообщение)
+router.message.middleware(collect_album)
+
+SAVE_PROMPT = "💾 <b>12. Для сохранения введите /save</b>\n<i>Следующий водоисточник в этом же выезде - /next</i>"
 
 
 # --- Вспомогательные функции ---
@@ -43,34 +56,21 @@ def date_time_now():
         return None
 
 
-# --- Обработчики состояний ---
-@router.message(BotStates.fid)
-async def process_step_fid(message: Message, state: FSMContext):
-    """Шаг 1. Обработка числового идентификатора."""
-    if not message.text.isdigit():
-        await message.answer("⚠ Ожидается числовой идентификатор.")
-        return
-
+async def select_source(message: Message, state: FSMContext, fid: int):
+    """Шаг 1. Поиск водоисточника по ИД и переход к шагу 2."""
     msg_fid = await message.answer("<i>Запрос к NextGIS WEB ...</i>")
 
     try:
-        # Запускаем синхронную функцию в асинхронном контексте
-        loop = asyncio.get_event_loop()
-        feature = await loop.run_in_executor(
-            None,
-            lambda: nextgis.get_feature(
-                Config.ngw_resource_wi_points, message.text, geom="no"
-            ),
-        )
+        # Сначала локальный снимок слоя, затем - запрос в отдельном пуле потоков NextGIS WEB
+        source = snapshot.get_water_source(fid)
+        if source is None:
+            source = await executors.ngw.run(nextgis.get_water_source, fid)
 
-        if feature:
-            name = (
-                f"{feature['fields']['name']}\n{feature['fields']['Поселение']}, "
-                f"{feature['fields']['Улица']}, {feature['fields']['Дом']}"
-            )
+        if source:
+            name = source.title
             await msg_fid.edit_text(f"<i>{name}</i>")
             await state.update_data(
-                fid=int(message.text), name=name, date_time=date_time_now()
+                fid=fid, name=name, date_time=date_time_now()
             )
             await state.set_state(BotStates.position)
             await message.answer("🌏 <b>2. Геопозиция водоисточника</b>")
@@ -80,6 +80,9 @@ async def process_step_fid(message: Message, state: FSMContext):
             )
             await asyncio.sleep(4)
             await msg_fid.delete()
+    except (executors.ExecutorSaturated, nextgis.NGWUnavailable) as e:
+        # Сервис недоступен или перегружен - это не "ИД не найден", шаг можно повторить
+        await msg_fid.edit_text(f"<i>⚠ {e}.\nПопробуйте позже.</i>")
     except Exception as e:
         logger.critical(f"Ошибка на шаге 1 (fid): {e!r}")
         await msg_fid.edit_text(
@@ -90,14 +93,33 @@ async def process_step_fid(message: Message, state: FSMContext):
         await state.clear()
 
 
+# --- Обработчики состояний ---
+@router.message(BotStates.fid, CommandStart())
+async def process_step_fid_selected(message: Message, state: FSMContext, command: CommandObject):
+    """Шаг 1. Водоисточник выбран в inline-поиске: результат поиска отправляет /start <ИД>.
+    Регистрируется до process_step_fid, иначе команда попадает в него как нечисловой ввод."""
+    fid = (command.args or "").strip()
+    if not fid.isdigit():
+        await message.answer("⚠ Ожидается числовой идентификатор.", reply_markup=get_search_keyboard())
+        return
+    await message.answer(f"🆔 <b>1. Числовой идентификатор:</b> {fid}")
+    await select_source(message, state, int(fid))
+
+
+@router.message(BotStates.fid)
+async def process_step_fid(message: Message, state: FSMContext):
+    """Шаг 1. Обработка числового идентификатора."""
+    if not message.text or not message.text.isdigit():
+        await message.answer("⚠ Ожидается числовой идентификатор.", reply_markup=get_search_keyboard())
+        return
+    await select_source(message, state, int(message.text))
+
+
 @router.message(BotStates.position, F.location)
 async def process_step_position(message: Message, state: FSMContext):
     """Шаг 2. Обработка геопозиции."""
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857")
-
-    loop = asyncio.get_event_loop()
-    sm = await loop.run_in_executor(
-        None, transformer.transform, message.location.latitude, message.location.longitude
+    sm = await executors.cpu.run(
+        geo.wgs84_to_web_mercator, message.location.latitude, message.location.longitude
     )
 
     await state.update_data(EPSG_3857=f"POINT({str(sm[0])} {str(sm[1])})")
@@ -153,6 +175,14 @@ async def process_step_entrance(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("📸 💦 <b>7. Узловой снимок</b>")
 
 
+# Шаги снимков по порядку: состояние, поле данных опроса, подсказка к шагу
+SHOT_STEPS = (
+    (BotStates.shot_medium, "shot_medium_id", "📸 💦 <b>7. Узловой снимок</b>"),
+    (BotStates.shot_full, "shot_full_id", "📸 🚒 <b>8. Обзорный снимок</b>"),
+    (BotStates.shot_long, "shot_long_id", "📸 🏘 <b>9. Ориентирующий снимок</b>"),
+)
+
+
 async def process_shot(
     message: Message, state: FSMContext, shot_name: str, next_state: State, next_prompt: str
 ):
@@ -167,25 +197,55 @@ async def process_shot(
         await message.answer(next_prompt)
 
 
+async def process_album(message: Message, state: FSMContext, album: list):
+    """Альбом снимков: снимки по порядку занимают шаги, начиная с текущего; снимок сверх шагов 7-9 -
+    снимок указателя (шаг 11). Скачивание снимков начинается сразу и идёт параллельно."""
+    current_state = await state.get_state()
+    start = next(index for index, (step, _, _) in enumerate(SHOT_STEPS) if step.state == current_state)
+    photos = [item.photo[-1].file_id for item in album if item.photo]
+    slots = [key for _, key, _ in SHOT_STEPS[start:]]
+    assigned = dict(zip(slots, photos))
+    if len(photos) > len(slots):
+        assigned["shot_plate"] = photos[len(slots)]
+    staging.prefetch(message.bot, assigned.values())
+    await state.update_data(assigned)
+
+    filled = start + min(len(photos), len(slots))
+    await message.answer(f"<i>Получено снимков: {len(assigned)}</i>")
+    if filled < len(SHOT_STEPS):
+        next_state, _, next_prompt = SHOT_STEPS[filled]
+        await state.set_state(next_state)
+        await message.answer(next_prompt)
+    else:
+        await state.set_state(BotStates.plate_exist)
+        await message.answer("🔀 <b>10. Наличие указателя</b>", reply_markup=get_plate_keyboard())
+
+
 @router.message(BotStates.shot_medium, F.photo)
-async def process_step_shot_medium(message: Message, state: FSMContext):
-    """Шаг 7. Обработка узлового снимка."""
+async def process_step_shot_medium(message: Message, state: FSMContext, album: list = None):
+    """Шаг 7. Обработка узлового снимка (или альбома снимков шагов 7-9)."""
+    if album:
+        return await process_album(message, state, album)
     await process_shot(
         message, state, "shot_medium_id", BotStates.shot_full, "📸 🚒 <b>8. Обзорный снимок</b>"
     )
 
 
 @router.message(BotStates.shot_full, F.photo)
-async def process_step_shot_full(message: Message, state: FSMContext):
+async def process_step_shot_full(message: Message, state: FSMContext, album: list = None):
     """Шаг 8. Обработка обзорного снимка."""
+    if album:
+        return await process_album(message, state, album)
     await process_shot(
         message, state, "shot_full_id", BotStates.shot_long, "📸 🏘 <b>9. Ориентирующий снимок</b>"
     )
 
 
 @router.message(BotStates.shot_long, F.photo)
-async def process_step_shot_long(message: Message, state: FSMContext):
+async def process_step_shot_long(message: Message, state: FSMContext, album: list = None):
     """Шаг 9. Обработка ориентирующего снимка."""
+    if album:
+        return await process_album(message, state, album)
     await process_shot(message, state, "shot_long_id", BotStates.plate_exist, "")
 
     await message.answer(
@@ -202,151 +262,231 @@ async def process_step_plate_exist(callback: CallbackQuery, state: FSMContext):
     if callback.data == "отсутствует":
         await state.update_data(shot_plate=None)
         await state.set_state(BotStates.save)
-        await callback.message.answer("💾 <b>12. Для сохранения введите /save</b>")
+        await callback.message.answer(SAVE_PROMPT)
+    elif (await state.get_data()).get("shot_plate"):
+        # Снимок указателя уже получен в альбоме
+        await state.set_state(BotStates.save)
+        await callback.message.answer(SAVE_PROMPT)
     else:
         await state.set_state(BotStates.shot_plate)
         await callback.message.answer("📸 🔀 <b>11. Снимок указателя</b>")
 
 
 @router.message(BotStates.shot_plate, F.photo)
-async def process_step_shot_plate(message: Message, state: FSMContext):
-    """Шаг 11. Обработка снимка указателя."""
+async def process_step_shot_plate(message: Message, state: FSMContext, album: list = None):
+    """Шаг 11. Обработка снимка указателя (из альбома - первый снимок)."""
     await process_shot(
-        message, state, "shot_plate", BotStates.save, "💾 <b>12. Для сохранения введите /save</b>"
+        album[0] if album else message, state, "shot_plate", BotStates.save, SAVE_PROMPT
     )
 
 
-@router.message(Command("save"))
-async def cmd_save(message: Message, state: FSMContext, bot: Bot):
-    """Обработчик команды /save."""
-    current_state = await state.get_state()
-    if current_state != "BotStates:save":
-        state_name = bot_states.get(current_state, "Неизвестное состояние")
-        await message.answer(
-            f"<i>Ввод данных ещё не завершен.\nТекущий статус: {state_name}</i>"
-        )
-        return
+# Поля данных опроса одного водоисточника (остальное в данных FSM - очередь пакетного опроса)
+SURVEY_KEYS = ("fid", "name", "date_time", "EPSG_3857", "checkout", "water", "workable", "entrance",
+               "plate_exist", "shot_medium_id", "shot_full_id", "shot_long_id", "shot_plate")
+PHOTO_KEYS = ("shot_medium_id", "shot_full_id", "shot_long_id", "shot_plate")
 
-    data = await state.get_data()
-    msg_text = f"<b>Передача данных...</b>\n<i>ИД: {data['fid']}</i>"
-    msg = await message.answer(msg_text)
 
-    loop = asyncio.get_event_loop()
+def session_items(data: dict) -> list:
+    """ Опросы сессии: очередь (/next) и текущий опрос, если он начат """
+    items = [dict(item) for item in data.get("queue", [])]
+    if data.get("fid") is not None:
+        items.append({key: data.get(key) for key in SURVEY_KEYS})
+    return items
 
-    try:
-        # 1. Запрос к NextGIS WEB
-        msg_text += "\n<i>1. Запрос к NextGIS WEB...</i>"
-        await msg.edit_text(msg_text)
-        json_object = await loop.run_in_executor(
-            None,
-            lambda: nextgis.get_feature(
-                Config.ngw_resource_wi_points, data["fid"], geom="no"
-            ),
-        )
-        folder_id = json_object["fields"]["ИД_папки_Гугл_диск"]
-        folder_name = f"ИД-{data['fid']} {json_object['fields']['name']} {json_object['fields']['Поселение']}, {json_object['fields']['Улица']}, {json_object['fields']['Дом']}"
-
-        # 2. Обращение к папке Google Drive
-        msg_text += "\n<i>2. Обращение к папке Google Drive...</i>"
-        await msg.edit_text(msg_text)
-        google_folder = await loop.run_in_executor(
-            None, pydrive.create_folder, folder_id, folder_name, Config.parent_folder_id
-        )
 
-        if folder_id != google_folder:
-            msg_text += "\n<i>Добавление каталога в NextGIS WEB...</i>"
-            await msg.edit_text(msg_text)
-            description = await loop.run_in_executor(
-                None,
-                templates.description_water_intake,
-                data["fid"],
-                json_object["fields"]["Поселение"],
-                json_object["fields"]["Улица"],
-                json_object["fields"]["Дом"],
-                json_object["fields"]["Ориентир"],
-                json_object["fields"]["Исполнение"],
-                json_object["fields"]["Водоотдача_сети"],
-                google_folder,
-                json_object["fields"]["Ссылка_Гугл_улицы"],
-                json_object["fields"]["ИД_хоз_субъекта"],
-            )
-            fields_values = {
-                "description": description,
-                "ИД_папки_Гугл_диск": google_folder,
-            }
-            await loop.run_in_executor(
-                None,
-                lambda: nextgis.ngw_put_feature(
-                    Config.ngw_resource_wi_points,
-                    data["fid"],
-                    fields_values,
-                    description=description,
-                ),
-            )
+def date_name(item: dict) -> str:
+    return (f"{item['date_time']['year']}-{item['date_time']['month']}-{item['date_time']['day']}"
+            f"_{item['date_time']['hour']}:{item['date_time']['minute']}")
 
-        date_name = (
-            f"{data['date_time']['year']}-{data['date_time']['month']}-{data['date_time']['day']}"
-            f"_{data['date_time']['hour']}:{data['date_time']['minute']}"
-        )
 
-        # 3-6. Передача снимков
-        photo_steps = [
-            ("shot_medium_id", "3. Передача узлового снимка..."),
-            ("shot_full_id", "4. Передача обзорного снимка..."),
-            ("shot_long_id", "5. Передача ориентирующего снимка..."),
-            ("shot_plate", "6. Передача снимка указателя..."),
-        ]
-
-        for i, (shot_key, step_text) in enumerate(photo_steps):
-            if data.get(shot_key):
-                msg_text += f"\n<i>{step_text}</i>"
-                await msg.edit_text(msg_text)
-                file_info = await bot.get_file(data[shot_key])
-                file_url = f"https://api.telegram.org/file/bot{Config.bot_token}/{file_info.file_path}"
-                file_name = f"{i + 1}_{date_name}"
-                await loop.run_in_executor(
-                    None, pydrive.create_file_from_url, file_url, file_name, google_folder
+@router.message(Command("next"))
+async def cmd_next(message: Message, state: FSMContext):
+    """Пакетный опрос: завершённый опрос ставится в очередь, начинается опрос следующего водоисточника."""
+    current_state = await state.get_state()
+    if current_state != "BotStates:save":
+        state_name = bot_states.get(current_state, "Неизвестное состояние")
+        await message.answer(f"<i>Ввод данных ещё не завершен.\nТекущий статус: {state_name}</i>")
+        return
+    items = session_items(await state.get_data())
+    if len(items) >= Config.batch_max_items:
+        await message.answer(f"<i>В очереди {len(items)} водоисточников - это максимум. Введите /save</i>")
+        return
+    await state.set_data({"queue": items})
+    await state.set_state(BotStates.fid)
+    await message.answer(f"<i>В очереди на сохранение: {len(items)}</i>\n"
+                         f"🆔 <b>1. Числовой идентификатор следующего водоисточника</b>",
+                         reply_markup=get_search_keyboard())
+
+
+async def save_items(bot: Bot, items: list, state: FSMContext, progress: ProgressReporter):
+    """ Конвейер сохранения опросов: водоисточники, папки Google Drive и их описания в NextGIS WEB,
+    снимки, записи о проверках. Этапы выполняются для всех опросов сразу, обращения внутри этапа -
+    параллельно, изменения слоёв NextGIS WEB - пакетами. Выполненное отмечается в опросах (uploaded,
+    checkup_saved) и в данных FSM - повтор /save после ошибки продолжает с места остановки """
+
+    async def remember():
+        await state.update_data(queue=items)
+
+    # 1. Водоисточники - из NextGIS WEB, а не из снимка: ИД папки Google Drive должен быть актуальным
+    with tracing.span("stage.1.ngw_lookup"):
+        progress.append("<i>1. Запрос к NextGIS WEB...</i>")
+
+        async def lookup(fid: int):
+            with tracing.span("ngw.get_feature", kind="client", resource=Config.ngw_resource_wi_points):
+                source = await executors.ngw.run(nextgis.get_water_source, fid)
+            if source is None:
+                raise LookupError(f"водоисточник {fid} не найден в NextGIS WEB")
+            return source
+        sources = await asyncio.gather(*(lookup(item["fid"]) for item in items))
+
+    # 2. Папки Google Drive; для созданных - описание и ИД папки в слой одной пакетной записью
+    with tracing.span("stage.2.drive_folder"):
+        progress.append("<i>2. Обращение к папкам Google Drive...</i>")
+
+        async def folder(source):
+            with tracing.span("drive.create_folder", kind="client") as call:
+                google_folder = await executors.drive.run(
+                    pydrive.create_folder, source.fields.google_folder, source.folder_name, Config.parent_folder_id
                 )
+                call.set(created=source.fields.google_folder != google_folder)
+            return google_folder
+        folders = await asyncio.gather(*(folder(source) for source in sources))
+
+    created = [(source, google_folder) for source, google_folder in zip(sources, folders)
+               if source.fields.google_folder != google_folder]
+    if created:
+        with tracing.span("stage.2.1.ngw_description", features=len(created)):
+            progress.append("<i>Добавление каталогов в NextGIS WEB...</i>")
+            updates = []
+            for source, google_folder in created:
+                description = await executors.ngw.run(
+                    templates.description_water_intake,
+                    source.id,
+                    source.fields.locality,
+                    source.fields.street,
+                    source.fields.building,
+                    source.fields.landmark,
+                    source.fields.specification,
+                    source.fields.flow_rate,
+                    google_folder,
+                    source.fields.google_street,
+                    source.fields.company_id,
+                )
+                updates.append({"id": source.id,
+                                "fields": {"description": description, "ИД_папки_Гугл_диск": google_folder},
+                                "extensions": {"description": description}})
+            with tracing.span("ngw.write_features", kind="client", features=len(updates)) as call:
+                results = await executors.ngw.run(nextgis.ngw_write_features, Config.ngw_resource_wi_points, updates)
+                call.set(result=all(result.ok for result in results))
+
+    # 3. Снимки всех опросов - параллельно (переданные отмечаются и при повторе /save пропускаются)
+    uploads = [(item, google_folder, i, shot_key)
+               for item, google_folder in zip(items, folders)
+               for i, shot_key in enumerate(PHOTO_KEYS)
+               if item.get(shot_key) and shot_key not in item.get("uploaded", [])]
+    if uploads:
+        with tracing.span("stage.3.photos", photos=len(uploads)):
+            progress.append(f"<i>3. Передача снимков ({len(uploads)})...</i>")
+            limit = asyncio.Semaphore(Config.save_photo_concurrency)
+
+            async def upload(item, google_folder, i, shot_key):
+                file_name = f"{i + 1}_{date_name(item)}"
+                async with limit:
+                    # Снимок альбома, скачанный заранее, загружается из файла
+                    staged = await staging.staged(item[shot_key])
+                    if staged:
+                        with tracing.span("drive.upload", kind="client", bytes=os.path.getsize(staged), staged=True):
+                            await executors.drive.run(pydrive.create_file_from_path, staged, file_name, google_folder)
+                    else:
+                        with tracing.span("telegram.get_file", kind="client") as call:
+                            file_info = await bot.get_file(item[shot_key])
+                            call.set(bytes=file_info.file_size or 0)
+                        file_url = bot.session.api.file_url(bot.token, file_info.file_path)
+                        with tracing.span("drive.upload", kind="client", bytes=file_info.file_size or 0):
+                            await executors.drive.run(
+                                pydrive.create_file_from_url, file_url, file_name, google_folder
+                            )
+                item["uploaded"] = item.get("uploaded", []) + [shot_key]
+                await remember()
+            await asyncio.gather(*(upload(*args) for args in uploads))
+
+    # 4. Записи о проверках (при повторе /save уже записанные пропускаются)
+    pending = [item for item in items if not item.get("checkup_saved")]
+    if pending:
+        with tracing.span("stage.4.ngw_checkup", checkups=len(pending)):
+            progress.append("<i>4. Запись о проверках в NextGIS WEB...</i>")
+            checkups = [dict(fid_wi=item["fid"], checkout=item["checkout"], water=item["water"],
+                             workable=item["workable"], entrance=item["entrance"], plate_exist=item["plate_exist"],
+                             date_time=item["date_time"], geom=item["EPSG_3857"], key=item["checkup_key"])
+                        for item in pending]
+            with tracing.span("ngw.post_wi_checkups", kind="client", checkups=len(checkups)) as call:
+                results = await executors.ngw.run(nextgis.ngw_post_wi_checkups, checkups)
+                call.set(result=all(results))
+            for item, result in zip(pending, results):
+                item["checkup_saved"] = result
+            await remember()
+            failed = [str(item["fid"]) for item, result in zip(pending, results) if not result]
+            if failed:
+                raise RuntimeError(f"проверки не записаны в NextGIS WEB (ИД {', '.join(failed)}), повторите /save")
 
-        # 7. Запись о проверке в NextGIS WEB
-        msg_text += "\n<i>7. Запись о проверке в NextGIS WEB...</i>"
-        await msg.edit_text(msg_text)
-        # logger.info(data['fid'], data['checkout'], data['water'],
-        #             data['workable'], data['entrance'], data['plate_exist'],
-        #             data['date_time'], data['EPSG_3857'])
-        await loop.run_in_executor(
-            None,
-            nextgis.ngw_post_wi_checkup,
-            data["fid"],
-            data["checkout"],
-            data["water"],
-            data["workable"],
-            data["entrance"],
-            data["plate_exist"],
-            data["date_time"],
-            data["EPSG_3857"],
-        )
-
-        # Отправка сообщения в канал
-        msg_in_grp = f"{data['name']}\n{date_name}"
-        await bot.send_message(Config.tg_canal_id, msg_in_grp)
 
-        msg_text += "\n<i>8. Сохранение данных завершено</i>"
-        await msg.edit_text(msg_text)
-        await state.clear()
-        await asyncio.sleep(2)
-        await msg.delete()
-
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении: {e}")
+@router.message(Command("save"))
+async def cmd_save(message: Message, state: FSMContext, bot: Bot):
+    """Обработчик команды /save: сохранение всех опросов сессии (текущего и очереди /next)."""
+    current_state = await state.get_state()
+    data = await state.get_data()
+    # После /next (шаг 1 следующего опроса, он ещё не начат) сохраняется очередь
+    queued = current_state == BotStates.fid and data.get("queue") and data.get("fid") is None
+    if current_state != "BotStates:save" and not queued:
+        state_name = bot_states.get(current_state, "Неизвестное состояние")
         await message.answer(
-            f"<b>Произошла ошибка при сохранении данных.</b>\n"
-            f"<i>Обратитесь к администратору.</i>\n"
-            f"<code>{e}</code>"
+            f"<i>Ввод данных ещё не завершен.\nТекущий статус: {state_name}</i>"
         )
-        # await msg.edit_text(
-        #     f"<b>Произошла ошибка при сохранении данных.</b>\n"
-        #     f"<i>Обратитесь к администратору.</i>\n"
-        #     f"<code>{e}</code>"
-        # )
-        await state.clear()
\ No newline at end of file
+        return
+    if shutdown.stopping:
+        await message.answer("<i>Бот перезапускается.\nДанные не потеряны, повторите /save через минуту.</i>")
+        return
+
+    # Опросы сессии переносятся в очередь; ключ идемпотентности записи о проверке - один на опрос
+    items = session_items(data)
+    for item in items:
+        item.setdefault("checkup_key", nextgis.new_checkup_key())
+    await state.set_data({"queue": items})
+
+    fids = ", ".join(str(item["fid"]) for item in items)
+    msg_text = f"<b>Передача данных...</b>\n<i>ИД: {fids}</i>"
+    msg = await message.answer(msg_text)
+    progress = ProgressReporter(msg, msg_text)
+
+    # Сохранение учитывается при завершении бота: его дожидаются или записывают для повтора
+    with shutdown.tracking(state), \
+            tracing.start_trace("save", fid=fids, items=len(items), user_id=message.from_user.id) as trace:
+        try:
+            await save_items(bot, items, state, progress)
+
+            # Одно сообщение в канал на все сохранённые опросы
+            with tracing.span("stage.5.channel_post"):
+                msg_in_grp = "\n\n".join(f"{item['name']}\n{date_name(item)}" for item in items)
+                with tracing.span("telegram.send_message", kind="client", bytes=len(msg_in_grp.encode())):
+                    await bot.send_message(Config.tg_canal_id, msg_in_grp)
+
+                progress.append("<i>5. Сохранение данных завершено</i>")
+            await state.clear()
+            staging.discard(item[key] for item in items for key in PHOTO_KEYS if item.get(key))
+            await progress.flush()
+            await asyncio.sleep(2)
+            await msg.delete()
+
+        except (executors.ExecutorSaturated, nextgis.NGWUnavailable) as e:
+            # Данные опроса сохраняются в состоянии - пользователь может повторить /save
+            trace.fail(e)
+            await message.answer(f"<i>{e}.\nДанные не потеряны, повторите /save позже.</i>")
+
+        except Exception as e:
+            trace.fail(e)
+            logger.error(f"Ошибка при сохранении (save_id={trace.trace_id}): {e}")
+            await message.answer(
+                f"<b>Произошла ошибка при сохранении данных.</b>\n"
+                f"<i>Обратитесь к администратору.</i>\n"
+                f"<code>{e}</code>"
+            )
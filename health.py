@@ -0,0 +1,218 @@
+""" Прогрев при запуске и проверки состояния бота
+Перед началом приёма обновлений (main.py) выполняются шаги прогрева Config.warmup_steps, чтобы
+первое сохранение после перезапуска не оплачивало холодный старт:
+ - telegram      - первый запрос к Bot API (сессия aiohttp), проверка участия администраторов в канале;
+ - ngw           - пробный запрос к слою водоисточников NextGIS WEB;
+ - organizations - справочник хоз.субъектов для описаний (templates.py);
+ - features      - чтение колонок снимка слоя водоисточников (страницы mmap попадают в память);
+ - drive         - авторизация сервисного аккаунта Google Drive (или пробный запрос к Config.drive_api_url);
+ - geo           - преобразователи координат в каждом потоке пула вычислений.
+Ошибка шага пишется в журнал и не останавливает запуск.
+
+HTTP сервер на порту Config.health_port:
+    /healthz - процесс жив (всегда 200) и последнее состояние зависимостей;
+    /readyz  - 200, если прогрев завершён, все зависимости доступны и бот не завершает работу, иначе 503.
+Состояние зависимостей (telegram, ngw, drive): доступность, задержка, ошибка - проверяется в фоне
+каждые Config.health_interval секунд.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+import requests
+from aiohttp import web
+from loguru import logger
+
+import executors
+import geo
+import metrics
+import middlewares
+import nextgis
+import pydrive
+import shutdown
+import snapshot
+import templates
+from config import Config
+
+DEPENDENCIES = ('telegram', 'ngw', 'drive')
+
+
+@dataclass
+class Status:
+    """ Результат последней проверки зависимости """
+    ok: bool = False
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    checked_at: float = 0.0
+
+
+started_at = time.time()
+statuses = {name: Status() for name in DEPENDENCIES}
+warmed_up = False
+
+
+# --- Проверки зависимостей ---
+def _ngw_probe():
+    r = nextgis.ngw_request('get', f'{Config.ngw_host}/api/resource/{Config.ngw_resource_wi_points}')
+    if r.status_code != 200:
+        raise RuntimeError(f'NextGIS WEB ответил {r.status_code}')
+
+
+def _drive_probe():
+    if Config.drive_api_url:
+        r = requests.get(f'{Config.drive_api_url}/drive/v2/files/root', timeout=5)
+        if r.status_code >= 500:
+            raise RuntimeError(f'Drive API ответил {r.status_code}')
+        return
+    pydrive.login_with_service_account()
+
+
+async def _check_telegram(bot):
+    await bot.get_me()
+
+
+async def _check_ngw(bot):
+    await executors.ngw.run(_ngw_probe)
+
+
+async def _check_drive(bot):
+    await executors.drive.run(_drive_probe)
+
+
+_CHECKS = {'telegram': _check_telegram, 'ngw': _check_ngw, 'drive': _check_drive}
+
+
+async def check(bot, name: str) -> Status:
+    started = time.perf_counter()
+    try:
+        await _CHECKS[name](bot)
+        status = Status(ok=True)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        status = Status(ok=False, error=f'{type(exc).__name__}: {exc}')
+    status.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    status.checked_at = time.time()
+    statuses[name] = status
+    metrics.observe(f'health.{name}.latency_ms', status.latency_ms)
+    if not status.ok:
+        metrics.inc(f'health.{name}.failures')
+    return status
+
+
+async def check_all(bot) -> dict:
+    await asyncio.gather(*(check(bot, name) for name in DEPENDENCIES))
+    return statuses
+
+
+def ready() -> bool:
+    return warmed_up and not shutdown.stopping and all(status.ok for status in statuses.values())
+
+
+# --- Прогрев ---
+async def _warm_telegram(bot):
+    await bot.get_me()
+    for user_id in Config.tg_admin_ids:
+        await middlewares.is_member(bot, user_id)
+
+
+async def _warm_ngw(bot):
+    await executors.ngw.run(_ngw_probe)
+
+
+async def _warm_organizations(bot):
+    count = await executors.ngw.run(templates.preload_companies)
+    logger.info(f'Справочник хоз.субъектов загружен: {count}')
+
+
+async def _warm_features(bot):
+    def touch():
+        for column in snapshot.layer.columns.values():
+            np.asarray(column).tobytes()
+    await executors.cpu.run(touch)
+
+
+async def _warm_drive(bot):
+    await executors.drive.run(_drive_probe)
+
+
+async def _warm_geo(bot):
+    # Каждая задача ждёт остальные на барьере - так преобразователь строится во всех потоках пула
+    barrier = threading.Barrier(executors.cpu.max_workers, timeout=10)
+
+    def build():
+        geo.warm_up()
+        barrier.wait()
+    await asyncio.gather(*(executors.cpu.run(build) for _ in range(executors.cpu.max_workers)))
+
+
+_STEPS = {'telegram': _warm_telegram, 'ngw': _warm_ngw, 'organizations': _warm_organizations,
+          'features': _warm_features, 'drive': _warm_drive, 'geo': _warm_geo}
+
+
+async def warm_up(bot, steps: str = None):
+    """ Выполнить шаги прогрева по порядку, затем проверить зависимости """
+    global warmed_up
+    started = time.perf_counter()
+    for name in filter(None, (step.strip() for step in (steps if steps is not None else Config.warmup_steps)
+                              .split(','))):
+        if name not in _STEPS:
+            logger.warning(f'Неизвестный шаг прогрева: {name}')
+            continue
+        step_started = time.perf_counter()
+        try:
+            await _STEPS[name](bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning(f'Прогрев {name} не выполнен: {exc!r}')
+        elapsed = (time.perf_counter() - step_started) * 1000
+        metrics.observe(f'warmup.{name}_ms', elapsed)
+        logger.info(f'Прогрев {name}: {elapsed:.0f} мс')
+    await check_all(bot)
+    warmed_up = True
+    logger.info(f'Прогрев завершён за {time.perf_counter() - started:.1f} с, '
+                f'зависимости: {", ".join(f"{name}={status.ok}" for name, status in statuses.items())}')
+
+
+async def monitor(bot):
+    """ Фоновая проверка зависимостей каждые Config.health_interval секунд """
+    while True:
+        await asyncio.sleep(Config.health_interval)
+        await check_all(bot)
+
+
+# --- HTTP ---
+def _body() -> dict:
+    return {'ready': ready(), 'warmed_up': warmed_up, 'uptime': round(time.time() - started_at),
+            'dependencies': {name: asdict(status) for name, status in statuses.items()}}
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response(_body())
+
+
+async def readyz(request: web.Request) -> web.Response:
+    return web.json_response(_body(), status=200 if ready() else 503)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+    return app
+
+
+async def serve(port: int = None) -> Optional[web.AppRunner]:
+    """ Запустить HTTP сервер проверок состояния (None - отключён) """
+    port = port if port is not None else Config.health_port
+    if not port:
+        return None
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.info(f'Проверки состояния: http://0.0.0.0:{port}/healthz, /readyz')
+    return runner
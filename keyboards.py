@@ -12,6 +12,11 @@ def get_help_keyboard():
     builder.row(InlineKeyboardButton(text='Удалить сообщение', callback_data='delete_message'))
     return builder.as_markup()
 
+def get_search_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text='🔍 Найти по адресу', switch_inline_query_current_chat=''))
+    return builder.as_markup()
+
 def get_checkout_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(text=value_lists['checkout'][0] + ' (🌡 +1°C и выше)', callback_data=value_lists['checkout'][0])
@@ -0,0 +1,223 @@
+""" Нагрузочный тест бота
+Имитирует одновременную работу многих проверяющих: для каждого строится поток обновлений Telegram
+(/start, ИД, геопозиция, четыре клавиатуры, три-четыре снимка, /save), которые подаются в настоящий
+Dispatcher бота (dp.feed_update). Внешние сервисы - поддельные NextGIS WEB, Google Drive и Telegram
+из пакета fakes, запускаемые в этом же процессе (или уже запущенные - см. --external).
+
+    python loadtest.py --users 200 --ramp 20 --think 0.5 --ngw-latency 0.05 --drive-latency 0.3
+
+Результат: процентили задержки по шагам, пропускная способность и доля ошибок (--output - в JSON).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Update
+from loguru import logger
+
+from config import Config
+from tracing import percentile
+
+LOADTEST_TOKEN = '123456789:LOADTESTaabbccddeeffgghhiijjkkllmmn'
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+# --- Построение обновлений ---
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'Inspector{user_id}'}
+
+
+def _chat(user_id: int) -> dict:
+    return {'id': user_id, 'type': 'private', 'first_name': f'Inspector{user_id}'}
+
+
+def message_update(user_id: int, **content) -> dict:
+    return {'update_id': next(_update_ids),
+            'message': {'message_id': next(_message_ids), 'date': int(time.time()),
+                        'chat': _chat(user_id), 'from': _user(user_id), **content}}
+
+
+def text_update(user_id: int, text: str) -> dict:
+    update = message_update(user_id, text=text)
+    if text.startswith('/'):
+        command = text.split()[0]
+        update['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return update
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {'update_id': next(_update_ids),
+            'callback_query': {'id': str(next(_message_ids)), 'from': _user(user_id), 'chat_instance': str(user_id),
+                               'data': data,
+                               'message': {'message_id': next(_message_ids), 'date': int(time.time()),
+                                           'chat': _chat(user_id), 'text': 'keyboard'}}}
+
+
+def photo_update(user_id: int, photo_size: int = 200 * 1024) -> dict:
+    file_id = f'photo-{user_id}-{next(_message_ids)}'
+    return message_update(user_id, photo=[{'file_id': file_id, 'file_unique_id': f'u-{file_id}',
+                                           'width': 1280, 'height': 960, 'file_size': photo_size}])
+
+
+def survey_flow(user_id: int, fid: int, rnd: random.Random) -> list:
+    """ Шаги полного опроса: (имя шага, обновление, ожидаемое состояние после шага) """
+    plate = rnd.choice(['отсутствует', 'есть (по ГОСТ)', 'есть (не ГОСТ)'])
+    steps = [
+        ('start', text_update(user_id, '/start'), 'BotStates:fid'),
+        ('fid', text_update(user_id, str(fid)), 'BotStates:position'),
+        ('position', message_update(user_id, location={'latitude': 61.25 + rnd.uniform(-0.1, 0.1),
+                                                       'longitude': 73.39 + rnd.uniform(-0.1, 0.1)}),
+         'BotStates:checkout'),
+        ('checkout', callback_update(user_id, rnd.choice(['установка с пуском воды', 'осмотр внешний'])),
+         'BotStates:water'),
+        ('water', callback_update(user_id, rnd.choice(['имеется', 'отсутствует'])), 'BotStates:workable'),
+        ('workable', callback_update(user_id, rnd.choice(['возможна', 'невозможна'])), 'BotStates:entrance'),
+        ('entrance', callback_update(user_id, rnd.choice(['возможен', 'невозможен'])), 'BotStates:shot_medium'),
+        ('shot_medium', photo_update(user_id), 'BotStates:shot_full'),
+        ('shot_full', photo_update(user_id), 'BotStates:shot_long'),
+        ('shot_long', photo_update(user_id), 'BotStates:plate_exist'),
+        ('plate_exist', callback_update(user_id, plate),
+         'BotStates:save' if plate == 'отсутствует' else 'BotStates:shot_plate'),
+    ]
+    if plate != 'отсутствует':
+        steps.append(('shot_plate', photo_update(user_id), 'BotStates:save'))
+    steps.append(('save', text_update(user_id, '/save'), None))
+    return steps
+
+
+# --- Прогон ---
+class Results:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.surveys = 0
+        self.updates = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        steps = {}
+        for step, values in self.latency.items():
+            steps[step] = {'n': len(values), 'errors': self.errors.get(step, 0),
+                           **{f'p{q}': round(percentile(values, q), 1) for q in (50, 90, 95, 99)},
+                           'max': round(max(values), 1)}
+        return {'elapsed_s': round(elapsed, 2), 'surveys': self.surveys, 'updates': self.updates,
+                'surveys_per_s': round(self.surveys / elapsed, 2) if elapsed else 0,
+                'updates_per_s': round(self.updates / elapsed, 2) if elapsed else 0,
+                'error_rate': round(sum(self.errors.values()) / self.updates, 4) if self.updates else 0,
+                'steps': steps}
+
+
+def format_report(report: dict) -> str:
+    lines = [f"Опросов: {report['surveys']}, обновлений: {report['updates']}, время: {report['elapsed_s']} с",
+             f"Пропускная способность: {report['surveys_per_s']} опросов/с, {report['updates_per_s']} обновлений/с",
+             f"Доля ошибок: {report['error_rate'] * 100:.2f} %", '',
+             f"{'Шаг':14} {'n':>6} {'ошибок':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}  (мс)"]
+    for step, values in report['steps'].items():
+        lines.append(f"{step:14} {values['n']:6d} {values['errors']:7d} {values['p50']:9.1f} {values['p90']:9.1f} "
+                     f"{values['p95']:9.1f} {values['p99']:9.1f} {values['max']:9.1f}")
+    return '\n'.join(lines)
+
+
+async def feed(dp, bot, update: dict) -> float:
+    """ Подать обновление в диспетчер, вернуть время обработки в мс """
+    started = time.perf_counter()
+    await dp.feed_update(bot, Update.model_validate(update, context={'bot': bot}))
+    return (time.perf_counter() - started) * 1000
+
+
+async def inspector(dp, bot, results: Results, user_id: int, fid: int, think: float, rnd: random.Random):
+    for step, update, expected in survey_flow(user_id, fid, rnd):
+        results.updates += 1
+        try:
+            results.latency[step].append(await feed(dp, bot, update))
+            state = await dp.storage.get_state(StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id))
+            if state != expected:
+                raise RuntimeError(f'состояние {state}, ожидалось {expected}')
+        except Exception as exc:
+            results.errors[step] += 1
+            logger.warning(f'Проверяющий {user_id}, шаг {step}: {exc}')
+            await dp.storage.set_state(StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id), None)
+            return
+        if think:
+            await asyncio.sleep(rnd.uniform(0, 2 * think))
+    results.surveys += 1
+
+
+async def run(users: int, ramp: float = 0.0, think: float = 0.0, sources: int = 2000, seed: int = 1,
+              dp=None) -> dict:
+    """ Прогнать users опросов против сервисов из Config (ngw_host, drive_api_url, tg_api_server).
+    dp - уже созданный диспетчер бота (в процессе может быть только один) """
+    import main  # Импорт после настройки Config: роутеры бота подключаются к одному диспетчеру
+
+    bot = main.create_bot(LOADTEST_TOKEN)
+    dp = dp or main.create_dispatcher()
+    rnd = random.Random(seed)
+    results = Results()
+    tasks = []
+    try:
+        for number in range(users):
+            user_id = 1_000_000 + number
+            tasks.append(asyncio.create_task(
+                inspector(dp, bot, results, user_id, rnd.randint(1, sources), think, random.Random(seed + number))))
+            if ramp:
+                await asyncio.sleep(ramp / users)
+        await asyncio.gather(*tasks)
+        results.finished = time.perf_counter()
+    finally:
+        await bot.session.close()
+    return results.report()
+
+
+async def main_async(args) -> dict:
+    from fakes import run as fakes
+    from fakes.knobs import Knobs
+
+    services = None
+    if not args.external:
+        services = await fakes.start(
+            ngw_knobs=Knobs(latency=args.ngw_latency, jitter=args.ngw_latency, error_rate=args.error_rate),
+            drive_knobs=Knobs(latency=args.drive_latency, jitter=args.drive_latency, error_rate=args.error_rate),
+            telegram_knobs=Knobs(latency=args.telegram_latency, jitter=args.telegram_latency),
+            sources=args.sources, photo_size=args.photo_size)
+        Config.ngw_host = services.ngw_url
+        Config.drive_api_url = services.drive_url
+        Config.tg_api_server = services.telegram_url
+    try:
+        return await run(args.users, args.ramp, args.think, args.sources, args.seed)
+    finally:
+        if services:
+            await services.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на поддельных сервисах')
+    parser.add_argument('--users', type=int, default=100, help='Количество одновременных проверяющих')
+    parser.add_argument('--ramp', type=float, default=10.0, help='Время подключения всех проверяющих, секунд')
+    parser.add_argument('--think', type=float, default=0.5, help='Средняя пауза между шагами, секунд')
+    parser.add_argument('--sources', type=int, default=2000, help='Количество водоисточников')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ngw-latency', type=float, default=0.05, help='Задержка NextGIS WEB, секунд')
+    parser.add_argument('--drive-latency', type=float, default=0.2, help='Задержка Google Drive, секунд')
+    parser.add_argument('--telegram-latency', type=float, default=0.03, help='Задержка Telegram, секунд')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ошибок NextGIS WEB и Google Drive')
+    parser.add_argument('--photo-size', type=int, default=200 * 1024, help='Размер снимка, байт')
+    parser.add_argument('--external', action='store_true',
+                        help='Не запускать поддельные сервисы: использовать NGW_HOST, DRIVE_API_URL, TG_API_SERVER')
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(lambda text: print(text, end=''), level='WARNING')
+    result = asyncio.run(main_async(args))
+    print(format_report(result))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
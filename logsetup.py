@@ -0,0 +1,107 @@
+""" Настройка журнала (loguru)
+ - записи пишутся в приёмники из фонового потока (enqueue=True) - запись на диск не задерживает обработчики;
+ - файл журнала (Config.log_file) - JSON по записи на строку (Config.log_json), с ротацией по размеру
+   и ограниченным числом архивов: объём на диске не зависит от размера слоёв;
+ - в каждую запись добавляется correlation_id: идентификатор трассы сохранения (tracing.py),
+   а вне трассы - ИД обновления Telegram (middleware correlate);
+ - частые записи уровня ниже WARNING отбираются по категориям (Config.log_sampling, например
+   "ngw.read=0.05,ngw.payload=0.1" - записывается каждая 20-я и каждая 10-я запись категории).
+   Категория задаётся через logger.bind(category=...);
+ - содержимое запросов и ответов пишется только в виде усечённого превью (preview).
+Журнал стандартного logging (aiogram) перенаправляется в loguru.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import sys
+from collections import defaultdict
+
+from loguru import logger
+
+import tracing
+from config import Config
+
+_update_id = contextvars.ContextVar('update_id', default=None)
+
+_FORMAT = ('<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | '
+           '{extra[correlation_id]} | <cyan>{name}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>')
+
+
+def preview(payload, limit: int = None) -> str:
+    """ Усечённое представление данных запроса/ответа для журнала """
+    limit = limit or Config.log_preview
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8', errors='replace')
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if len(text) <= limit:
+        return text
+    return f'{text[:limit]}…(+{len(text) - limit} симв.)'
+
+
+def parse_rates(text: str) -> dict:
+    """ "категория=доля,..." -> {категория: доля} """
+    rates = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class Sampler:
+    """ Фильтр записей: из записей категории ниже WARNING пропускается каждая round(1 / доля)-я """
+
+    def __init__(self, rates: dict):
+        self.steps = {name: max(1, round(1 / rate)) if rate > 0 else 0 for name, rate in rates.items()}
+        self.counters = defaultdict(itertools.count)
+        self.dropped = defaultdict(int)
+
+    def __call__(self, record) -> bool:
+        step = self.steps.get(record['extra'].get('category'))
+        if step is None or step == 1 or record['level'].no >= logging.WARNING:
+            return True
+        category = record['extra']['category']
+        if step and next(self.counters[category]) % step == 0:
+            return True
+        self.dropped[category] += 1
+        return False
+
+
+def patch(record):
+    """ Идентификатор для связи записей одного сохранения / одного обновления """
+    correlation_id = tracing.current_trace_id() or _update_id.get()
+    record['extra'].setdefault('correlation_id', correlation_id or '-')
+
+
+async def correlate(handler, event, data):
+    """ Outer middleware обновлений: ИД обновления - correlation_id записей его обработки """
+    token = _update_id.set(f'u{event.update_id}')
+    try:
+        return await handler(event, data)
+    finally:
+        _update_id.reset(token)
+
+
+class InterceptHandler(logging.Handler):
+    """ Записи стандартного logging -> loguru """
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        logger.opt(depth=6, exception=record.exc_info).log(level, record.getMessage())
+
+
+def setup(sampler: Sampler = None):
+    """ Приёмники журнала процесса бота. Вызывается один раз при запуске (main.py) """
+    sampler = sampler or Sampler(parse_rates(Config.log_sampling))
+    logger.remove()
+    logger.configure(patcher=patch)
+    logger.add(sys.stdout, level=Config.log_level, format=_FORMAT, filter=sampler, enqueue=True, catch=True)
+    if Config.log_file:
+        logger.add(Config.log_file, level=Config.log_file_level, serialize=Config.log_json, filter=sampler,
+                   enqueue=True, catch=True, rotation=Config.log_rotation, retention=Config.log_retention,
+                   compression='zip')
+    logging.basicConfig(handlers=[InterceptHandler()], level=logging.INFO, force=True)
+    return sampler
@@ -7,40 +7,109 @@
 Переписано на aiogram
 """
 import asyncio
-import logging
 import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from loguru import logger
 
+import health
+import logsetup
+import sessions
+import shutdown
+import snapshot
+import stats
+import sync
 from config import Config
-from handlers import common_handlers, survey_handlers
+from handlers import admin_handlers, common_handlers, search_handlers, survey_handlers
 from middlewares import verification_user
+from replay import UpdateRecorder
 
-# Логирование
-logger.add('logs/log_aiogram.log', level='WARNING', rotation='10 MB', compression='zip', catch=True)
 
+def create_bot(token: str = None) -> Bot:
+    """Бот с сессией к api.telegram.org или к серверу Config.tg_api_server"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(Config.tg_api_server)) if Config.tg_api_server else None
+    bot = Bot(token=token or Config.bot_token, session=session,
+              default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # Количество, ошибки и задержка запросов к Bot API (/stats)
+    bot.session.middleware(stats.telegram_calls)
+    return bot
 
-async def main() -> None:
-    """Точка входа в приложение"""
-    # Инициализация бота и диспетчера
-    bot = Bot(token=Config.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер с middleware и роутерами бота.
+    Роутеры подключаются к диспетчеру один раз - в процессе может быть только один диспетчер"""
     dp = Dispatcher()
 
-    # Регистрируем middleware для всех message и callback_query
+    # Идентификатор обновления в записях журнала его обработки
+    dp.update.outer_middleware(logsetup.correlate)
+
+    # Запись обезличенных обновлений для последующего воспроизведения (включается в Config)
+    if Config.record_updates_file:
+        recorder = UpdateRecorder(Config.record_updates_file)
+        dp.update.outer_middleware(recorder)
+        # Дописать журнал при остановке получения обновлений
+        dp.shutdown.register(recorder.close)
+
+    # Регистрируем middleware для всех message, callback_query и inline_query
     dp.message.middleware(verification_user)
     dp.callback_query.middleware(verification_user)
+    dp.inline_query.middleware(verification_user)
+
+    # Длительность обработчиков (/stats)
+    dp.message.middleware(stats.measure)
+    dp.callback_query.middleware(stats.measure)
+
+    # Отметка активности пользователя для сброса брошенных опросов
+    dp.message.outer_middleware(sessions.touch)
+    dp.callback_query.outer_middleware(sessions.touch)
 
     # Подключаем роутеры
+    dp.include_router(admin_handlers.router)
     dp.include_router(survey_handlers.router)
+    dp.include_router(search_handlers.router)
     dp.include_router(common_handlers.router)
+    return dp
+
+
+async def main() -> None:
+    """Точка входа в приложение"""
+    # Инициализация бота и диспетчера
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    # Проверки состояния доступны сразу: /readyz отвечает 503 до окончания прогрева
+    runner = await health.serve()
+
+    # Снимок слоя водоисточников: сразу с диска, обновление и синхронизация изменений - в фоне
+    if Config.snapshot_dir:
+        snapshot.open_snapshot()
+
+    # Прогрев соединений, авторизации и справочников до приёма первых обновлений
+    await health.warm_up(bot)
+    background = [asyncio.create_task(health.monitor(bot)), asyncio.create_task(sync.syncer.run()),
+                  asyncio.create_task(sessions.sweeper(bot, dp.storage))]
 
-    # Запускаем polling
-    await dp.start_polling(bot)
+    # Сохранения, прерванные прошлым завершением бота, можно повторить
+    await shutdown.restore(bot, dp.storage)
 
+    # Запускаем polling (до SIGTERM/SIGINT), затем дожидаемся начатых сохранений и закрываем соединения
+    try:
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        await shutdown.shutdown(bot, background, runner)
+        # Дописать записи журнала из очереди фонового приёмника
+        await logger.complete()
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    if "--profile-startup" in sys.argv:
+        # Профиль запуска: время импорта по пакетам, память, тяжёлые зависимости
+        import startup
+        print(startup.report(startup.measure()))
+        sys.exit(0)
+    # Журнал: фоновая запись, JSON в файле, выборка частых записей
+    logsetup.setup()
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,65 @@
+""" Метрики бота в памяти процесса
+Счётчики (inc), скользящие окна наблюдений (observe) и показатели, вычисляемые по запросу (gauge).
+Окна - кольцевые буферы фиксированной длины, поэтому запись метрики стоит O(1) и не растёт по памяти.
+Функции потокобезопасны: метрики пишутся и из пулов потоков (executors), и из цикла asyncio.
+"""
+import threading
+from collections import defaultdict, deque
+
+from config import Config
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_windows = {}
+_gauges = {}
+
+
+def inc(name: str, value: int = 1):
+    """ Увеличить счётчик """
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """ Добавить наблюдение (например, длительность в мс) в скользящее окно """
+    with _lock:
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = deque(maxlen=Config.metrics_window)
+        window.append(value)
+
+
+def gauge(name: str, func):
+    """ Зарегистрировать показатель, значение которого вычисляется функцией при чтении """
+    _gauges[name] = func
+
+
+def counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def window(name: str) -> list:
+    with _lock:
+        return list(_windows.get(name, ()))
+
+
+def snapshot() -> dict:
+    """ Текущие значения всех метрик: counters, windows, gauges """
+    with _lock:
+        counters = dict(_counters)
+        windows = {name: list(values) for name, values in _windows.items()}
+    gauges = {}
+    for name, func in list(_gauges.items()):
+        try:
+            gauges[name] = func()
+        except Exception as exc:
+            gauges[name] = f'ошибка: {exc}'
+    return {'counters': counters, 'windows': windows, 'gauges': gauges}
+
+
+def reset():
+    """ Сбросить счётчики и окна (используется в тестах и бенчмарках) """
+    with _lock:
+        _counters.clear()
+        _windows.clear()
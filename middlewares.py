@@ -1,27 +1,77 @@
+import asyncio
 import logging
+import time
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineQuery
 from config import Config
 from loguru import logger
+import metrics
+
+
+async def _deny(event, text: str):
+    """Ответ пользователю, не прошедшему проверку (на inline-запрос - пустой список результатов)."""
+    if isinstance(event, InlineQuery):
+        await event.answer([], cache_time=60, is_personal=True)
+    else:
+        await event.answer(text)
+
+
+# Подтверждённые участники канала: ИД пользователя -> время окончания действия проверки
+_members = {}
+
+
+async def is_member(bot, user_id: int) -> bool:
+    """Проверка участия в канале; положительный результат кэшируется на Config.member_cache_ttl секунд."""
+    if _members.get(user_id, 0) > time.monotonic():
+        metrics.inc('members.hits')
+        return True
+    metrics.inc('members.misses')
+    member = await bot.get_chat_member(Config.tg_canal_id, user_id)
+    if member.status in ['creator', 'administrator', 'member', 'restricted']:
+        _members[user_id] = time.monotonic() + Config.member_cache_ttl
+        return True
+    _members.pop(user_id, None)
+    return False
 
 
 async def verification_user(handler, event, data):
     """Проверяет, является ли пользователь участником канала."""
     bot = data['bot']
-    members_status = ['creator', 'administrator', 'member', 'restricted']
     try:
-        member = await bot.get_chat_member(Config.tg_canal_id, event.from_user.id)
-        if member.status in members_status:
+        if await is_member(bot, event.from_user.id):
             return await handler(event, data)
         else:
-            await event.answer('⚠ Бот доступен только участникам "Группы "ППВ СгМПСГ"')
+            await _deny(event, '⚠ Бот доступен только участникам "Группы "ППВ СгМПСГ"')
             logger.warning(f'Пользователь {event.from_user.id} не является участником канала.')
     except TelegramBadRequest as exc:
         if "user not found" in exc.message:
-            await event.answer('⚠ Вы не являетесь участником канала, необходимого для работы с ботом.')
+            await _deny(event, '⚠ Вы не являетесь участником канала, необходимого для работы с ботом.')
             logger.warning(f'Пользователь {event.from_user.id} н�� найден в канале.')
         else:
             logger.critical(f'Ошибка API при верификации пользователя: {exc}')
-            await event.answer(f'⚠ Ошибка API при верификации: {exc.message}. Убедитесь, что бот является администратором в канале.')
+            await _deny(event, f'⚠ Ошибка API при верификации: {exc.message}. Убедитесь, что бот является администратором в канале.')
     except Exception as exc:
         logger.critical(f'Неожиданная ошибка верификации пользователя: {exc}')
-        await event.answer('⚠ Произошла непредвиденная ошибка верификации. Обратитесь к администратору.')
+        await _deny(event, '⚠ Произошла непредвиденная ошибка верификации. Обратитесь к администратору.')
+
+
+# Собираемые альбомы: media_group_id -> сообщения альбома
+_albums = {}
+
+
+async def collect_album(handler, event, data):
+    """Сообщения одного альбома (media group) собираются в течение Config.album_window секунд и
+    передаются обработчику первого сообщения списком album; обработчики остальных не вызываются."""
+    if event.media_group_id is None:
+        return await handler(event, data)
+    album = _albums.get(event.media_group_id)
+    if album is not None:
+        album.append(event)
+        return None
+    album = _albums[event.media_group_id] = [event]
+    try:
+        await asyncio.sleep(Config.album_window)
+    finally:
+        _albums.pop(event.media_group_id, None)
+    data['album'] = sorted(album, key=lambda message: message.message_id)
+    return await handler(event, data)
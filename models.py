@@ -0,0 +1,116 @@
+""" Типизированные модели объектов NextGIS WEB
+Ответы сервиса разбираются сразу из байтов декодером msgspec по схеме модели - без промежуточных
+словарей и копирования текста. Модели - компактные структуры со слотами (msgspec.Struct).
+Все поля схемы обязательны (значение может быть null): если в ответе пропало или поменяло тип
+поле, которое использует бот, разбор завершается исключением SchemaError с указанием поля,
+а не KeyError где-то в середине /save.
+
+Ресурсы:
+    WaterSource  - водоисточники (Config.ngw_resource_wi_points, 91)
+    Checkup      - проверки водоисточников (Config.ngw_resource_wi_checkup, 90)
+    Organization - хозяйствующие субъекты (Config.ngw_resource_organization, 88)
+"""
+from typing import List, Optional
+
+import msgspec
+from msgspec import Struct, field
+
+
+class SchemaError(ValueError):
+    """ Ответ NextGIS WEB не соответствует ожидаемой схеме ресурса """
+
+
+class NgwDateTime(Struct, gc=False):
+    """ Дата и время в формате NextGIS WEB (dt_format=obj) """
+    year: int
+    month: int
+    day: int
+    hour: int = 0
+    minute: int = 0
+    second: int = 0
+
+    def iso(self) -> str:
+        return (f'{self.year:04d}-{self.month:02d}-{self.day:02d}'
+                f'T{self.hour:02d}:{self.minute:02d}:{self.second:02d}')
+
+
+class WaterSourceFields(Struct, gc=False):
+    name: Optional[str]
+    locality: Optional[str] = field(name='Поселение')
+    street: Optional[str] = field(name='Улица')
+    building: Optional[str] = field(name='Дом')
+    landmark: Optional[str] = field(name='Ориентир')
+    specification: Optional[str] = field(name='Исполнение')
+    flow_rate: Optional[str] = field(name='Водоотдача_сети')
+    google_folder: Optional[str] = field(name='ИД_папки_Гугл_диск')
+    google_street: Optional[str] = field(name='Ссылка_Гугл_улицы')
+    company_id: Optional[int] = field(name='ИД_хоз_субъекта')
+
+
+class WaterSource(Struct, gc=False):
+    """ Водоисточник (точка забора воды) """
+    id: int
+    fields: WaterSourceFields
+    geom: Optional[str] = None
+
+    @property
+    def address(self) -> str:
+        return f'{self.fields.locality}, {self.fields.street}, {self.fields.building}'
+
+    @property
+    def title(self) -> str:
+        """ Наименование и адрес - для сообщений пользователю """
+        return f'{self.fields.name}\n{self.address}'
+
+    @property
+    def folder_name(self) -> str:
+        """ Имя папки водоисточника на Google диске """
+        return f'ИД-{self.id} {self.fields.name} {self.address}'
+
+
+class CheckupFields(Struct, gc=False):
+    id: Optional[int]
+    source_id: Optional[int] = field(name='ИД_ВИ')
+    checkout: Optional[str] = field(name='Вид_контроля')
+    water: Optional[str] = field(name='Наличие_воды')
+    workable: Optional[str] = field(name='Установка_ПА')
+    entrance: Optional[str] = field(name='Подъезд_ПА')
+    plate: Optional[str] = field(name='Указатель_ВИ')
+    note: Optional[str] = field(name='Примечание')
+    temperature: Optional[float] = field(name='Температура')
+    date_time: Optional[NgwDateTime] = field(name='Дата_время')
+
+
+class Checkup(Struct, gc=False):
+    """ Запись о проверке водоисточника """
+    id: int
+    fields: CheckupFields
+    geom: Optional[str] = None
+
+
+class OrganizationFields(Struct, gc=False):
+    name: Optional[str] = field(name='Хоз_субъект')
+
+
+class Organization(Struct, gc=False):
+    """ Хозяйствующий субъект """
+    id: int
+    fields: OrganizationFields
+
+
+_decoders = {}
+
+
+def _decoder(model, many: bool) -> msgspec.json.Decoder:
+    key = (model, many)
+    if key not in _decoders:
+        _decoders[key] = msgspec.json.Decoder(List[model] if many else model)
+    return _decoders[key]
+
+
+def decode(model, content: bytes, many: bool = False):
+    """ Разобрать ответ NextGIS WEB (байты JSON) в модель или список моделей """
+    try:
+        return _decoder(model, many).decode(content)
+    except msgspec.ValidationError as exc:
+        raise SchemaError(f'{model.__name__}: {exc}') from exc
@@ -5,9 +5,76 @@
     https://nextgis.ru/blog/ngw-event-4/
 """
 import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
 import requests
 from loguru import logger
+import executors
+import metrics
+import models
 from config import Config  # Параметры записаны в файл config.py
+from logsetup import preview
+from resilience import CircuitBreaker, ServiceUnavailable, hedged
+from models import Checkup, Organization, WaterSource
+from singleflight import SingleFlight
+
+
+class NGWUnavailable(ServiceUnavailable):
+    """ NextGIS WEB недоступен: таймаут, ошибка соединения или разомкнут выключатель """
+
+
+# Автоматический выключатель общий для всех запросов к NextGIS WEB
+breaker = CircuitBreaker('ngw', Config.ngw_breaker_failures, Config.ngw_breaker_reset)
+# Объединение одинаковых одновременных GET-запросов (например, по ссылке на водоисточник из чата)
+_reads = SingleFlight('ngw')
+# Частые записи: чтения слоёв и содержимое запросов отбираются выборочно (Config.log_sampling)
+_read_log = logger.bind(category='ngw.read')
+_payload_log = logger.bind(category='ngw.payload')
+
+
+def _send(method: str, url: str, **kwargs):
+    """ Один HTTP-запрос; учёт выключателем и метриками - в _request (страхующая пара - одно обращение) """
+    return getattr(requests, method)(url, auth=(Config.ngw_user, Config.ngw_password),
+                                     timeout=Config.ngw_timeout, **kwargs)
+
+
+def ngw_request(method: str, url: str, hedge: bool = False, **kwargs):
+    """ Запрос к NextGIS WEB с таймаутом (Config.ngw_timeout) через автоматический выключатель.
+    hedge=True - для чтений: если ответ задерживается дольше Config.ngw_hedge_delay,
+    параллельно отправляется повторный запрос. Одинаковые одновременные GET-запросы объединяются в один.
+    При недоступности сервиса - исключение NGWUnavailable """
+    if not breaker.allow():
+        raise NGWUnavailable('NextGIS WEB временно недоступен')
+    if method == 'get':
+        # Одинаковые одновременные чтения (ресурс, объект, параметры запроса - всё в URL) выполняются один раз
+        return _reads.do(url, _request, method, url, hedge, **kwargs)
+    return _request(method, url, hedge, **kwargs)
+
+
+def _request(method: str, url: str, hedge: bool, **kwargs):
+    metrics.inc('ngw.requests')
+    started = time.perf_counter()
+    try:
+        if hedge and Config.ngw_hedge_delay:
+            r = hedged(_send, Config.ngw_hedge_delay, method, url, **kwargs)
+        else:
+            r = _send(method, url, **kwargs)
+    except requests.RequestException as exc:
+        breaker.record_failure()
+        metrics.inc('ngw.errors')
+        raise NGWUnavailable(f'NextGIS WEB не отвечает: {exc}') from exc
+    finally:
+        metrics.observe('ngw.latency_ms', (time.perf_counter() - started) * 1000)
+    # Ответ 5xx - отказ сервера: учитывается выключателем, обрабатывается вызывающей функцией
+    if isinstance(r.status_code, int) and r.status_code >= 500:
+        breaker.record_failure()
+        metrics.inc('ngw.errors')
+    else:
+        breaker.record_success()
+    return r
 
 
 # def ngw_name_wi_point(feature_fid=None):
@@ -33,54 +100,167 @@ from config import Config  # Параметры записаны в файл con
 #         return f'⚠ Ошибка (ресурс вернул - {exc})'
 
 
-def ngw_post_wi_checkup(fid_wi, checkout, water, workable, entrance, plate_exist, date_time, geom, air_temp=None):
+def new_checkup_key() -> Optional[str]:
+    """ Ключ идемпотентности записи о проверке (генерируется один раз на сохранение опроса).
+    None, если поле для ключа не задано (Config.checkup_key_field) """
+    return f'save-{uuid.uuid4().hex}' if Config.checkup_key_field else None
+
+
+def _checkup_feature(fid_wi, checkout, water, workable, entrance, plate_exist, date_time, geom, air_temp=None,
+                     key: str = None) -> dict:
+    """ Запись о проверке в формате NextGIS WEB """
+    data = {
+                "extensions": {
+                    "attachment": None,
+                    "description": None
+                    },
+                "fields": {
+                    "ИД_ВИ": fid_wi,
+                    "Вид_контроля": checkout,
+                    "Наличие_воды": water,
+                    "Установка_ПА": workable,
+                    "Подъезд_ПА": entrance,
+                    "Указатель_ВИ": plate_exist,
+                    "Примечание": '',
+                    "Температура": air_temp,
+                    "Дата_время": {
+                        "year": int(date_time['year']),
+                        "month": int(date_time['month']),
+                        "day": int(date_time['day']),
+                        "hour": int(date_time['hour']),
+                        "minute": int(date_time['minute']),
+                        "second": 0
+                        }
+                },
+                "geom": geom
+            }
+    if key is not None and Config.checkup_key_field:
+        data["fields"][Config.checkup_key_field] = key
+    return data
+
+
+def _checkup_filter(fid_wi, date_time: dict, key: str = None) -> list:
+    """ Условия поиска записи о проверке: ключ идемпотентности в поле Config.checkup_key_field или, если поле
+    не задано, водоисточник и дата-время опроса (запоминается при начале опроса и при повторе /save не меняется) """
+    if key is not None and Config.checkup_key_field:
+        return [f'fld_{Config.checkup_key_field}={key}']
+    moment = (f"{int(date_time['year']):04d}-{int(date_time['month']):02d}-{int(date_time['day']):02d}"
+              f"T{int(date_time['hour']):02d}:{int(date_time['minute']):02d}:00")
+    return [f'fld_ИД_ВИ={fid_wi}', f'fld_Дата_время={moment}']
+
+
+def _find_checkup(fid_wi, date_time: dict, key: str = None) -> Optional[bool]:
+    """ Есть ли уже запись об этой проверке (_checkup_filter). None - проверить не удалось """
+    query = _checkup_filter(fid_wi, date_time, key)
+    content = fetch_features(Config.ngw_resource_wi_checkup, fields=['id'], geom='no', extensions='none',
+                             limit=1, fld_equals=query)
+    if content is None:
+        return None
+    existing = json.loads(content.decode('utf-8'))
+    if existing:
+        logger.info(f'Проверка ({"&".join(query)}) уже записана в NextGIS WEB: {existing[0]["id"]}')
+        if existing[0]['fields'].get('id') is None:
+            _schedule_backfill(existing[0]['id'])
+    return bool(existing)
+
+
+def ngw_post_wi_checkup(fid_wi, checkout, water, workable, entrance, plate_exist, date_time, geom, air_temp=None,
+                        key: str = None):
     """ Создать запись о проверке
     Функция выполняет запрос к NextGIS WEB - создает запись о проверке в таблице.
-    При удачном запросе вернувшийся ИД новой записи вносит в поле id таблицы
-    (id таблицы - дублер ИД NextGIS WEB, который не отображанется в настольной QGIS) """
+    Ключ идемпотентности key записывается в поле Config.checkup_key_field (если задано). Если запись с таким ключом
+    (без поля - с тем же водоисточником и датой-временем опроса) уже есть (повтор /save после сбоя), новая
+    не создаётся. Если наличие записи проверить не удалось - запись не создаётся (лучше повторить позже,
+    чем задвоить проверку).
+    ИД новой записи вносится в поле id таблицы (id таблицы - дублер ИД NextGIS WEB, который не
+    отображанется в настольной QGIS) не отдельным запросом, а пакетно - см. backfill_checkup_ids """
     try:
+        found = _find_checkup(fid_wi, date_time, key)
+        if found is None:
+            return None
+        if found:
+            return True
+
         request_post = f'{Config.ngw_host}/api/resource/{Config.ngw_resource_wi_checkup}/feature/'
-        data = {
-                    "extensions": {
-                        "attachment": None,
-                        "description": None
-                        },
-                    "fields": {
-                        "ИД_ВИ": fid_wi,
-                        "Вид_контроля": checkout,
-                        "Наличие_воды": water,
-                        "Установка_ПА": workable,
-                        "Подъезд_ПА": entrance,
-                        "Указатель_ВИ": plate_exist,
-                        "Примечание": '',
-                        "Температура": air_temp,
-                        "Дата_время": {
-                            "year": int(date_time['year']),
-                            "month": int(date_time['month']),
-                            "day": int(date_time['day']),
-                            "hour": int(date_time['hour']),
-                            "minute": int(date_time['minute']),
-                            "second": 0
-                            }
-                    },
-                    "geom": geom
-                }
-        logger.info(data)
-        r_post = requests.post(request_post, data=json.dumps(data), auth=(Config.ngw_user, Config.ngw_password))
+        data = _checkup_feature(fid_wi, checkout, water, workable, entrance, plate_exist, date_time, geom,
+                                air_temp, key)
+        _payload_log.opt(lazy=True).debug('Проверка для NextGIS WEB: {}', lambda: preview(data))
+        r_post = ngw_request('post', request_post, data=json.dumps(data))
         logger.info(f'Статус создания wi_checkup в NextGIS WEB: {r_post.status_code}')
         if r_post.status_code == 200:
-            logger.debug(r_post.text)
+            _payload_log.opt(lazy=True).debug('Ответ NextGIS WEB: {}', lambda: preview(r_post.content))
             answer = json.loads(r_post.content.decode('utf-8'))
-            request_put = f'{Config.ngw_host}/api/resource/{Config.ngw_resource_wi_checkup}/feature/{answer["id"]}'
-            data_put = {"fields": {"id": answer["id"]}}
-            r_put = requests.put(request_put, data=json.dumps(data_put), auth=(Config.ngw_user, Config.ngw_password))
-            logger.info(f'Статус редактирования wi_checkup в NextGIS WEB: {r_post.status_code}')
-            if r_put.status_code == 200:
-                return True
+            _schedule_backfill(answer["id"])
+            return True
+    except NGWUnavailable:
+        raise
     except Exception as exc:
         logger.critical(f"Ошибка записи о проверке в NextGIS WEB: {exc}")
 
 
+def ngw_post_wi_checkups(checkups: List[dict]) -> List[bool]:
+    """ Создать записи о нескольких проверках (пакетный опрос)
+    checkups - параметры ngw_post_wi_checkup в виде словарей. Наличие записей (_find_checkup)
+    проверяется параллельно, новые записи создаются пакетной записью (ngw_write_features). Если пакет
+    отклонён (в том числе PATCH не поддерживается), проверки создаются по одной запросами POST.
+    Если исход пакета неизвестен (таймаут, 5xx), он мог быть записан: проверки создаются по одной
+    через ngw_post_wi_checkup (сначала - повторный поиск записи).
+    Возвращает для каждой проверки True - запись есть в NextGIS WEB, False - не записана (повторить) """
+    found = executors.ngw_fanout.map(
+        lambda checkup: _find_checkup(checkup['fid_wi'], checkup['date_time'], checkup.get('key')), checkups)
+    results = [bool(item) for item in found]
+    create = [index for index, item in enumerate(found) if item is False]
+    if create:
+        written = ngw_write_features(Config.ngw_resource_wi_checkup,
+                                     [_checkup_feature(**checkups[index]) for index in create])
+        for result in written:
+            results[create[result.index]] = result.ok
+            if result.ok:
+                _schedule_backfill(result.feature_id)
+    retry = [index for index in create if not results[index]]
+    for index, ok in zip(retry, executors.ngw_fanout.map(_post_checkup, [checkups[index] for index in retry])):
+        results[index] = ok
+    return results
+
+
+def _post_checkup(checkup: dict) -> bool:
+    try:
+        return bool(ngw_post_wi_checkup(**checkup))
+    except Exception as exc:
+        logger.warning(f'Проверка водоисточника {checkup["fid_wi"]} не записана: {exc!r}')
+        return False
+
+
+# ИД созданных проверок, у которых ещё не заполнено поле id
+_backfill = set()
+_backfill_lock = threading.Lock()
+
+
+def _schedule_backfill(feature_id: int):
+    with _backfill_lock:
+        _backfill.add(feature_id)
+
+
+def backfill_checkup_ids() -> int:
+    """ Заполнить поле id созданных проверок пакетной записью (обычно - один запрос PATCH).
+    Вызывается циклом синхронизации (sync.py) и при завершении бота; незаполненные ИД остаются в очереди.
+    Возвращает количество заполненных """
+    with _backfill_lock:
+        ids = sorted(_backfill)
+        _backfill.difference_update(ids)
+    if not ids:
+        return 0
+    results = ngw_write_features(Config.ngw_resource_wi_checkup,
+                                 [{"id": feature_id, "fields": {"id": feature_id}} for feature_id in ids], retries=0)
+    failed = [ids[result.index] for result in results if not result.ok]
+    if failed:
+        logger.warning(f'Заполнение поля id проверок отложено: {len(failed)} из {len(ids)}')
+        with _backfill_lock:
+            _backfill.update(failed)
+    metrics.inc('ngw.checkup_backfill', len(ids) - len(failed))
+    return len(ids) - len(failed)
+
+
 def ngw_post_feature(resource_id: int, fields_values: dict, geom: str = None,
                      attachment: str = None, description: str = None):
     try:
@@ -93,10 +273,12 @@ def ngw_post_feature(resource_id: int, fields_values: dict, geom: str = None,
             "fields": fields_values,
             "geom": geom
             }
-        r_post = requests.post(request_post, data=json.dumps(data_post), auth=(Config.ngw_user, Config.ngw_password))
+        r_post = ngw_request('post', request_post, data=json.dumps(data_post))
 
         if r_post.status_code == 200:
             return r_post.json()['id']
+    except NGWUnavailable:
+        raise
     except Exception as exc:
         logger.critical(f"Ошибка изменения объекта в NextGIS WEB: {exc}")
 
@@ -113,15 +295,148 @@ def ngw_put_feature(resource_id: int, feature_id: int, fields_values: dict,
             data_put["fields"] = fields_values
         if geom:
             data_put["geom"] = geom
-        logger.info(data_put)
-        r_put = requests.put(request_put, data=json.dumps(data_put), auth=(Config.ngw_user, Config.ngw_password))
-        logger.info(r_put.json())
+        _payload_log.opt(lazy=True).debug(f'Изменение объекта {feature_id} слоя {resource_id}: {{}}',
+                                          lambda: preview(data_put))
+        r_put = ngw_request('put', request_put, data=json.dumps(data_put))
+        logger.info(f'Статус изменения объекта {feature_id} слоя {resource_id} в NextGIS WEB: {r_put.status_code}')
         if r_put.status_code == 200:
             return True
+    except NGWUnavailable:
+        raise
     except Exception as exc:
         logger.critical(f"Ошибка изменения объекта в NextGIS WEB: {exc}")
 
 
+# --- Пакетная запись объектов ---
+@dataclass
+class WriteResult:
+    """ Результат записи одного объекта пакета (index - позиция в переданном наборе) """
+    index: int
+    ok: bool = False
+    feature_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+# Ресурсы, не поддерживающие PATCH набора объектов (ответ 405) - для них сразу одиночные запросы
+_patch_unsupported = set()
+
+
+class _UnknownOutcome(Exception):
+    """ Пакет не подтверждён, но мог быть записан (ответ 5xx) """
+
+
+def _write_batch(resource_id: int, items: list) -> Optional[list]:
+    """ Один PATCH набора объектов: ИД записанных объектов по порядку или None - пакет отклонён
+    и ничего не записано (ответ 4xx, PATCH не поддерживается). Ответ 5xx - исключение _UnknownOutcome,
+    таймаут и ошибка соединения - исключения ngw_request: исход пакета неизвестен """
+    if resource_id in _patch_unsupported:
+        return None
+    request_patch = f'{Config.ngw_host}/api/resource/{resource_id}/feature/'
+    r_patch = ngw_request('patch', request_patch, data=json.dumps(items))
+    if r_patch.status_code == 200:
+        return [item['id'] for item in r_patch.json()]
+    if r_patch.status_code == 405:
+        _patch_unsupported.add(resource_id)
+    if r_patch.status_code >= 500:
+        raise _UnknownOutcome(f'NextGIS WEB ответил {r_patch.status_code}')
+    logger.warning(f'Пакет из {len(items)} объектов слоя {resource_id} не принят: {r_patch.status_code}')
+    return None
+
+
+def _write_one(resource_id: int, item: dict, index: int) -> WriteResult:
+    """ Запись объекта отдельным запросом: PUT при заданном id, иначе POST """
+    try:
+        feature_id = item.get('id')
+        body = {key: value for key, value in item.items() if key != 'id'}
+        if feature_id is None:
+            r = ngw_request('post', f'{Config.ngw_host}/api/resource/{resource_id}/feature/', data=json.dumps(body))
+        else:
+            r = ngw_request('put', f'{Config.ngw_host}/api/resource/{resource_id}/feature/{feature_id}',
+                            data=json.dumps(body))
+        if r.status_code == 200:
+            return WriteResult(index, ok=True, feature_id=r.json().get('id', feature_id))
+        return WriteResult(index, error=f'NextGIS WEB ответил {r.status_code}')
+    except Exception as exc:
+        return WriteResult(index, error=repr(exc))
+
+
+def ngw_write_features(resource_id: int, features: Iterable[dict], batch: int = None,
+                       retries: int = None) -> List[WriteResult]:
+    """ Пакетная запись объектов слоя (ресурса)
+    features - объекты в формате NextGIS WEB: {"id": ИД (только для изменения), "fields": {...},
+               "geom": WKT, "extensions": {"description": ...}}; без id объект создаётся.
+    Объекты передаются пакетами по batch штук одним PATCH набора объектов. Если пакет не принят, объекты
+    пакета пишутся отдельными запросами параллельно (пул executors.ngw_fanout): изменяемые (с id) - PUT,
+    создаваемые - POST. Неудачно записанные изменения повторяются (только они) до retries раз с паузой
+    Config.ngw_batch_backoff * номер повтора - повтор PUT ничего не задваивает.
+    Создаваемые объекты отправляются по одному, только если пакет точно не записан (ответ 4xx, в том числе
+    405 - PATCH не поддерживается), и не повторяются. При неясном исходе пакета (таймаут, 5xx) объекты могли
+    быть созданы - они возвращаются неуспешными, и вызывающий сам решает, проверить ли наличие и создать ли заново.
+    Возвращает результат для каждого объекта в порядке передачи """
+    batch = batch or Config.ngw_batch_size
+    retries = Config.ngw_batch_retries if retries is None else retries
+    items = list(features)
+    results = [WriteResult(index) for index in range(len(items))]
+    pending = list(range(len(items)))
+    started = time.perf_counter()
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(Config.ngw_batch_backoff * attempt)
+        for offset in range(0, len(pending), batch):
+            chunk = pending[offset:offset + batch]
+            rejected = True
+            try:
+                written = _write_batch(resource_id, [items[index] for index in chunk])
+            except Exception as exc:
+                logger.warning(f'Пакет объектов слоя {resource_id} не подтверждён: {exc!r}')
+                written, rejected = None, False
+            if written is not None:
+                for index, feature_id in zip(chunk, written):
+                    results[index] = WriteResult(index, ok=True, feature_id=feature_id)
+                continue
+            single = [index for index in chunk if rejected or items[index].get('id') is not None]
+            for index in chunk:
+                if not rejected and items[index].get('id') is None:
+                    results[index] = WriteResult(index, error='исход пакета неизвестен, объект не создан повторно')
+            for result in executors.ngw_fanout.map(lambda index: _write_one(resource_id, items[index], index),
+                                                   single):
+                results[result.index] = result
+        pending = [index for index in pending if not results[index].ok and items[index].get('id') is not None]
+        if not pending:
+            break
+    failed = sum(not result.ok for result in results)
+    metrics.inc('ngw.batch.written', len(items) - failed)
+    metrics.inc('ngw.batch.failed', failed)
+    logger.info(f'Пакетная запись в слой {resource_id}: {len(items) - failed} из {len(items)} объектов, '
+                f'{time.perf_counter() - started:.1f} с')
+    return results
+
+
+def fetch_feature(resource_id: int, feature_id: int, **kwargs):
+    """ Ответ NextGIS WEB с одним объектом слоя - байты JSON (None при ошибке или отсутствии объекта).
+    Параметры - как у get_feature """
+    try:
+        request_get = f'{Config.ngw_host}/api/resource/{resource_id}/feature/{feature_id}?'
+
+        if isinstance(kwargs.get('geom_format'), str):
+            request_get += f"geom_format={kwargs.get('geom_format')}&"
+        if isinstance(kwargs.get('srs'), str):
+            request_get += f"srs={kwargs.get('srs')}&"
+        if isinstance(kwargs.get('geom'), str):
+            request_get += f"geom={kwargs.get('geom')}&"
+        if isinstance(kwargs.get('dt_format'), str):
+            request_get += f"dt_format={kwargs.get('dt_format')}&"
+
+        r = ngw_request('get', request_get, hedge=True)
+        _read_log.info(f'Статус получения feature из NextGIS WEB: {r.status_code}')
+        if r.status_code == 200:
+            return r.content
+    except NGWUnavailable:
+        raise
+    except Exception as exc:
+        logger.critical(f"Ошибка получения feature из NextGIS WEB: {exc}")
+
+
 def get_feature(resource_id: int, feature_id: int, **kwargs):
     """ Получение одного объекта слоя (ресурса) по его ИД
     Параметры:
@@ -131,9 +446,37 @@ def get_feature(resource_id: int, feature_id: int, **kwargs):
     dt_format   – 'iso' - возвращает дату и время в формате ISO (пример: dt_format='iso')
                   'obj' - возвращает дату и время в виде объекта JSON (по умолчанию: 'obj')
     """
+    content = fetch_feature(resource_id, feature_id, **kwargs)
+    if content is not None:
+        try:
+            return json.loads(content.decode('utf-8'))
+        except Exception as exc:
+            logger.critical(f"Ошибка разбора feature из NextGIS WEB: {exc}")
+
+
+def fetch_features(resource_id: int, **kwargs):
+    """ Ответ NextGIS WEB с набором объектов слоя - байты JSON (None при ошибке).
+    Параметры - как у get_features """
     try:
-        request_get = f'{Config.ngw_host}/api/resource/{resource_id}/feature/{feature_id}?'
+        _read_log.debug(f'Список переменных: {kwargs}')
+        request_get = f'{Config.ngw_host}/api/resource/{resource_id}/feature/?'
 
+        if isinstance(kwargs.get('limit'), int):
+            request_get += f"&limit={kwargs.get('limit')}&"
+        if isinstance(kwargs.get('offset'), int):
+            request_get += f"&offset={kwargs.get('offset')}&"
+        if isinstance(kwargs.get('order_by'), list):
+            request_get += f"order_by={','.join(kwargs.get('order_by'))}&"
+        if isinstance(kwargs.get('intersects'), str):
+            request_get += f"&intersects={kwargs.get('intersects')}&"
+        if isinstance(kwargs.get('fields'), list):
+            request_get += f"fields={','.join(kwargs.get('fields'))}&"
+        if isinstance(kwargs.get('fld_equals'), list):
+            for fld_e in kwargs.get('fld_equals'):
+                request_get += f"{fld_e}&"
+        if isinstance(kwargs.get('fld_filter'), list):
+            for fld_f in kwargs.get('fld_filter'):
+                request_get += f"{fld_f}&"
         if isinstance(kwargs.get('geom_format'), str):
             request_get += f"geom_format={kwargs.get('geom_format')}&"
         if isinstance(kwargs.get('srs'), str):
@@ -142,15 +485,16 @@ def get_feature(resource_id: int, feature_id: int, **kwargs):
             request_get += f"geom={kwargs.get('geom')}&"
         if isinstance(kwargs.get('dt_format'), str):
             request_get += f"dt_format={kwargs.get('dt_format')}&"
+        if isinstance(kwargs.get('extensions'), str):
+            request_get += f"extensions={kwargs.get('extensions')}&"
 
-        r = requests.get(request_get, auth=(Config.ngw_user, Config.ngw_password))
-        logger.info(f'Статус получения feature из NextGIS WEB: {r.status_code}')
+        r = ngw_request('get', request_get)
         if r.status_code == 200:
-            logger.debug(r.text)
-            content = json.loads(r.content.decode('utf-8'))
-            return content
+            return r.content
+    except NGWUnavailable:
+        raise
     except Exception as exc:
-        logger.critical(f"Ошибка получения feature из NextGIS WEB: {exc}")
+        logger.critical(f"Ошибка получения набора features из NextGIS WEB: {exc}")
 
 
 def get_features(resource_id: int, **kwargs):
@@ -201,40 +545,43 @@ def get_features(resource_id: int, **kwargs):
         Для фильтрации части поля используйте знак процента. Может быть в начале строки, в конце или в обоих вариантах.
         Работает только для операций like и ilike.
     """
-    try:
-        logger.info(f'Список переменных: {kwargs}')
-        request_get = f'{Config.ngw_host}/api/resource/{resource_id}/feature/?'
+    content = fetch_features(resource_id, **kwargs)
+    if content is not None:
+        try:
+            return json.loads(content.decode('utf-8'))
+        except Exception as exc:
+            logger.critical(f"Ошибка разбора набора features из NextGIS WEB: {exc}")
 
-        if isinstance(kwargs.get('limit'), int):
-            request_get += f"&limit={kwargs.get('limit')}&"
-        if isinstance(kwargs.get('offset'), int):
-            request_get += f"&offset={kwargs.get('offset')}&"
-        if isinstance(kwargs.get('order_by'), list):
-            request_get += f"order_by={','.join(kwargs.get('order_by'))}&"
-        if isinstance(kwargs.get('intersects'), str):
-            request_get += f"&intersects={kwargs.get('intersects')}&"
-        if isinstance(kwargs.get('fields'), list):
-            request_get += f"fields={','.join(kwargs.get('fields'))}&"
-        if isinstance(kwargs.get('fld_equals'), list):
-            for fld_e in kwargs.get('fld_equals'):
-                request_get += f"{fld_e}&"
-        if isinstance(kwargs.get('fld_filter'), list):
-            for fld_f in kwargs.get('fld_filter'):
-                request_get += f"{fld_f}&"
-        if isinstance(kwargs.get('geom_format'), str):
-            request_get += f"geom_format={kwargs.get('geom_format')}&"
-        if isinstance(kwargs.get('srs'), str):
-            request_get += f"srs={kwargs.get('srs')}&"
-        if isinstance(kwargs.get('geom'), str):
-            request_get += f"geom={kwargs.get('geom')}&"
-        if isinstance(kwargs.get('dt_format'), str):
-            request_get += f"dt_format={kwargs.get('dt_format')}&"
-        if isinstance(kwargs.get('extensions'), str):
-            request_get += f"extensions={kwargs.get('extensions')}&"
 
-        r = requests.get(request_get, auth=(Config.ngw_user, Config.ngw_password))
-        if r.status_code == 200:
-            content = json.loads(r.content.decode('utf-8'))
-            return content
-    except Exception as exc:
-        logger.critical(f"Ошибка получения набора features из NextGIS WEB: {exc}")
+# --- Типизированные объекты (models.py): разбор сразу из байтов, проверка схемы ---
+def get_water_source(feature_id: int) -> Optional[WaterSource]:
+    """ Водоисточник по ИД (без геометрии) или None, если не найден.
+    При несоответствии ответа схеме - исключение SchemaError """
+    content = fetch_feature(Config.ngw_resource_wi_points, feature_id, geom='no')
+    return models.decode(WaterSource, content) if content is not None else None
+
+
+def get_organization(feature_id: int) -> Optional[Organization]:
+    """ Хозяйствующий субъект по ИД или None """
+    if feature_id is None:
+        return None
+    content = fetch_feature(Config.ngw_resource_organization, feature_id, geom='no')
+    return models.decode(Organization, content) if content is not None else None
+
+
+def get_water_sources(**kwargs) -> List[WaterSource]:
+    """ Набор водоисточников. Параметры - как у get_features (поле fields не задавать: нужны все поля) """
+    content = fetch_features(Config.ngw_resource_wi_points, **kwargs)
+    return models.decode(WaterSource, content, many=True) if content is not None else []
+
+
+def get_checkups(**kwargs) -> List[Checkup]:
+    """ Набор записей о проверках. Параметры - как у get_features """
+    content = fetch_features(Config.ngw_resource_wi_checkup, **kwargs)
+    return models.decode(Checkup, content, many=True) if content is not None else []
+
+
+def get_organizations(**kwargs) -> List[Organization]:
+    """ Набор хозяйствующих субъектов. Параметры - как у get_features """
+    content = fetch_features(Config.ngw_resource_organization, **kwargs)
+    return models.decode(Organization, content, many=True) if content is not None else []
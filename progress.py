@@ -0,0 +1,75 @@
+""" Сообщение о ходе выполнения длительной операции
+ProgressReporter объединяет частые обновления текста в редкие правки сообщения Telegram:
+ - не чаще одной правки в Config.progress_interval секунд на чат (общий учёт для всех операций чата)
+ - правка выполняется в фоновой задаче, этапы операции не ждут ответа Telegram
+ - промежуточные состояния, не успевшие уйти, пропускаются - отправляется только последнее
+ - при TelegramRetryAfter правка откладывается на указанное Telegram время
+ - flush() дожидается отправки итогового состояния
+"""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from loguru import logger
+
+import metrics
+from config import Config
+
+# Время последней правки по ИД чата - ограничение действует на все сообщения чата
+_last_edit = {}
+
+
+class ProgressReporter:
+    def __init__(self, message: Message, text: str, interval: float = None):
+        self.message = message
+        self.text = text
+        self.interval = Config.progress_interval if interval is None else interval
+        self._sent = text
+        self._task = None
+
+    @property
+    def chat_id(self):
+        return self.message.chat.id if self.message else None
+
+    def update(self, text: str):
+        """ Задать новый текст. Правка сообщения будет выполнена в фоне """
+        self.text = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker())
+
+    def append(self, line: str):
+        """ Добавить строку к тексту сообщения """
+        self.update(f'{self.text}\n{line}')
+
+    async def flush(self):
+        """ Дождаться отправки последнего заданного текста """
+        while self._task is not None and not self._task.done():
+            await self._task
+        if self._sent != self.text:
+            self._task = asyncio.create_task(self._worker())
+            await self._task
+
+    async def _worker(self):
+        while self._sent != self.text:
+            delay = _last_edit.get(self.chat_id, 0) + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = self.text
+            try:
+                _last_edit[self.chat_id] = time.monotonic()
+                await self.message.edit_text(text)
+                metrics.inc('progress.edits')
+            except TelegramRetryAfter as exc:
+                metrics.inc('progress.retry_after')
+                logger.warning(f'Ограничение правок в чате {self.chat_id}: повтор через {exc.retry_after} с')
+                _last_edit[self.chat_id] = time.monotonic() + exc.retry_after
+                continue
+            except TelegramBadRequest as exc:
+                # "message is not modified" и т.п. - повторять бессмысленно
+                logger.debug(f'Правка сообщения о ходе выполнения отклонена: {exc.message}')
+            except Exception as exc:
+                logger.warning(f'Ошибка правки сообщения о ходе выполнения: {exc!r}')
+                self._sent = self.text
+                return
+            self._sent = text
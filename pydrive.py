@@ -1,26 +1,52 @@
 """ Модуль для работы с сервисом Google Drive
 Документация PyDrive2: https://docs.iterative.ai/PyDrive2/
+При заданном Config.drive_api_url вместо PyDrive2 используются прямые HTTP запросы
+к совместимому с Drive API v2 сервису (например, поддельному из fakes/drive.py)
 """
+import threading
 import requests
 from io import BytesIO
-from pydrive2.auth import GoogleAuth
-from pydrive2.drive import GoogleDrive
+from config import Config
+
+# PyDrive2 и клиент Google API тяжёлые: загружаются при первом обращении к Google Drive (_load_pydrive2)
+GoogleAuth = None
+GoogleDrive = None
+
+
+def _load_pydrive2():
+    global GoogleAuth, GoogleDrive
+    if GoogleAuth is None:
+        from pydrive2.auth import GoogleAuth
+    if GoogleDrive is None:
+        from pydrive2.drive import GoogleDrive
+
+
+# Действующая авторизация сервисного аккаунта (переиспользуется до истечения токена) - общая для потоков
+# пула drive; HTTP-соединение у каждого потока своё (PyDrive2 хранит его в GoogleAuth.thread_local)
+_gauth = None
+_gauth_lock = threading.Lock()
 
 
 def login_with_service_account():
     """ Подключение к сервису Google Drive с сервисным аккаунтом.
     Примечание: для работы сервисного аккаунта вам необходимо предоставить
     доступ к папке или файлам указав электронную почту сервисного аккаунта """
-    settings = {
-                "client_config_backend": "service",
-                "service_config": {
-                    "client_json_file_path": "service-secrets.json",
+    global _gauth
+    with _gauth_lock:
+        if _gauth is not None and _gauth.access_token_expired is False:
+            return _gauth
+        settings = {
+                    "client_config_backend": "service",
+                    "service_config": {
+                        "client_json_file_path": "service-secrets.json",
+                        }
                     }
-                }
-    # Создание экземпляра GoogleAuth и аутентификация
-    gauth = GoogleAuth(settings=settings)
-    gauth.ServiceAuth()
-    return gauth
+        # Создание экземпляра GoogleAuth и аутентификация
+        _load_pydrive2()
+        gauth = GoogleAuth(settings=settings)
+        gauth.ServiceAuth()
+        _gauth = gauth
+        return gauth
 
 
 def create_folder(file_id=None, file_name='Не указано', parent_folder='root'):
@@ -34,6 +60,9 @@ def create_folder(file_id=None, file_name='Не указано', parent_folder='
     :param parent_folder: Родительский каталог (папка)
     :return: Возвращает ИД папки
     """
+    if Config.drive_api_url:
+        return _api_create_folder(file_id, file_name, parent_folder)
+    _load_pydrive2()
     drive = GoogleDrive(login_with_service_account())
     metadata = {
         'parents': [
@@ -54,6 +83,9 @@ def create_folder(file_id=None, file_name='Не указано', parent_folder='
 
 
 def create_file_from_url(file_url, file_name='Не указано', parent_folder='root'):
+    if Config.drive_api_url:
+        return _api_create_file_from_url(file_url, file_name, parent_folder)
+    _load_pydrive2()
     drive = GoogleDrive(login_with_service_account())
     metadata = {
         'parents': [
@@ -72,7 +104,26 @@ def create_file_from_url(file_url, file_name='Не указано', parent_folde
     new_file.Upload()
 
 
+def create_file_from_path(file_path, file_name='Не указано', parent_folder='root'):
+    """ Загрузка снимка, заранее скачанного на диск (staging.py) """
+    if Config.drive_api_url:
+        return _api_create_file_from_path(file_path, file_name, parent_folder)
+    _load_pydrive2()
+    drive = GoogleDrive(login_with_service_account())
+    metadata = {
+        'parents': [
+            {"id": parent_folder}
+        ],
+        'title': file_name,
+        'mimeType': 'image/jpeg'
+    }
+    new_file = drive.CreateFile(metadata=metadata)
+    new_file.SetContentFile(file_path)
+    new_file.Upload()
+
+
 def find_folder(find_name=None, parent_folder='root'):
+    _load_pydrive2()
     drive = GoogleDrive(login_with_service_account())
     query = {'q': f"'{parent_folder}' in parents"}
     # query = {'q': f"title contains '{find_name}'"}
@@ -80,3 +131,35 @@ def find_folder(find_name=None, parent_folder='root'):
     for file1 in file_list:
         print(f"title: {file1['title']}, id: {file1['id']}")
     return True
+
+
+# --- Прямые HTTP запросы к совместимому с Drive API v2 сервису (Config.drive_api_url) ---
+def _api_create_folder(file_id=None, file_name='Не указано', parent_folder='root'):
+    metadata = {'title': file_name, 'parents': [{'id': parent_folder}],
+                'mimeType': 'application/vnd.google-apps.folder'}
+    if file_id:
+        r = requests.put(f'{Config.drive_api_url}/drive/v2/files/{file_id}', json=metadata, timeout=30)
+        if r.status_code == 200 and not r.json()['labels']['trashed']:
+            return file_id
+        if r.status_code not in (200, 404):
+            r.raise_for_status()
+    r = requests.post(f'{Config.drive_api_url}/drive/v2/files', json=metadata, timeout=30)
+    r.raise_for_status()
+    return r.json()['id']
+
+
+def _api_create_file_from_url(file_url, file_name='Не указано', parent_folder='root'):
+    response = requests.get(file_url, timeout=60)
+    response.raise_for_status()
+    r = requests.post(f'{Config.drive_api_url}/upload/drive/v2/files',
+                      params={'title': file_name, 'parent': parent_folder, 'mimeType': 'image/jpeg'},
+                      data=response.content, timeout=60)
+    r.raise_for_status()
+
+
+def _api_create_file_from_path(file_path, file_name='Не указано', parent_folder='root'):
+    with open(file_path, 'rb') as file:
+        r = requests.post(f'{Config.drive_api_url}/upload/drive/v2/files',
+                          params={'title': file_name, 'parent': parent_folder, 'mimeType': 'image/jpeg'},
+                          data=file, timeout=60)
+    r.raise_for_status()
@@ -0,0 +1,250 @@
+""" Запись и воспроизведение входящих обновлений Telegram
+Запись (включается переменной окружения RECORD_UPDATES=logs/updates.jsonl.gz): каждое обновление,
+поступившее в диспетчер, обезличивается и дописывается в журнал вместе со временем поступления.
+Обезличивание: ИД пользователей и чатов заменяются псевдонимами (HMAC с солью RECORD_SALT),
+имена удаляются, ИД файлов хэшируются, произвольный текст и текст inline-запросов заменяются звёздочками
+(команды, числовые ИД и данные кнопок сохраняются - они нужны для воспроизведения сценария).
+
+Воспроизведение через настоящий Dispatcher на поддельных сервисах (fakes) в 1× или N× темпе:
+    python replay.py run logs/updates.jsonl.gz --speed 10 --output run_a.json
+Сравнение двух прогонов (задержки и доля ошибок по шагам):
+    python replay.py compare run_a.json run_b.json
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import time
+from collections import defaultdict
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Update
+from loguru import logger
+
+from config import Config
+from loadtest import Results, feed, format_report
+
+_KEEP_TEXT = re.compile(r'^(/\w+(\s+\d+)?|\d+)$')
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode, encoding='utf-8') if path.endswith('.gz') else open(path, mode, encoding='utf-8')
+
+
+# --- Запись ---
+class Anonymizer:
+    def __init__(self, salt: str):
+        self.salt = salt.encode()
+
+    def pseudonym(self, value: int) -> int:
+        """ Стабильный псевдоним ИД пользователя/чата (знак сохраняется: каналы и группы отрицательные) """
+        digest = hmac.new(self.salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        alias = int.from_bytes(digest[:4], 'big') % 2_000_000_000 + 1
+        return -alias if value < 0 else alias
+
+    def token(self, value: str) -> str:
+        return hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()[:24]
+
+    def __call__(self, data):
+        if isinstance(data, list):
+            return [self(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        # Пользователь (User) или чат (Chat) - их ИД и имена заменяются
+        is_user = 'is_bot' in data
+        is_chat = 'type' in data and isinstance(data.get('id'), int)
+        result = {}
+        for key, value in data.items():
+            if key in ('first_name', 'last_name', 'username', 'title', 'caption', 'caption_entities'):
+                continue
+            if key == 'id' and (is_user or is_chat):
+                result[key] = self.pseudonym(value)
+            elif key in ('file_id', 'file_unique_id') and isinstance(value, str):
+                result[key] = self.token(value)
+            elif key == 'text' and isinstance(value, str) and not _KEEP_TEXT.match(value):
+                result[key] = '*' * len(value)
+            elif key == 'query' and isinstance(value, str):
+                # Текст inline-запроса (поиск водоисточника) - адреса и названия
+                result[key] = '*' * len(value)
+            elif key == 'entities' and isinstance(data.get('text'), str) and not _KEEP_TEXT.match(data['text']):
+                continue
+            elif key == 'location' and isinstance(value, dict):
+                result[key] = {name: round(number, 5) if isinstance(number, float) else number
+                               for name, number in value.items()}
+            else:
+                result[key] = self(value)
+        if is_user or (is_chat and result['type'] == 'private'):
+            result['first_name'] = 'Inspector'
+        elif is_chat:
+            result['title'] = 'Чат'
+        return result
+
+
+class UpdateRecorder(BaseMiddleware):
+    """ Внешний middleware диспетчера: обезличенная запись каждого обновления в журнал """
+
+    def __init__(self, path: str, salt: str = None):
+        self.path = path
+        self.anonymize = Anonymizer(salt or Config.record_salt or secrets.token_hex(16))
+        self._file = None
+        self._flushed_at = 0.0
+
+    def write(self, update: Update):
+        try:
+            if self._file is None:
+                self._file = _open(self.path, 'at')
+            record = {'t': round(time.time(), 3),
+                      'u': self.anonymize(update.model_dump(mode='json', by_alias=True, exclude_none=True))}
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            # Сброс на диск не чаще раза в Config.record_flush_interval секунд: сброс gzip после
+            # каждой записи завершает блок сжатия и увеличивает журнал
+            if time.monotonic() - self._flushed_at >= Config.record_flush_interval:
+                self._file.flush()
+                self._flushed_at = time.monotonic()
+        except Exception as exc:
+            logger.error(f'Ошибка записи обновления в {self.path}: {exc}')
+
+    async def __call__(self, handler, event, data):
+        self.write(event)
+        return await handler(event, data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load(path: str) -> list:
+    with _open(path, 'rt') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+# --- Воспроизведение ---
+def _user_id(update: dict):
+    for kind in ('message', 'callback_query', 'edited_message', 'inline_query'):
+        if kind in update:
+            return update[kind]['from']['id'] if 'from' in update[kind] else update[kind]['chat']['id']
+    return None
+
+
+def _step(update: dict, state: str) -> str:
+    """ Имя шага для отчёта: команда или состояние FSM, в котором пришло обновление """
+    text = update.get('message', {}).get('text', '')
+    if text.startswith('/'):
+        return text.split()[0]
+    return (state or 'None').replace('BotStates:', '')
+
+
+def max_fid(records: list) -> int:
+    """ Наибольший числовой ИД водоисточника в журнале - столько объектов создаёт поддельный NextGIS """
+    fids = [int(number) for record in records
+            for number in re.findall(r'\d+', record['u'].get('message', {}).get('text', '') or '')]
+    return max(fids, default=0)
+
+
+async def replay(records: list, speed: float = 1.0) -> dict:
+    """ Воспроизвести журнал через настоящий Dispatcher. speed=0 - без пауз.
+    Порядок обновлений каждого пользователя сохраняется """
+    import main  # Импорт после настройки Config: роутеры бота подключаются к одному диспетчеру
+    from loadtest import LOADTEST_TOKEN
+
+    bot = main.create_bot(LOADTEST_TOKEN)
+    dp = main.create_dispatcher()
+    results = Results()
+    per_user = defaultdict(list)
+    for record in records:
+        per_user[_user_id(record['u'])].append(record)
+    origin = records[0]['t'] if records else 0
+    started = time.perf_counter()
+
+    async def play(user_records: list):
+        for record in user_records:
+            if speed:
+                delay = (record['t'] - origin) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = record['u']
+            user_id = _user_id(update)
+            key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+            step = _step(update, await dp.storage.get_state(key)) if user_id else 'other'
+            results.updates += 1
+            try:
+                results.latency[step].append(await feed(dp, bot, update))
+            except Exception as exc:
+                results.errors[step] += 1
+                results.latency[step].append(0.0)
+                logger.warning(f'Ошибка обработки обновления {update["update_id"]}: {exc!r}')
+            if step == '/save':
+                results.surveys += 1
+
+    try:
+        await asyncio.gather(*(play(user_records) for user_records in per_user.values()))
+        results.finished = time.perf_counter()
+    finally:
+        await bot.session.close()
+    return results.report()
+
+
+def compare(first: dict, second: dict) -> str:
+    """ Разница задержек и ошибок по шагам между двумя прогонами """
+    lines = [f"{'Шаг':16} {'p50 A':>9} {'p50 B':>9} {'Δ p50':>8} {'p95 A':>9} {'p95 B':>9} {'Δ p95':>8} "
+             f"{'ошибок A':>9} {'ошибок B':>9}"]
+    for step in sorted(set(first['steps']) | set(second['steps'])):
+        a = first['steps'].get(step, {})
+        b = second['steps'].get(step, {})
+
+        def change(key):
+            if not a.get(key):
+                return '—'
+            return f"{(b.get(key, 0) - a[key]) / a[key] * 100:+.0f}%"
+
+        lines.append(f"{step:16} {a.get('p50', 0):9.1f} {b.get('p50', 0):9.1f} {change('p50'):>8} "
+                     f"{a.get('p95', 0):9.1f} {b.get('p95', 0):9.1f} {change('p95'):>8} "
+                     f"{a.get('errors', 0):9d} {b.get('errors', 0):9d}")
+    lines.append(f"Доля ошибок: {first['error_rate'] * 100:.2f} % -> {second['error_rate'] * 100:.2f} %, "
+                 f"обновлений/с: {first['updates_per_s']} -> {second['updates_per_s']}")
+    return '\n'.join(lines)
+
+
+async def run_against_fakes(path: str, speed: float) -> dict:
+    from fakes import run as fakes
+
+    records = load(path)
+    services = await fakes.start(sources=max(2000, max_fid(records)))
+    Config.ngw_host = services.ngw_url
+    Config.drive_api_url = services.drive_url
+    Config.tg_api_server = services.telegram_url
+    try:
+        return await replay(records, speed)
+    finally:
+        await services.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Воспроизведение записанных обновлений Telegram')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Воспроизвести журнал на поддельных сервисах')
+    run_parser.add_argument('path', help='Журнал обновлений (.jsonl или .jsonl.gz)')
+    run_parser.add_argument('--speed', type=float, default=1.0, help='Темп воспроизведения (0 - без пауз)')
+    run_parser.add_argument('--output', help='Файл для результатов в JSON')
+    compare_parser = commands.add_parser('compare', help='Сравнить результаты двух прогонов')
+    compare_parser.add_argument('first')
+    compare_parser.add_argument('second')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        logger.remove()
+        logger.add(lambda text: print(text, end=''), level='WARNING')
+        result = asyncio.run(run_against_fakes(args.path, args.speed))
+        print(format_report(result))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+    else:
+        with open(args.first, encoding='utf-8') as first, open(args.second, encoding='utf-8') as second:
+            print(compare(json.load(first), json.load(second)))
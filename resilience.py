@@ -0,0 +1,105 @@
+""" Защита от сбоев внешних сервисов
+CircuitBreaker - автоматический выключатель: после серии отказов подряд перестаёт пропускать вызовы
+(состояние open) и сразу сообщает о недоступности сервиса. Через reset_timeout секунд пропускает
+один пробный вызов (half_open): успех замыкает цепь (closed), отказ снова размыкает её.
+
+hedged - "страхующий" повтор чтения: если первый запрос не ответил за delay секунд,
+параллельно отправляется второй такой же, используется ответ, пришедший первым. Пара запросов -
+одно обращение к сервису: отказ учитывается выключателем один раз (см. nextgis._request).
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from loguru import logger
+
+import executors
+import metrics
+
+
+class ServiceUnavailable(Exception):
+    """ Внешний сервис недоступен (отказы, таймауты или разомкнут автоматический выключатель) """
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe = False
+        metrics.gauge(f'{name}.breaker', lambda: self.state)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """ Можно ли выполнить вызов. В состоянии half_open пропускается один пробный вызов """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe:
+                metrics.inc(f'{self.name}.rejected')
+                return False
+            self._probe = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f'Сервис {self.name} снова доступен')
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            metrics.inc(f'{self.name}.failures')
+            if self._probe or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN or self._probe:
+                    logger.error(f'Сервис {self.name} недоступен: выключатель разомкнут на {self.reset_timeout} с')
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe = False
+
+
+def hedged(func, delay: float, *args, **kwargs):
+    """ Выполнить чтение func(*args, **kwargs) со страхующим повтором через delay секунд (в пуле executors.hedge).
+    Возвращается первый успешный результат; если оба вызова завершились ошибкой - её исключение.
+    Ошибка первого вызова до истечения delay - не задержка: повтор не отправляется.
+    Если пул заполнен, чтение выполняется без страхующего повтора """
+    try:
+        first = executors.hedge.submit(func, *args, **kwargs)
+    except executors.ExecutorSaturated:
+        return func(*args, **kwargs)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    try:
+        second = executors.hedge.submit(func, *args, **kwargs)
+    except executors.ExecutorSaturated:
+        return first.result()
+    metrics.inc('hedge.sent')
+    futures = [first, second]
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                if future is second:
+                    metrics.inc('hedge.won')
+                return future.result()
+            if not futures:
+                raise future.exception()
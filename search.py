@@ -0,0 +1,156 @@
+""" Локальный текстовый индекс водоисточников для inline-поиска (@bot Ленина 12)
+Индексируются поля name, Поселение, Улица, Дом, Ориентир снимка слоя (snapshot.py); индекс строится
+при запуске и поддерживается событиями синхронизации (sync.py) - без запросов ilike к NextGIS WEB.
+Поиск слов запроса:
+ - по префиксу: двоичный поиск в отсортированном словаре слов ("лен" -> "ленина");
+ - при отсутствии префиксных совпадений - по триграммам (опечатки: "ленена" -> "ленина").
+Водоисточник должен содержать все слова запроса; ранжирование - по весу поля (наименование и улица
+важнее ориентира) и точности совпадения (слово целиком > префикс > триграммы).
+"""
+import bisect
+import re
+import time
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+from loguru import logger
+
+import executors
+import metrics
+import snapshot
+import sync
+from models import WaterSource
+
+# Поле модели -> вес совпадения в нём
+_WEIGHTS = {'name': 3.0, 'street': 2.0, 'building': 2.0, 'locality': 1.0, 'landmark': 1.0}
+_WORD = re.compile(r'\w+')
+_EXACT, _PREFIX, _FUZZY = 2.0, 1.0, 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower().replace('ё', 'е')) if text else []
+
+
+def _trigrams(word: str) -> set:
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)  # слово -> {ИД: вес поля}
+        self.documents = {}                 # ИД -> слова документа (для удаления)
+        self.grams = defaultdict(set)       # триграмма -> слова
+        self._vocabulary = []
+        self._dirty = False
+
+    @classmethod
+    def build(cls, sources: Iterable[WaterSource]) -> 'SearchIndex':
+        index = cls()
+        for source in sources:
+            index.add(source)
+        return index
+
+    def add(self, source: WaterSource):
+        if source.id in self.documents:
+            self.remove(source.id)
+        words = set()
+        for name, weight in _WEIGHTS.items():
+            for word in tokenize(getattr(source.fields, name)):
+                posting = self.postings[word]
+                if not posting:
+                    self._dirty = True
+                    for gram in _trigrams(word):
+                        self.grams[gram].add(word)
+                posting[source.id] = max(posting.get(source.id, 0.0), weight)
+                words.add(word)
+        self.documents[source.id] = words
+
+    def remove(self, feature_id: int):
+        for word in self.documents.pop(feature_id, ()):
+            posting = self.postings[word]
+            posting.pop(feature_id, None)
+            if not posting:
+                del self.postings[word]
+                for gram in _trigrams(word):
+                    self.grams[gram].discard(word)
+                self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def vocabulary(self) -> List[str]:
+        if self._dirty:
+            self._vocabulary = sorted(self.postings)
+            self._dirty = False
+        return self._vocabulary
+
+    def _matches(self, term: str) -> List[Tuple[str, float]]:
+        """ Слова словаря, подходящие к слову запроса, с коэффициентом точности """
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, term)
+        end = bisect.bisect_left(vocabulary, term + '\uffff', start)
+        matches = [(word, _EXACT if word == term else _PREFIX) for word in vocabulary[start:end]]
+        if matches or len(term) < 3:
+            return matches
+        grams = _trigrams(term)
+        counts = defaultdict(int)
+        for gram in grams:
+            for word in self.grams.get(gram, ()):
+                counts[word] += 1
+        return [(word, _FUZZY * count / len(grams)) for word, count in counts.items()
+                if count / len(grams | _trigrams(word)) >= 0.3]
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[int, float]]:
+        """ ИД найденных водоисточников с оценкой, лучшие первыми """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for word, accuracy in self._matches(term):
+                for feature_id, weight in self.postings[word].items():
+                    term_scores[feature_id] = max(term_scores[feature_id], weight * accuracy)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {feature_id: score + term_scores[feature_id]
+                          for feature_id, score in scores.items() if feature_id in term_scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+# Действующий индекс (строится по снимку слоя при запуске, см. rebuild)
+index = SearchIndex()
+
+
+def search(query: str, limit: int = 20) -> List[WaterSource]:
+    started = time.perf_counter()
+    sources = [source for source in (snapshot.layer.get(feature_id) for feature_id, _ in index.search(query, limit))
+               if source is not None]
+    metrics.observe('search.latency_ms', (time.perf_counter() - started) * 1000)
+    return sources
+
+
+async def rebuild():
+    global index
+    started = time.perf_counter()
+    index = await executors.cpu.run(SearchIndex.build, snapshot.layer)
+    logger.info(f'Поисковый индекс построен: {len(index)} водоисточников, '
+                f'{(time.perf_counter() - started) * 1000:.0f} мс')
+
+
+@sync.subscribe
+async def _on_change(change: sync.Change):
+    if change.resource != sync.SOURCES:
+        return
+    if change.reloaded:
+        await rebuild()
+        return
+    for source in change.changed:
+        index.add(source)
+    for feature_id in change.deleted:
+        index.remove(feature_id)
@@ -0,0 +1,141 @@
+""" Срок жизни незавершённых опросов
+Опрос, брошенный на середине (например, инспектор уехал на вызов после шага 8), иначе хранил бы данные
+FSM (название, дату, координаты, ИД снимков) до /stop или /save. Время последнего действия пользователя
+отмечает middleware touch; фоновая задача sweeper раз в Config.session_sweep_interval секунд:
+ - сбрасывает опросы без действий дольше срока их состояния (Config.session_ttl, например
+   "*=7200,save=86400" - секунд для всех состояний и для состояния save) и удаляет скачанные заранее
+   снимки опроса (staging.py); пользователю приходит сообщение. Сессии с завершёнными опросами в очереди
+   (/next) не сбрасываются: пользователю один раз напоминается о несохранённых опросах;
+ - за Config.session_reminder секунд до сброса напоминает пользователю о незавершённом опросе;
+ - удаляет из MemoryStorage пустые записи завершённых опросов и снимки staging старше наибольшего срока.
+Выполняющиеся сохранения (shutdown.py) не сбрасываются.
+Показатели: sessions.active, sessions.expired, sessions.reminded.
+"""
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from loguru import logger
+
+import metrics
+import shutdown
+import staging
+from config import Config
+from handlers.survey_handlers import PHOTO_KEYS, session_items
+from logsetup import parse_rates
+
+# Время последнего действия: ключ FSM -> time.monotonic()
+_activity = {}
+# Опросы, о сбросе которых пользователь уже предупреждён
+_reminded = set()
+
+
+def ttl(state: str) -> float:
+    """ Срок жизни опроса в состоянии state ("BotStates:fid"), секунд; 0 - без срока """
+    ttls = parse_rates(Config.session_ttl)
+    return ttls.get(state.rpartition(':')[2], ttls.get('*', 0))
+
+
+def touched(key: StorageKey):
+    _activity[key] = time.monotonic()
+    _reminded.discard(key)
+
+
+async def touch(handler, event, data):
+    """ Outer middleware сообщений и нажатий кнопок: отметка активности пользователя """
+    state = data.get('state')
+    if state is not None:
+        touched(state.key)
+    return await handler(event, data)
+
+
+async def _notify(bot, key: StorageKey, text: str):
+    try:
+        await bot.send_message(key.chat_id, text)
+    except Exception as exc:
+        logger.warning(f'Не удалось уведомить пользователя {key.user_id}: {exc!r}')
+
+
+async def expire(bot, storage, key: StorageKey, data: dict):
+    """ Сбросить опрос и удалить его снимки staging """
+    staging.discard(item[photo] for item in session_items(data) for photo in PHOTO_KEYS if item.get(photo))
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    getattr(storage, 'storage', {}).pop(key, None)
+    _activity.pop(key, None)
+    _reminded.discard(key)
+    metrics.inc('sessions.expired')
+    fids = ', '.join(str(item['fid']) for item in session_items(data))
+    await _notify(bot, key, f"<i>Опрос ИД {fids} сброшен: нет ответа в течение долгого времени.\n"
+                            f"Для нового опроса введите /start</i>")
+
+
+async def sweep(bot, storage) -> int:
+    """ Один проход: напоминания, сброс просроченных опросов, очистка. Возвращает количество сброшенных """
+    now = time.monotonic()
+    records = getattr(storage, 'storage', None)
+    if records is not None:
+        for key, record in list(records.items()):
+            if record.state is None and not record.data:
+                # Завершённый опрос (/stop, /save) - пустая запись
+                records.pop(key, None)
+                _activity.pop(key, None)
+            elif key not in _activity:
+                # Состояние восстановлено после перезапуска (shutdown.restore) - срок с момента запуска
+                _activity[key] = now
+    saving = {state.key for state in shutdown._saves.values()}
+    expired = 0
+    for key, last in list(_activity.items()):
+        state = await storage.get_state(key)
+        if state is None:
+            _activity.pop(key, None)
+            _reminded.discard(key)
+            continue
+        limit = ttl(state)
+        if not limit or key in saving:
+            continue
+        idle = now - last
+        remind = Config.session_reminder and idle >= limit - Config.session_reminder
+        if idle < limit and not remind:
+            continue
+        data = await storage.get_data(key)
+        if data.get('queue'):
+            # Завершённые опросы из очереди /next не сбрасываются - напоминание после срока
+            if idle >= limit and key not in _reminded:
+                _reminded.add(key)
+                metrics.inc('sessions.reminded')
+                fids = ', '.join(str(item['fid']) for item in data['queue'])
+                await _notify(bot, key, f"<i>Не сохранены завершённые опросы (ИД {fids}). Данные не удалены: "
+                                        f"введите /save для сохранения или /stop для отмены.</i>")
+            continue
+        if idle >= limit:
+            await expire(bot, storage, key, data)
+            expired += 1
+        elif key not in _reminded:
+            _reminded.add(key)
+            metrics.inc('sessions.reminded')
+            await _notify(bot, key, f"<i>Опрос не завершён и будет сброшен через "
+                                    f"{max(1, round((limit - idle) / 60))} мин. Продолжите опрос, "
+                                    f"/save для сохранения или /stop для отмены.</i>")
+    ttls = parse_rates(Config.session_ttl)
+    if ttls and all(ttls.values()):
+        staging.sweep(max(ttls.values()))
+    if expired:
+        logger.info(f'Сброшено незавершённых опросов: {expired}')
+    return expired
+
+
+async def sweeper(bot, storage):
+    """ Фоновая проверка сроков опросов каждые Config.session_sweep_interval секунд """
+    while True:
+        await asyncio.sleep(Config.session_sweep_interval)
+        try:
+            await sweep(bot, storage)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning(f'Проверка сроков опросов не выполнена: {exc!r}')
+
+
+metrics.gauge('sessions.active', lambda: len(_activity))
+metrics.gauge('sessions.expired', lambda: metrics.counter('sessions.expired'))
@@ -0,0 +1,122 @@
+""" Согласованное завершение бота (SIGTERM/SIGINT)
+1. aiogram прекращает получение обновлений (start_polling обрабатывает сигналы);
+2. начатые сохранения (/save) дожидаются завершения не дольше Config.shutdown_timeout секунд;
+3. незавершённые сохранения отменяются, их данные опроса (состояние FSM) записываются в
+   Config.pending_saves_file. При следующем запуске состояние восстанавливается (restore), пользователю
+   приходит сообщение с предложением повторить /save. Уже переданные снимки и запись о проверке
+   отмечены в данных опроса и повторно не передаются (см. handlers/survey_handlers.py);
+4. останавливаются фоновые задачи, заполняется поле id созданных проверок (nextgis.backfill_checkup_ids),
+   останавливаются пулы потоков (выполняющиеся запросы дожидаются в пределах срока),
+   закрываются HTTP сервер проверок состояния и сессия бота.
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from loguru import logger
+
+import executors
+import metrics
+import nextgis
+from config import Config
+from states import BotStates
+
+# Бот завершает работу: новые сохранения не начинаются
+stopping = False
+# Выполняющиеся сохранения: задача -> состояние FSM пользователя
+_saves = {}
+
+
+@contextmanager
+def tracking(state: FSMContext):
+    """ Учёт выполняющегося сохранения в текущей задаче """
+    task = asyncio.current_task()
+    _saves[task] = state
+    try:
+        yield
+    finally:
+        _saves.pop(task, None)
+
+
+def in_flight() -> int:
+    return len(_saves)
+
+
+async def drain(timeout: float = None, path: str = None) -> int:
+    """ Дождаться начатых сохранений; незавершённые к сроку - записать в файл и отменить.
+    Возвращает количество записанных """
+    global stopping
+    stopping = True
+    timeout = Config.shutdown_timeout if timeout is None else timeout
+    if not _saves:
+        return 0
+    logger.info(f'Завершение: ожидание {len(_saves)} сохранений (не дольше {timeout:.0f} с)')
+    _, unfinished = await asyncio.wait(list(_saves), timeout=timeout)
+    records = []
+    for task in unfinished:
+        state = _saves.get(task)
+        if state is None:
+            continue
+        key = state.key
+        records.append({'bot_id': key.bot_id, 'chat_id': key.chat_id, 'user_id': key.user_id,
+                        'data': await state.get_data(), 'saved_at': time.time()})
+        task.cancel()
+    if unfinished:
+        await asyncio.wait(unfinished, timeout=1)
+    if records:
+        path = path or Config.pending_saves_file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        metrics.inc('shutdown.persisted', len(records))
+        logger.warning(f'Завершение: {len(records)} незавершённых сохранений записаны в {path}')
+    return len(records)
+
+
+async def restore(bot, storage, path: str = None) -> int:
+    """ Восстановить состояние незавершённых сохранений после запуска и сообщить пользователям """
+    from handlers.survey_handlers import session_items  # Обработчики опроса импортируют этот модуль
+    path = path or Config.pending_saves_file
+    try:
+        with open(path, encoding='utf-8') as file:
+            records = [json.loads(line) for line in file if line.strip()]
+    except FileNotFoundError:
+        return 0
+    for record in records:
+        key = StorageKey(bot_id=record['bot_id'], chat_id=record['chat_id'], user_id=record['user_id'])
+        await storage.set_state(key, BotStates.save)
+        await storage.set_data(key, record['data'])
+        fids = ', '.join(str(item['fid']) for item in session_items(record['data']))
+        try:
+            await bot.send_message(record['chat_id'],
+                                   f"<i>Сохранение ИД {fids} прервано перезапуском бота.\n"
+                                   f"Данные не потеряны, введите /save для завершения.</i>")
+        except Exception as exc:
+            logger.warning(f"Не удалось уведомить пользователя о прерванном сохранении: {exc!r}")
+    os.remove(path)
+    logger.info(f'Восстановлено незавершённых сохранений: {len(records)}')
+    return len(records)
+
+
+async def shutdown(bot, background: list = (), runner=None):
+    """ Завершение после остановки получения обновлений """
+    started = time.perf_counter()
+    await drain()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    try:
+        await executors.ngw.run(nextgis.backfill_checkup_ids)
+    except Exception as exc:
+        logger.warning(f'Поле id проверок не заполнено при завершении: {exc!r}')
+    remaining = max(1.0, Config.shutdown_timeout - (time.perf_counter() - started))
+    await executors.shutdown_all(remaining)
+    if runner is not None:
+        await runner.cleanup()
+    await bot.session.close()
+    logger.info(f'Бот остановлен за {time.perf_counter() - started:.1f} с')
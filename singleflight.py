@@ -0,0 +1,53 @@
+""" Объединение одинаковых одновременных запросов (single-flight)
+Если несколько потоков одновременно запрашивают одно и то же (одинаковый ключ), выполняется
+только первый запрос, остальные ждут его завершения и получают тот же результат (или то же исключение).
+Результат общий для всех ожидающих - изменять его на месте нельзя.
+Счётчики: singleflight.<имя>.calls - выполнено запросов, singleflight.<имя>.coalesced - присоединилось к уже идущим.
+"""
+import threading
+
+import metrics
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        metrics.gauge(f'singleflight.{name}.in_flight', lambda: len(self._calls))
+
+    def do(self, key, func, *args, **kwargs):
+        """ Выполнить func(*args, **kwargs) или дождаться уже идущего вызова с тем же ключом """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc(f'singleflight.{self.name}.coalesced')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.inc(f'singleflight.{self.name}.calls')
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
@@ -0,0 +1,227 @@
+""" Локальный снимок слоя водоисточников (ресурс 91) на диске
+Снимок - набор колонок в формате NumPy (.npy), которые при запуске отображаются в память (mmap):
+поиск водоисточника по ИД доступен сразу после старта, без чтения всего слоя из NextGIS WEB.
+    data/snapshot/
+        CURRENT                 имя каталога действующей версии снимка
+        <версия>/meta.json      отметка синхронизации: {"resource", "synced_at", "max_id", "count"}
+        <версия>/id.npy         ИД объектов по возрастанию (int64) - двоичный поиск
+        <версия>/name.npy ...   строковые поля (юникод фиксированной ширины), пустая строка - null
+        <версия>/company_id.npy ИД хоз.субъекта (int64), -1 - null
+Изменения, полученные после загрузки (см. sync.py), хранятся в наложении (overlay) поверх колонок и
+попадают на диск при следующем сохранении. Сохранение атомарное: новая версия собирается в отдельном
+каталоге, затем файл CURRENT подменяется через os.replace, старые версии удаляются.
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+from loguru import logger
+from msgspec import structs
+
+import executors
+import metrics
+import nextgis
+from config import Config
+from models import WaterSource, WaterSourceFields
+
+_FIELDS = [item.name for item in structs.fields(WaterSourceFields)]
+_INT_COLUMNS = ('company_id',)
+NULL_INT = -1
+
+
+def _column(values: list, integer: bool) -> np.ndarray:
+    if integer:
+        return np.array([NULL_INT if value is None else value for value in values], dtype=np.int64)
+    return np.array(['' if value is None else value for value in values], dtype=np.str_)
+
+
+def _value(column: np.ndarray, index: int, integer: bool):
+    value = column[index]
+    if integer:
+        return None if value == NULL_INT else int(value)
+    return str(value) or None
+
+
+class Snapshot:
+    """ Снимок слоя: колонки (массивы NumPy, возможно отображённые в память) и наложение изменений """
+
+    def __init__(self, columns: dict, meta: dict):
+        self.columns = columns
+        self.meta = meta
+        self.overlay = {}  # ИД -> WaterSource (изменён/добавлен) или None (удалён)
+
+    @classmethod
+    def empty(cls) -> 'Snapshot':
+        return cls.from_sources([])
+
+    @classmethod
+    def from_sources(cls, sources: Iterable[WaterSource], **meta) -> 'Snapshot':
+        sources = sorted(sources, key=lambda source: source.id)
+        columns = {'id': np.array([source.id for source in sources], dtype=np.int64),
+                   'geom': _column([source.geom for source in sources], False)}
+        for name in _FIELDS:
+            columns[name] = _column([getattr(source.fields, name) for source in sources], name in _INT_COLUMNS)
+        meta.setdefault('resource', Config.ngw_resource_wi_points)
+        meta.setdefault('synced_at', 0)
+        meta['max_id'] = max(int(columns['id'][-1]) if sources else 0, meta.get('max_id', 0))
+        meta['count'] = len(sources)
+        return cls(columns, meta)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Snapshot']:
+        """ Открыть снимок с диска (колонки отображаются в память). None - снимка нет или он повреждён """
+        try:
+            with open(os.path.join(path, 'CURRENT'), encoding='utf-8') as file:
+                version = os.path.join(path, file.read().strip())
+            with open(os.path.join(version, 'meta.json'), encoding='utf-8') as file:
+                meta = json.load(file)
+            columns = {name: np.load(os.path.join(version, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+                       for name in ['id', 'geom', *_FIELDS]}
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.error(f'Снимок слоя {path} не загружен: {exc!r}')
+            return None
+        if any(len(column) != len(columns['id']) for column in columns.values()):
+            logger.error(f'Снимок слоя {path} повреждён: разная длина колонок')
+            return None
+        return cls(columns, meta)
+
+    def save(self, path: str) -> str:
+        """ Записать снимок (вместе с наложением) как новую версию, вернуть её каталог """
+        snapshot = self.compacted() if self.overlay else self
+        os.makedirs(path, exist_ok=True)
+        version = f'{time.time_ns()}'
+        target = os.path.join(path, version)
+        os.makedirs(target)
+        for name, column in snapshot.columns.items():
+            np.save(os.path.join(target, f'{name}.npy'), np.asarray(column), allow_pickle=False)
+        with open(os.path.join(target, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(snapshot.meta, file, ensure_ascii=False)
+        pointer = os.path.join(path, f'CURRENT.{os.getpid()}')
+        with open(pointer, 'w', encoding='utf-8') as file:
+            file.write(version)
+        os.replace(pointer, os.path.join(path, 'CURRENT'))
+        for name in os.listdir(path):
+            if name != version and name.isdigit():
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        return target
+
+    def copy(self) -> 'Snapshot':
+        """ Копия для чтения в другом потоке: колонки общие (не изменяются), наложение копируется """
+        copied = Snapshot(self.columns, dict(self.meta))
+        copied.overlay = dict(self.overlay)
+        return copied
+
+    def compacted(self) -> 'Snapshot':
+        """ Новый снимок без наложения: изменения влиты в колонки """
+        return Snapshot.from_sources(self, **self.meta)
+
+    def get(self, feature_id: int) -> Optional[WaterSource]:
+        if feature_id in self.overlay:
+            return self.overlay[feature_id]
+        ids = self.columns['id']
+        index = int(np.searchsorted(ids, feature_id))
+        if index == len(ids) or ids[index] != feature_id:
+            return None
+        return self._row(index)
+
+    def _row(self, index: int) -> WaterSource:
+        fields = WaterSourceFields(**{name: _value(self.columns[name], index, name in _INT_COLUMNS)
+                                      for name in _FIELDS})
+        return WaterSource(id=int(self.columns['id'][index]), fields=fields,
+                           geom=_value(self.columns['geom'], index, False))
+
+    def apply(self, changed: Iterable[WaterSource] = (), deleted: Iterable[int] = ()):
+        """ Наложить изменения: новые и изменённые водоисточники, ИД удалённых """
+        for source in changed:
+            self.overlay[source.id] = source
+            self.meta['max_id'] = max(self.meta.get('max_id', 0), source.id)
+        for feature_id in deleted:
+            self.overlay[feature_id] = None
+
+    def ids(self) -> np.ndarray:
+        """ ИД всех водоисточников снимка с учётом наложения """
+        ids = np.asarray(self.columns['id'])
+        if not self.overlay:
+            return ids
+        keep = ids[~np.isin(ids, np.fromiter(self.overlay, dtype=np.int64))]
+        added = [feature_id for feature_id, source in self.overlay.items() if source is not None]
+        return np.union1d(keep, np.array(added, dtype=np.int64))
+
+    def __iter__(self) -> Iterator[WaterSource]:
+        for index, feature_id in enumerate(self.columns['id']):
+            if int(feature_id) not in self.overlay:
+                yield self._row(index)
+        yield from (source for source in self.overlay.values() if source is not None)
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    @property
+    def age(self) -> float:
+        """ Секунд с последней синхронизации """
+        return time.time() - self.meta.get('synced_at', 0)
+
+
+# Действующий снимок слоя водоисточников (пустой до open_snapshot/refresh)
+layer = Snapshot.empty()
+
+
+def open_snapshot(path: str = None) -> Snapshot:
+    """ Загрузить снимок с диска при запуске; если его нет - остаётся пустой """
+    global layer
+    started = time.perf_counter()
+    loaded = Snapshot.load(path or Config.snapshot_dir)
+    if loaded is not None:
+        layer = loaded
+        logger.info(f'Снимок слоя загружен: {len(layer)} объектов, возраст {layer.age:.0f} с, '
+                    f'{(time.perf_counter() - started) * 1000:.1f} мс')
+    metrics.gauge('snapshot.size', lambda: len(layer.columns['id']) + len(layer.overlay))
+    return layer
+
+
+def get_water_source(feature_id: int) -> Optional[WaterSource]:
+    """ Водоисточник из снимка (без обращения к NextGIS WEB) или None """
+    source = layer.get(feature_id)
+    metrics.inc('snapshot.hits' if source is not None else 'snapshot.misses')
+    return source
+
+
+def fetch_all(page: int = None) -> List[WaterSource]:
+    """ Полное чтение слоя водоисточников постранично (блокирующая функция) """
+    page = page or Config.snapshot_page
+    sources = []
+    while True:
+        # Порядок по ИД объекта: без него страницы разных запросов могут пересекаться
+        chunk = nextgis.get_water_sources(limit=page, offset=len(sources), order_by=['id'])
+        sources.extend(chunk)
+        if len(chunk) < page:
+            return sources
+
+
+async def rebuild(path: str = None) -> Snapshot:
+    """ Полная пересборка снимка из NextGIS WEB и запись на диск """
+    global layer
+    synced_at = time.time()
+    sources = await executors.ngw.run(fetch_all)
+    layer = Snapshot.from_sources(sources, synced_at=synced_at)
+    if path or Config.snapshot_dir:
+        await executors.cpu.run(layer.save, path or Config.snapshot_dir)
+    logger.info(f'Снимок слоя пересобран: {len(layer)} объектов')
+    return layer
+
+
+async def refresh(path: str = None):
+    """ Фоновое обновление при запуске: пересборка, если снимка нет или он старше Config.snapshot_max_age """
+    try:
+        if not len(layer) or layer.age > Config.snapshot_max_age:
+            await rebuild(path)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        logger.error(f'Ошибка обновления снимка слоя: {exc!r}')
@@ -0,0 +1,91 @@
+""" Промежуточное хранение снимков опроса на диске
+Снимки альбома скачиваются из Telegram сразу при получении (параллельно, в фоне), пока инспектор
+отвечает на следующие шаги опроса. При сохранении (/save) снимок загружается в Google Drive из файла
+Config.staging_dir/<file_id>.jpg, а не скачивается заново по ссылке; после сохранения файлы удаляются.
+Если скачать заранее не удалось, сохранение работает как раньше - по ссылке на файл Telegram.
+"""
+import asyncio
+import os
+import time
+from typing import Iterable, Optional
+
+from loguru import logger
+
+import metrics
+from config import Config
+
+# Выполняющиеся и завершённые скачивания: file_id -> задача asyncio
+_tasks = {}
+
+
+def path(file_id: str) -> str:
+    # file_id Telegram - base64url, допустим в имени файла
+    return os.path.join(Config.staging_dir, f'{file_id}.jpg')
+
+
+async def _download(bot, file_id: str) -> Optional[str]:
+    started = time.perf_counter()
+    target = path(file_id)
+    partial = f'{target}.{os.getpid()}.part'
+    try:
+        os.makedirs(Config.staging_dir, exist_ok=True)
+        file_info = await bot.get_file(file_id)
+        await bot.download_file(file_info.file_path, destination=partial)
+        os.replace(partial, target)
+        metrics.observe('staging.download_ms', (time.perf_counter() - started) * 1000)
+        return target
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        metrics.inc('staging.errors')
+        logger.warning(f'Снимок {file_id} не скачан заранее: {exc!r}')
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+
+
+def prefetch(bot, file_ids: Iterable[str]):
+    """ Начать скачивание снимков в фоне (одновременно, не дожидаясь) """
+    if not Config.staging_dir:
+        return
+    for file_id in file_ids:
+        if file_id not in _tasks:
+            _tasks[file_id] = asyncio.create_task(_download(bot, file_id))
+
+
+async def staged(file_id: str) -> Optional[str]:
+    """ Путь к скачанному снимку (дожидаясь начатого скачивания) или None """
+    task = _tasks.get(file_id)
+    if task is not None:
+        result = await asyncio.shield(task)
+        metrics.inc('staging.hits' if result else 'staging.misses')
+        return result
+    return path(file_id) if Config.staging_dir and os.path.exists(path(file_id)) else None
+
+
+def discard(file_ids: Iterable[str]):
+    """ Удалить снимки после сохранения """
+    for file_id in file_ids:
+        task = _tasks.pop(file_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+        if Config.staging_dir and os.path.exists(path(file_id)):
+            os.remove(path(file_id))
+
+
+def sweep(max_age: float) -> int:
+    """ Удалить снимки старше max_age секунд (опросы брошены или прерваны перезапуском) """
+    if not Config.staging_dir or not os.path.isdir(Config.staging_dir):
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for name in os.listdir(Config.staging_dir):
+        file_path = os.path.join(Config.staging_dir, name)
+        task = _tasks.get(name.split('.', 1)[0])
+        if (task is None or task.done()) and os.path.getmtime(file_path) < deadline:
+            os.remove(file_path)
+            _tasks.pop(name.split('.', 1)[0], None)
+            removed += 1
+    if removed:
+        metrics.inc('staging.swept', removed)
+    return removed
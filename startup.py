@@ -0,0 +1,67 @@
+""" Профиль запуска бота
+Запуск измеряется в отдельном процессе (python -X importtime): импорт main, создание бота и
+диспетчера. Отчёт - время и память до готовности к приёму обновлений, время импорта по пакетам
+и список тяжёлых зависимостей, загруженных при запуске (они должны загружаться при первом
+использовании: pandas - /coverage, pyproj - шаг 2 опроса, PyDrive2 - сохранение, openpyxl - /export).
+
+    python main.py --profile-startup
+    python startup.py --top 20 --budget 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import defaultdict
+
+from config import Config
+
+HEAVY_MODULES = ('pandas', 'pyproj', 'pydrive2', 'googleapiclient', 'openpyxl')
+
+_PROBE = f'''
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+main.create_bot('123456789:STARTUPaabbccddeeffgghhiijjkkllmmnn')
+main.create_dispatcher()
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds,
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+'''
+
+
+def measure() -> dict:
+    """ Замер запуска в отдельном процессе """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE],
+                             capture_output=True, text=True, check=True)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    packages = defaultdict(int)
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    result['packages'] = sorted(((name, us / 1e6) for name, us in packages.items()), key=lambda item: -item[1])
+    return result
+
+
+def report(result: dict, top: int = 15) -> str:
+    lines = [f"Запуск: {result['seconds']:.2f} с (бюджет {Config.startup_budget:.2f} с), "
+             f"память: {result['rss_mb']:.0f} МБ",
+             f"Тяжёлые зависимости при запуске: {', '.join(result['heavy']) or 'нет'}", '',
+             f"{'Пакет':32} {'импорт, с':>10}"]
+    lines += [f'{name:32} {seconds:10.3f}' for name, seconds in result['packages'][:top]]
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Профиль запуска бота')
+    parser.add_argument('--top', type=int, default=15, help='Количество пакетов в отчёте')
+    parser.add_argument('--budget', type=float, default=Config.startup_budget, help='Бюджет запуска, секунд')
+    args = parser.parse_args()
+
+    Config.startup_budget = args.budget
+    measured = measure()
+    print(report(measured, args.top))
+    sys.exit(1 if measured['seconds'] > args.budget or measured['heavy'] else 0)
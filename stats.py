@@ -0,0 +1,105 @@
+""" Сводка производительности бота для администраторов (/stats)
+Данные берутся из метрик процесса (metrics.py): окна наблюдений - кольцевые буферы последних
+Config.metrics_window значений, поэтому сводка считается за миллисекунды и не обращается к сервисам:
+ - задержка обработчиков сообщений и кнопок (middleware measure) и сохранений /save (трасса save),
+   процентили p50/p95/p99 по последним Config.metrics_window значениям каждого показателя (окно - число
+   наблюдений, а не период времени: при редких сохранениях оно охватывает дни);
+ - доля ошибок обращений к NextGIS WEB, Google Drive (пул потоков drive) и Bot API
+   (middleware сессии бота telegram_calls) с момента запуска;
+ - доля попаданий кэшей (счётчики <кэш>.hits / <кэш>.misses);
+ - загрузка и очереди пулов потоков, незавершённые опросы, выполняющиеся сохранения, время работы.
+"""
+import time
+
+import health
+import metrics
+import shutdown
+from config import Config
+from tracing import percentile
+
+# Окна задержек в сводке: метрика -> подпись
+LATENCIES = (('handler.latency_ms', 'Обработчики'), ('trace.save_ms', 'Сохранение /save'),
+             ('ngw.latency_ms', 'NextGIS WEB'), ('telegram.latency_ms', 'Bot API'),
+             ('executor.drive.queue_wait_ms', 'Очередь drive'))
+# Доли ошибок: подпись -> (счётчик обращений, счётчик ошибок)
+ERROR_RATES = (('NextGIS WEB', 'ngw.requests', 'ngw.errors'),
+               ('Google Drive', 'executor.drive.calls', 'executor.drive.errors'),
+               ('Bot API', 'telegram.requests', 'telegram.errors'),
+               ('Сохранения', 'trace.save.count', 'trace.save.errors'))
+POOLS = ('ngw', 'drive', 'cpu', 'hedge', 'ngw_fanout', 'export')
+
+
+async def measure(handler, event, data):
+    """ Middleware сообщений и нажатий кнопок: длительность обработчика """
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        metrics.observe('handler.latency_ms', (time.perf_counter() - started) * 1000)
+
+
+async def telegram_calls(make_request, bot, method):
+    """ Middleware сессии бота: количество, ошибки и задержка запросов к Bot API """
+    started = time.perf_counter()
+    metrics.inc('telegram.requests')
+    try:
+        return await make_request(bot, method)
+    except Exception:
+        metrics.inc('telegram.errors')
+        raise
+    finally:
+        metrics.observe('telegram.latency_ms', (time.perf_counter() - started) * 1000)
+
+
+def _uptime(seconds: float) -> str:
+    days, seconds = divmod(int(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    return f'{days} д {hours:02d}:{seconds // 60:02d}' if days else f'{hours:02d}:{seconds // 60:02d}'
+
+
+def collect() -> dict:
+    """ Значения для сводки из текущих метрик """
+    current = metrics.snapshot()
+    counters, windows, gauges = current['counters'], current['windows'], current['gauges']
+    latencies = {}
+    for name, _ in LATENCIES:
+        values = windows.get(name)
+        if values:
+            latencies[name] = {'count': len(values), **{f'p{q}': percentile(values, q) for q in (50, 95, 99)}}
+    errors = {}
+    for label, calls, failed in ERROR_RATES:
+        if counters.get(calls):
+            errors[label] = (counters.get(failed, 0), counters[calls])
+    caches = {}
+    for name in counters:
+        if name.endswith('.hits'):
+            cache = name[:-len('.hits')]
+            hits, misses = counters[name], counters.get(f'{cache}.misses', 0)
+            caches[cache] = (hits, hits + misses)
+    pools = {name: (gauges.get(f'executor.{name}.active', 0), gauges.get(f'executor.{name}.queue', 0),
+                    counters.get(f'executor.{name}.rejected', 0)) for name in POOLS}
+    return {'latencies': latencies, 'errors': errors, 'caches': dict(sorted(caches.items())), 'pools': pools,
+            'sessions': gauges.get('sessions.active', 0), 'expired': counters.get('sessions.expired', 0),
+            'saving': shutdown.in_flight(), 'uptime': time.time() - health.started_at}
+
+
+def render(data: dict) -> str:
+    """ Сводка одним сообщением (HTML) """
+    lines = [f"<b>Статистика бота</b> (работает {_uptime(data['uptime'])})", '',
+             f"<b>Задержка, мс</b> (последние {Config.metrics_window} значений): p50 / p95 / p99"]
+    for name, label in LATENCIES:
+        item = data['latencies'].get(name)
+        if item:
+            lines.append(f"{label}: {item['p50']:.0f} / {item['p95']:.0f} / {item['p99']:.0f} "
+                         f"<i>(n={item['count']})</i>")
+    lines += ['', '<b>Ошибки</b> (с запуска)']
+    lines += [f'{label}: {failed / calls:.1%} ({failed} из {calls})'
+              for label, (failed, calls) in data['errors'].items()] or ['нет обращений']
+    lines += ['', '<b>Попадания в кэш</b>']
+    lines += [f'{cache}: {hits / total:.0%} ({hits} из {total})'
+              for cache, (hits, total) in data['caches'].items() if total] or ['нет обращений']
+    lines += ['', '<b>Пулы потоков</b>: выполняется / в очереди / отклонено']
+    lines += [f'{name}: {active} / {queue} / {rejected}' for name, (active, queue, rejected) in data['pools'].items()]
+    lines += ['', f"<b>Опросы</b>: незавершённых {data['sessions']}, сброшено {data['expired']}, "
+                  f"сохраняется {data['saving']}"]
+    return '\n'.join(lines)
@@ -0,0 +1,233 @@
+""" Инкрементальная синхронизация локальных данных с NextGIS WEB
+Вместо полного чтения слоёв периодически запрашиваются только изменения:
+ - водоисточники (91): объекты, изменённые после прошлой синхронизации (fld_<поле изменения>__ge=...,
+   поле задаётся Config.sync_modified_field), или - если такого поля нет - новые объекты
+   с ИД больше отметки снимка (fld_<Config.sync_id_field>__gt=...). Изменения существующих объектов
+   без поля изменения не видны, поэтому снимок пересобирается полностью раз в Config.sync_rebuild_interval
+   (с полем изменения - раз в Config.snapshot_max_age);
+ - проверки (90): только добавляются. Страницы читаются по убыванию ИД объекта NextGIS WEB
+   (order_by=-id) до первого уже известного - поле id записи может быть не заполнено
+   (nextgis.backfill_checkup_ids) или не заполняться вовсе для проверок, созданных не ботом.
+   Хранится только последняя проверка каждого водоисточника - её использует аналитика (analytics.py);
+ - удаления водоисточников: раз в Config.sync_id_scan_interval - дешёвый постраничный запрос одних ИД
+   (fields=id, geom=no) и сравнение со снимком. Неполный список (ошибка запроса, пустой ответ) - ошибка,
+   а не удаление всех водоисточников: проверка повторяется в следующем цикле.
+Изменения накладываются на снимок слоя (snapshot.py) и рассылаются подписчикам (subscribe):
+индексы, кэши, аналитика. Обработчик получает Change и может быть обычной функцией или корутиной.
+"""
+import asyncio
+import datetime
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+import executors
+import metrics
+import nextgis
+import snapshot
+from config import Config
+from models import Checkup
+
+SOURCES = 'sources'
+CHECKUPS = 'checkups'
+
+_subscribers: List[Callable] = []
+
+
+@dataclass
+class Change:
+    """ Событие изменения: ресурс (SOURCES/CHECKUPS), изменённые/добавленные объекты, ИД удалённых.
+    reloaded - данные заменены целиком (снимок загружен или пересобран): перестроить всё по снимку """
+    resource: str
+    changed: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    reloaded: bool = False
+
+
+def subscribe(callback: Callable):
+    """ Подписка на изменения; можно использовать как декоратор """
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback: Callable):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+async def emit(change: Change):
+    for callback in list(_subscribers):
+        try:
+            result = callback(change)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as exc:
+            logger.error(f'Ошибка обработчика изменений {callback!r}: {exc!r}')
+
+
+def _pages(getter: Callable, **kwargs) -> list:
+    """ Все объекты запроса постранично (блокирующая функция) """
+    page = Config.snapshot_page
+    items = []
+    while True:
+        chunk = getter(limit=page, offset=len(items), **kwargs)
+        items.extend(chunk)
+        if len(chunk) < page:
+            return items
+
+
+def _newer(getter: Callable, watermark: int) -> list:
+    """ Объекты с ИД объекта NextGIS WEB больше watermark, по возрастанию ИД (блокирующая функция).
+    Страницы - по убыванию ИД, до страницы с уже известным объектом. Объект, добавленный во время чтения,
+    сдвигает страницы: объекты могут повториться (повторы отбрасываются), но не пропасть """
+    page = Config.snapshot_page
+    items = {}
+    offset = 0
+    while True:
+        chunk = getter(limit=page, offset=offset, order_by=['-id'])
+        items.update((item.id, item) for item in chunk if item.id > watermark)
+        offset += len(chunk)
+        if len(chunk) < page or any(item.id <= watermark for item in chunk):
+            return [items[feature_id] for feature_id in sorted(items)]
+
+
+def _remote_ids(page: int = None) -> set:
+    """ ИД всех водоисточников слоя постранично по возрастанию (блокирующая функция). Соседние страницы
+    перекрываются на один объект: если он не совпал, во время чтения удалён объект с предыдущих страниц,
+    страницы сдвинулись и ИД могли быть пропущены. Это, как и ошибка запроса, - RuntimeError """
+    page = page or Config.snapshot_page
+    ids = []
+    while True:
+        content = nextgis.fetch_features(Config.ngw_resource_wi_points, fields=['id'], geom='no', extensions='none',
+                                         order_by=['id'], limit=page, offset=max(0, len(ids) - 1))
+        if content is None:
+            raise RuntimeError(f'ИД водоисточников не получены из NextGIS WEB (страница с {len(ids)})')
+        chunk = [item['id'] for item in json.loads(content)]
+        if ids:
+            if not chunk or chunk[0] != ids[-1]:
+                raise RuntimeError('слой водоисточников изменился во время чтения ИД')
+            ids.extend(chunk[1:])
+        else:
+            ids.extend(chunk)
+        if len(chunk) < page:
+            return set(ids)
+
+
+def _date_key(checkup: Checkup) -> tuple:
+    moment = checkup.fields.date_time
+    return (moment.year, moment.month, moment.day, moment.hour, moment.minute, moment.second,
+            checkup.id) if moment else (0, 0, 0, 0, 0, 0, checkup.id)
+
+
+def _ngw_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class LayerSync:
+    """ Периодическая синхронизация снимка водоисточников и локального списка проверок """
+
+    def __init__(self):
+        self.latest: Dict[int, Checkup] = {}  # ИД водоисточника -> его последняя проверка
+        self.checkup_watermark = 0  # Наибольший ИД объекта проверки в NextGIS WEB
+        self.last_id_scan = 0.0
+        self.last_rebuild = 0.0
+
+    @property
+    def checkups(self) -> List[Checkup]:
+        """ Последние проверки водоисточников (список ограничен количеством водоисточников) """
+        return list(self.latest.values())
+
+    @staticmethod
+    def rebuild_interval() -> float:
+        return Config.snapshot_max_age if Config.sync_modified_field else Config.sync_rebuild_interval
+
+    async def rebuild_sources(self) -> Change:
+        """ Полная пересборка снимка: изменения объектов, не видимые инкрементальной синхронизации """
+        await snapshot.rebuild()
+        # Пересобранный снимок не содержит удалённых объектов
+        self.last_rebuild = self.last_id_scan = time.time()
+        return Change(SOURCES, reloaded=True)
+
+    async def poll_sources(self) -> Change:
+        layer = snapshot.layer
+        started = time.time()
+        if Config.sync_modified_field:
+            # Перекрытие на интервал синхронизации: расхождение часов бота и сервера
+            since = _ngw_time(layer.meta.get('synced_at', 0) - Config.sync_interval)
+            query = [f'fld_{Config.sync_modified_field}__ge={since}']
+        else:
+            query = [f"fld_{Config.sync_id_field}__gt={layer.meta.get('max_id', 0)}"]
+        received = await executors.ngw.run(_pages, nextgis.get_water_sources, fld_filter=query)
+        changed = [source for source in received if layer.get(source.id) != source]
+        layer.apply(changed=changed)
+        layer.meta['synced_at'] = started
+        return Change(SOURCES, changed=changed)
+
+    async def scan_deleted(self) -> Change:
+        """ Удалённые водоисточники: сравнение ИД в NextGIS WEB и в снимке. Если список ИД не получен
+        полностью, удаления не определяются до следующего цикла (остальная синхронизация продолжается) """
+        try:
+            remote_ids = await executors.ngw.run(_remote_ids)
+            if not remote_ids and len(snapshot.layer):
+                raise RuntimeError('пустой список ИД водоисточников')
+        except Exception as exc:
+            logger.error(f'Удалённые водоисточники не определены: {exc!r}')
+            return Change(SOURCES)
+        self.last_id_scan = time.time()
+        deleted = [int(feature_id) for feature_id in snapshot.layer.ids() if int(feature_id) not in remote_ids]
+        snapshot.layer.apply(deleted=deleted)
+        return Change(SOURCES, deleted=deleted)
+
+    async def poll_checkups(self) -> Change:
+        added = await executors.ngw.run(_newer, nextgis.get_checkups, self.checkup_watermark)
+        if added:
+            self.checkup_watermark = added[-1].id
+        for item in added:
+            source_id = item.fields.source_id
+            if source_id is not None and (source_id not in self.latest
+                                          or _date_key(item) >= _date_key(self.latest[source_id])):
+                self.latest[source_id] = item
+        return Change(CHECKUPS, changed=added)
+
+    async def run_once(self) -> List[Change]:
+        """ Один цикл синхронизации; возвращает непустые изменения (они же разосланы подписчикам) """
+        # Поле id записей о проверках, созданных ботом (для выгрузки и аналитики вне бота)
+        await executors.ngw.run(nextgis.backfill_checkup_ids)
+        if time.time() - self.last_rebuild >= self.rebuild_interval():
+            changes = [await self.rebuild_sources()]
+        else:
+            changes = [await self.poll_sources()]
+            if time.time() - self.last_id_scan >= Config.sync_id_scan_interval:
+                changes.append(await self.scan_deleted())
+        changes.append(await self.poll_checkups())
+        changes = [change for change in changes if change.changed or change.deleted or change.reloaded]
+        for change in changes:
+            metrics.inc(f'sync.{change.resource}.changed', len(change.changed))
+            metrics.inc(f'sync.{change.resource}.deleted', len(change.deleted))
+            await emit(change)
+        # Пересобранный снимок уже записан на диск (snapshot.rebuild)
+        if any(change.resource == SOURCES and not change.reloaded for change in changes) and Config.snapshot_dir:
+            await executors.cpu.run(snapshot.layer.save, Config.snapshot_dir)
+        return changes
+
+    async def run(self):
+        """ Фоновая задача: актуализация снимка при запуске, затем циклы синхронизации """
+        await snapshot.refresh()
+        self.last_rebuild = time.time()
+        await emit(Change(SOURCES, reloaded=True))
+        # Удалённые за время простоя бота - при первом же цикле, если снимок взят с диска
+        self.last_id_scan = 0.0 if snapshot.layer.age > Config.sync_interval else time.time()
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error(f'Ошибка синхронизации с NextGIS WEB: {exc!r}')
+            await asyncio.sleep(Config.sync_interval)
+
+
+syncer = LayerSync()
@@ -21,9 +21,30 @@ def description_water_intake(fid: int,  locality: str = None, street: str = None
 
     description += f"<p><a href='{Config.bot_url}={str(fid)}'>Осмотр водоисточника с ИД-{str(fid)}</a></p>"
 
-    json_company = nextgis.get_feature(Config.ngw_resource_organization, feature_id=fid_wi_company)
-    if json_company:
-        description += f"<p>Хоз.субъект: {json_company['fields']['Хоз_субъект']}</p>"
+    company = company_name(fid_wi_company)
+    if company:
+        description += f"<p>Хоз.субъект: {company}</p>"
 
     return description
 
+
+# Наименования хоз.субъектов: справочник меняется редко, заполняется при прогреве (health.py)
+# и дополняется по запросу
+_companies = {}
+
+
+def preload_companies() -> int:
+    _companies.update({item.id: item.fields.name for item in nextgis.get_organizations(geom='no', extensions='none')})
+    return len(_companies)
+
+
+def company_name(fid_wi_company: int = None):
+    if fid_wi_company is None:
+        return None
+    if fid_wi_company not in _companies:
+        company = nextgis.get_organization(fid_wi_company)
+        if company is None:
+            return None
+        _companies[fid_wi_company] = company.fields.name
+    return _companies[fid_wi_company]
+
@@ -26,6 +26,7 @@ if __name__ == "__main__":
     # print(json_object[0]['id'], json_object[0]['fields']['id'])
 
     # ================================================================= Цикл по json_object
+    updates = []  # Изменения объектов - записываются пакетно после цикла
     for song in json_object:
         feature_id = song['id']
 
@@ -92,12 +93,15 @@ if __name__ == "__main__":
 
         # ============================================================= Применить изменения
         # nextgis.ngw_put_feature(resource, feature_id, fields)
-        nextgis.ngw_put_feature(resource_id=resource, feature_id=feature_id,
-                                fields_values=fields_values, description=description)
+        updates.append({'id': feature_id, 'fields': fields_values, 'extensions': {'description': description}})
 
         # for attribute, value in song.items():
         #     print(attribute, value)
 
+    results = nextgis.ngw_write_features(resource, updates)
+    print(f'Изменено: {sum(result.ok for result in results)} из {len(updates)}, '
+          f'ошибки: {[(updates[result.index]["id"], result.error) for result in results if not result.ok]}')
+
     # current_time = datetime.datetime.now(pytz.timezone(Config.timezone))
     # print({'year': "{:02d}".format(current_time.year),
     #        'month': "{:02d}".format(current_time.month),
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(scope='session')
+def dispatcher():
+    """Диспетчер бота: роутеры подключаются к диспетчеру один раз за процесс, поэтому он общий для тестов."""
+    import main
+    return main.create_dispatcher()
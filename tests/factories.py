@@ -0,0 +1,19 @@
+"""Объекты моделей для тестов: значения по умолчанию, переопределяются нужные поля."""
+from models import Checkup, CheckupFields, NgwDateTime, WaterSource, WaterSourceFields
+
+
+def make_source(fid: int, geom: str = None, **fields) -> WaterSource:
+    """Водоисточник fid: ПГ-<fid>, Сургут, Мира, 1; остальные поля пустые."""
+    values = dict(name=f'ПГ-{fid}', locality='Сургут', street='Мира', building='1', landmark=None,
+                  specification=None, flow_rate=None, google_folder=None, google_street=None, company_id=None)
+    values.update(fields)
+    return WaterSource(id=fid, geom=geom, fields=WaterSourceFields(**values))
+
+
+def make_checkup(fid: int, source_id: int, date: tuple = None, **fields) -> Checkup:
+    """Проверка fid водоисточника source_id от даты date (год, месяц, день[, час, минута])."""
+    values = dict(id=fid, source_id=source_id, checkout='осмотр внешний', water='имеется', workable='возможна',
+                  entrance='возможен', plate=None, note=None, temperature=None,
+                  date_time=NgwDateTime(*date) if date else None)
+    values.update(fields)
+    return Checkup(id=fid, fields=CheckupFields(**values))
@@ -1,11 +1,14 @@
 import asyncio
+import pytest
 from aiogram import Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, User, Chat, CallbackQuery, PhotoSize
+from aiogram.types import Message, User, Chat, CallbackQuery, PhotoSize, File
 
 from handlers import survey_handlers, common_handlers
+import nextgis
+from factories import make_source
 from states import BotStates
 
 
@@ -13,9 +16,18 @@ def test_full_survey_flow(mocker):
     """Тестирование полного цикла опроса."""
     async def run_test():
         # Мокируем внешние зависимости
-        mocker.patch('nextgis.get_feature', return_value={'fields': {'name': 'Test', 'Поселение': 'Test', 'Улица': 'Test', 'Дом': 'Test', 'ИД_папки_Гугл_диск': 'test_id'}})
+        source = make_source(123, name='Test', locality='Test', street='Test', building='Test',
+                             google_folder='test_id')
+        mocker.patch('nextgis.get_water_source', return_value=source)
         mocker.patch('pydrive.create_folder', return_value='new_folder_id')
-        mocker.patch('nextgis.ngw_post_wi_checkup', return_value=True)
+        mocker.patch('pydrive.create_file_from_url', return_value=None)
+        mocker.patch('nextgis.ngw_write_features', return_value=[nextgis.WriteResult(0, ok=True, feature_id=123)])
+        mocker.patch('nextgis.ngw_post_wi_checkups', return_value=[True])
+        mocker.patch.object(nextgis.Config, 'checkup_key_field', 'Ключ_сохранения')
+        mocker.patch.object(Bot, 'get_file', mocker.AsyncMock(return_value=File(
+            file_id='1', file_unique_id='1', file_path='photos/1.jpg')))
+        mocker.patch.object(Bot, 'send_message', mocker.async_stub())
+        mocker.patch('handlers.survey_handlers.asyncio.sleep', mocker.AsyncMock())
         mock_answer = mocker.async_stub()
         mocker.patch.object(Message, 'answer', mock_answer)
         mock_edit_text = mocker.async_stub()
@@ -109,5 +121,243 @@ def test_full_survey_flow(mocker):
         await survey_handlers.cmd_save(save_message, state, bot)
         current_state = await state.get_state()
         assert current_state is None
+        nextgis.ngw_post_wi_checkups.assert_called_once()
+        [checkup] = nextgis.ngw_post_wi_checkups.call_args.args[0]
+        assert checkup['fid_wi'] == 123 and checkup['key'].startswith('save-')
+
+    asyncio.run(run_test())
+
+
+def test_full_survey_against_fake_services(mocker):
+    """Сквозной тест опроса без сети: бот работает с поддельными NextGIS WEB, Google Drive и Telegram."""
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from config import Config
+    from fakes import drive, knobs, ngw, run as fakes
+
+    async def run_test():
+        services = await fakes.start(sources=50, photo_size=1024)
+        mocker.patch.object(Config, 'ngw_host', services.ngw_url)
+        mocker.patch.object(Config, 'drive_api_url', services.drive_url)
+        mocker.patch('handlers.survey_handlers.asyncio.sleep', mocker.AsyncMock())
+        bot = Bot(token="123456789:AABBCCDDEEFFaabbccddeeff-123456789",
+                  session=AiohttpSession(api=TelegramAPIServer.from_base(services.telegram_url)))
+        try:
+            state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=bot.id, user_id=1, chat_id=1))
+            user = User(id=1, is_bot=False, first_name="Test")
+            chat = Chat(id=1, type="private")
+
+            def message(**content):
+                return Message(message_id=1, date=123, chat=chat, from_user=user, **content).as_(bot)
+
+            def callback(data):
+                return CallbackQuery(id="1", from_user=user, chat_instance="1", data=data,
+                                     message=message(text="keyboard")).as_(bot)
+
+            photo = [PhotoSize(file_id="photo", file_unique_id="u-photo", width=100, height=100)]
+            await common_handlers.cmd_start(message(text="/start"), state)
+            await survey_handlers.process_step_fid(message(text="7"), state)
+            await survey_handlers.process_step_position(
+                message(location={'latitude': 61.25, 'longitude': 73.39}), state)
+            await survey_handlers.process_step_checkout(callback("осмотр внешний"), state)
+            await survey_handlers.process_step_water(callback("имеется"), state)
+            await survey_handlers.process_step_workable(callback("возможна"), state)
+            await survey_handlers.process_step_entrance(callback("возможен"), state)
+            await survey_handlers.process_step_shot_medium(message(photo=photo), state)
+            await survey_handlers.process_step_shot_full(message(photo=photo), state)
+            await survey_handlers.process_step_shot_long(message(photo=photo), state)
+            await survey_handlers.process_step_plate_exist(callback("отсутствует"), state)
+            await survey_handlers.cmd_save(message(text="/save"), state, bot)
+            assert await state.get_state() is None
+        finally:
+            await bot.session.close()
+            await services.close()
+
+        ngw_app, drive_app = services.runners[0].app, services.runners[1].app
+        checkups = ngw_app[ngw.RESOURCES][Config.ngw_resource_wi_checkup]
+        assert [item['fields']['ИД_ВИ'] for item in checkups.values()] == [7]
+        source = ngw_app[ngw.RESOURCES][Config.ngw_resource_wi_points][7]
+        assert source['fields']['ИД_папки_Гугл_диск'] in drive_app[drive.FILES]
+        assert drive_app[knobs.STATS]['uploaded_bytes'] == 3 * 1024
+
+    asyncio.run(run_test())
+
+
+@pytest.mark.parametrize('fids', [(7, 8), (7,)])
+def test_batch_survey_saves_queue_with_one_channel_post(mocker, fids):
+    """Пакетный опрос через /next (и /save сразу после /next): одно сохранение и одно сообщение в канал."""
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from config import Config
+    from fakes import drive, knobs, ngw, run as fakes
+
+    async def run_test():
+        services = await fakes.start(sources=50, photo_size=1024)
+        mocker.patch.object(Config, 'ngw_host', services.ngw_url)
+        mocker.patch.object(Config, 'drive_api_url', services.drive_url)
+        mocker.patch('handlers.survey_handlers.asyncio.sleep', mocker.AsyncMock())
+        channel = mocker.spy(Bot, 'send_message')
+        bot = Bot(token="123456789:AABBCCDDEEFFaabbccddeeff-123456789",
+                  session=AiohttpSession(api=TelegramAPIServer.from_base(services.telegram_url)))
+        try:
+            state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=bot.id, user_id=1, chat_id=1))
+            user = User(id=1, is_bot=False, first_name="Test")
+            chat = Chat(id=1, type="private")
+
+            def message(**content):
+                return Message(message_id=1, date=123, chat=chat, from_user=user, **content).as_(bot)
+
+            def callback(data):
+                return CallbackQuery(id="1", from_user=user, chat_instance="1", data=data,
+                                     message=message(text="keyboard")).as_(bot)
+
+            photo = [PhotoSize(file_id="photo", file_unique_id="u-photo", width=100, height=100)]
+            await common_handlers.cmd_start(message(text="/start"), state)
+            for fid in fids:
+                await survey_handlers.process_step_fid(message(text=str(fid)), state)
+                await survey_handlers.process_step_position(
+                    message(location={'latitude': 61.25, 'longitude': 73.39}), state)
+                await survey_handlers.process_step_checkout(callback("осмотр внешний"), state)
+                await survey_handlers.process_step_water(callback("имеется"), state)
+                await survey_handlers.process_step_workable(callback("возможна"), state)
+                await survey_handlers.process_step_entrance(callback("возможен"), state)
+                await survey_handlers.process_step_shot_medium(message(photo=photo), state)
+                await survey_handlers.process_step_shot_full(message(photo=photo), state)
+                await survey_handlers.process_step_shot_long(message(photo=photo), state)
+                await survey_handlers.process_step_plate_exist(callback("отсутствует"), state)
+                if fid == 7:
+                    await survey_handlers.cmd_next(message(text="/next"), state)
+                    assert await state.get_state() == BotStates.fid
+            await survey_handlers.cmd_save(message(text="/save"), state, bot)
+            assert await state.get_state() is None
+        finally:
+            await bot.session.close()
+            await services.close()
+
+        ngw_app, drive_app = services.runners[0].app, services.runners[1].app
+        checkups = ngw_app[ngw.RESOURCES][Config.ngw_resource_wi_checkup]
+        assert sorted(item['fields']['ИД_ВИ'] for item in checkups.values()) == list(fids)
+        # Поле id заполняется позже пакетно (nextgis.backfill_checkup_ids)
+        assert all(item['fields'].get('id') is None for item in checkups.values())
+        assert drive_app[knobs.STATS]['uploaded_bytes'] == 3 * len(fids) * 1024
+        assert channel.call_count == 1 and channel.call_args.args[1] == Config.tg_canal_id
+
+    asyncio.run(run_test())
+
+
+def test_album_fills_shot_steps_and_uploads_prefetched_photos(mocker, tmp_path):
+    """Альбом из четырёх снимков: шаги 7-9 и снимок указателя за одно сообщение, загрузка из скачанных файлов."""
+    import os
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from config import Config
+    from fakes import drive, knobs, ngw, run as fakes
+    from middlewares import collect_album
+
+    async def run_test():
+        services = await fakes.start(sources=50, photo_size=1024)
+        mocker.patch.object(Config, 'ngw_host', services.ngw_url)
+        mocker.patch.object(Config, 'drive_api_url', services.drive_url)
+        mocker.patch.object(Config, 'album_window', 0.05)
+        mocker.patch.object(Config, 'staging_dir', str(tmp_path))
+        from_url = mocker.spy(survey_handlers.pydrive, 'create_file_from_url')
+        bot = Bot(token="123456789:AABBCCDDEEFFaabbccddeeff-123456789",
+                  session=AiohttpSession(api=TelegramAPIServer.from_base(services.telegram_url)))
+        try:
+            state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=bot.id, user_id=1, chat_id=1))
+            user = User(id=1, is_bot=False, first_name="Test")
+            chat = Chat(id=1, type="private")
+
+            def message(message_id=1, **content):
+                return Message(message_id=message_id, date=123, chat=chat, from_user=user, **content).as_(bot)
+
+            def callback(data):
+                return CallbackQuery(id="1", from_user=user, chat_instance="1", data=data,
+                                     message=message(text="keyboard")).as_(bot)
+
+            async def handler(event, data):
+                return await survey_handlers.process_step_shot_medium(event, state, album=data.get('album'))
+
+            await common_handlers.cmd_start(message(text="/start"), state)
+            await survey_handlers.process_step_fid(message(text="7"), state)
+            await survey_handlers.process_step_position(message(location={'latitude': 61.25, 'longitude': 73.39}), state)
+            await survey_handlers.process_step_checkout(callback("осмотр внешний"), state)
+            await survey_handlers.process_step_water(callback("имеется"), state)
+            await survey_handlers.process_step_workable(callback("возможна"), state)
+            await survey_handlers.process_step_entrance(callback("возможен"), state)
+            # Сообщения альбома приходят в обратном порядке - порядок снимков по message_id
+            album = [message(message_id=10 + i, media_group_id="album", photo=[
+                PhotoSize(file_id=f"photo{i}", file_unique_id=f"u{i}", width=100, height=100)]) for i in range(4)]
+            await asyncio.gather(*(collect_album(handler, item, {}) for item in reversed(album)))
+            data = await state.get_data()
+            assert [data[key] for key in ("shot_medium_id", "shot_full_id", "shot_long_id", "shot_plate")] == \
+                ["photo0", "photo1", "photo2", "photo3"]
+            assert await state.get_state() == BotStates.plate_exist
+            await survey_handlers.process_step_plate_exist(callback("имеется"), state)
+            assert await state.get_state() == BotStates.save
+
+            mocker.patch('handlers.survey_handlers.asyncio.sleep', mocker.AsyncMock())
+            await survey_handlers.cmd_save(message(text="/save"), state, bot)
+            assert await state.get_state() is None
+        finally:
+            await bot.session.close()
+            await services.close()
+
+        drive_app = services.runners[1].app
+        assert drive_app[knobs.STATS]['uploaded_bytes'] == 4 * 1024
+        assert from_url.call_count == 0
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(run_test())
+
+
+def test_loadtest_smoke(mocker, dispatcher):
+    """Короткий нагрузочный прогон: опросы через Dispatcher на поддельных сервисах, отчёт без ошибок."""
+    import loadtest
+    from config import Config
+    from fakes import run as fakes
+
+    async def run_test():
+        services = await fakes.start(sources=50, photo_size=1024)
+        mocker.patch.object(Config, 'ngw_host', services.ngw_url)
+        mocker.patch.object(Config, 'drive_api_url', services.drive_url)
+        mocker.patch.object(Config, 'tg_api_server', services.telegram_url)
+        mocker.patch.object(Config, 'trace_file', None)
+        try:
+            return await loadtest.run(users=4, sources=50, seed=3, dp=dispatcher)
+        finally:
+            await services.close()
+
+    report = asyncio.run(run_test())
+    assert report['surveys'] == 4 and report['error_rate'] == 0
+    assert report['steps']['save']['n'] == 4 and report['steps']['start']['p50'] > 0
+    text = loadtest.format_report(report)
+    assert 'Опросов: 4' in text and 'Доля ошибок: 0.00 %' in text
+
+
+def test_inline_pick_selects_source_through_dispatcher(mocker, dispatcher):
+    """Выбор в inline-поиске на шаге 1: сообщение "/start <ИД>" проходит через Dispatcher и начинает опрос."""
+    import loadtest
+    import main
+    from config import Config
+    from fakes import run as fakes
+
+    async def run_test():
+        services = await fakes.start(sources=50, photo_size=1024)
+        mocker.patch.object(Config, 'ngw_host', services.ngw_url)
+        mocker.patch.object(Config, 'tg_api_server', services.telegram_url)
+        bot = main.create_bot(loadtest.LOADTEST_TOKEN)
+        key = StorageKey(bot_id=bot.id, chat_id=2_000_001, user_id=2_000_001)
+        try:
+            await loadtest.feed(dispatcher, bot, loadtest.text_update(key.user_id, "/start"))
+            assert await dispatcher.storage.get_state(key) == BotStates.fid
+            await loadtest.feed(dispatcher, bot, loadtest.text_update(key.user_id, "/start 7"))
+            assert await dispatcher.storage.get_state(key) == BotStates.position
+            assert (await dispatcher.storage.get_data(key))['fid'] == 7
+        finally:
+            await dispatcher.storage.set_state(key, None)
+            await dispatcher.storage.set_data(key, {})
+            await bot.session.close()
+            await services.close()
 
     asyncio.run(run_test())
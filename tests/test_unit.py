@@ -9,6 +9,8 @@ from handlers.survey_handlers import date_time_now
 from nextgis import get_feature, ngw_post_wi_checkup
 from pydrive import create_folder
 
+from factories import make_checkup, make_source
+
 
 @pytest.fixture
 def mock_datetime_now():
@@ -74,22 +76,23 @@ def test_get_feature_not_found(mocker):
 
 
 def test_ngw_post_wi_checkup_success(mocker):
-    """Тестирование функции ngw_post_wi_checkup при успешном ответе от API."""
-    # Мокируем requests.post и requests.put
+    """Тестирование функции ngw_post_wi_checkup при успешном ответе от API: один POST, поле id - пакетно."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', set())
     mock_post_response = Mock()
     mock_post_response.status_code = 200
     mock_post_response.content.decode.return_value = json.dumps({'id': 123})
     mocker.patch('nextgis.requests.post', return_value=mock_post_response)
-
-    mock_put_response = Mock()
-    mock_put_response.status_code = 200
-    mocker.patch('nextgis.requests.put', return_value=mock_put_response)
+    mocker.patch('nextgis.requests.get', return_value=Mock(status_code=200, content=b'[]'))
+    mock_put = mocker.patch('nextgis.requests.put')
 
     # Вызываем функцию
     result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', date_time_now(), 'geom')
 
-    # Проверяем результат
+    # Проверяем результат: PUT не выполнялся, ИД ожидает заполнения поля id
     assert result is True
+    mock_put.assert_not_called()
+    assert nextgis._backfill == {123}
 
 
 def test_ngw_post_wi_checkup_post_fails(mocker):
@@ -98,6 +101,7 @@ def test_ngw_post_wi_checkup_post_fails(mocker):
     mock_post_response = Mock()
     mock_post_response.status_code = 500
     mocker.patch('nextgis.requests.post', return_value=mock_post_response)
+    mocker.patch('nextgis.requests.get', return_value=Mock(status_code=200, content=b'[]'))
 
     # Вызываем функцию
     result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', date_time_now(), 'geom')
@@ -106,23 +110,189 @@ def test_ngw_post_wi_checkup_post_fails(mocker):
     assert result is None
 
 
-def test_ngw_post_wi_checkup_put_fails(mocker):
-    """Тестирование функции ngw_post_wi_checkup, когда PUT-запрос не удался."""
-    # Мокируем requests.post и requests.put
-    mock_post_response = Mock()
-    mock_post_response.status_code = 200
-    mock_post_response.content.decode.return_value = json.dumps({'id': 123})
-    mocker.patch('nextgis.requests.post', return_value=mock_post_response)
+def test_ngw_post_wi_checkup_retry_with_key_is_idempotent(mocker):
+    """Повтор с тем же ключом не создаёт вторую запись; при ошибке проверки запись не создаётся."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', set())
+    mocker.patch.object(nextgis.Config, 'checkup_key_field', 'Ключ_сохранения')
+    mock_get_response = Mock()
+    mock_get_response.status_code = 200
+    mock_get_response.content = json.dumps([{'id': 77, 'fields': {'id': None}}]).encode()
+    mock_get = mocker.patch('nextgis.requests.get', return_value=mock_get_response)
+    mock_post = mocker.patch('nextgis.requests.post')
 
-    mock_put_response = Mock()
-    mock_put_response.status_code = 500
-    mocker.patch('nextgis.requests.put', return_value=mock_put_response)
+    result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', date_time_now(), 'geom',
+                                 key='save-abc')
 
-    # Вызываем функцию
-    result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', date_time_now(), 'geom')
+    assert result is True
+    mock_post.assert_not_called()
+    assert 'fld_Ключ_сохранения=save-abc' in mock_get.call_args.args[0]
+    assert nextgis._backfill == {77}
 
-    # Проверяем, что функция возвращает None
+    mock_get_response.status_code = 500
+    result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', date_time_now(), 'geom',
+                                 key='save-def')
     assert result is None
+    mock_post.assert_not_called()
+
+
+def test_post_checkups_without_key_on_server_without_batch_patch(mocker):
+    """Настройки по умолчанию, сервер без PATCH набора объектов: проверки создаются по одной запросами POST."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', set())
+    mocker.patch.object(nextgis, '_patch_unsupported', set())
+    mocker.patch.object(nextgis.Config, 'checkup_key_field', '')
+    mocker.patch('nextgis.requests.patch', return_value=Mock(status_code=405))
+    mocker.patch('nextgis.requests.get', return_value=Mock(status_code=200, content=b'[]'))
+    ids = iter([21, 22])
+    mock_post = mocker.patch('nextgis.requests.post', side_effect=lambda url, **kwargs: Mock(
+        status_code=200, json=Mock(return_value={'id': next(ids)})))
+    checkup = dict(checkout='осмотр', water='имеется', workable='возможна', entrance='возможен',
+                   plate_exist='имеется', date_time=date_time_now(), geom='POINT(1 2)', key=nextgis.new_checkup_key())
+
+    results = nextgis.ngw_post_wi_checkups([dict(checkup, fid_wi=1), dict(checkup, fid_wi=2)])
+
+    assert results == [True, True]
+    assert mock_post.call_count == 2 and nextgis._backfill == {21, 22}
+
+
+def test_checkup_without_key_field_matched_by_source_and_time(mocker):
+    """Поле для ключа не задано: ключ не пишется, повтор записи определяется по водоисточнику и дате-времени опроса."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', set())
+    mocker.patch.object(nextgis.Config, 'checkup_key_field', '')
+    mock_get = mocker.patch('nextgis.requests.get', return_value=Mock(status_code=200, content=b'[]'))
+    mock_post = mocker.patch('nextgis.requests.post',
+                             return_value=Mock(status_code=200, content=json.dumps({'id': 5}).encode()))
+    moment = {'year': 2025, 'month': 8, 'day': 1, 'hour': 9, 'minute': 5}
+
+    assert nextgis.new_checkup_key() is None
+    result = ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', moment, 'geom',
+                                 key='save-abc')
+
+    assert result is True
+    assert 'fld_ИД_ВИ=1&fld_Дата_время=2025-08-01T09:05:00&' in mock_get.call_args.args[0]
+    assert 'save-abc' not in json.loads(mock_post.call_args.kwargs['data'])['fields'].values()
+
+    # Повтор /save: запись уже есть - новая не создаётся
+    mock_get.return_value = Mock(status_code=200, content=json.dumps([{'id': 5, 'fields': {'id': 5}}]).encode())
+    assert ngw_post_wi_checkup(1, 'checkout', 'water', 'workable', 'entrance', 'plate_exist', moment, 'geom') is True
+    assert mock_post.call_count == 1
+
+
+def test_post_checkups_rechecks_key_before_recreating(mocker):
+    """Исход пакета проверок неизвестен: проверка создаётся, только если её нет по ключу (без ключа - по водоисточнику
+    и времени)."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', set())
+    mocker.patch.object(nextgis.Config, 'checkup_key_field', 'Ключ_сохранения')
+    mocker.patch('nextgis.ngw_write_features',
+                 return_value=[nextgis.WriteResult(index, error='таймаут') for index in range(3)])
+    lookups = {}
+
+    def find(fid_wi, date_time, key=None):
+        key = key or fid_wi
+        lookups[key] = lookups.get(key, 0) + 1
+        # save-a записана PATCH-запросом, ответ на который не дошёл: видна при повторном поиске
+        return key == 'save-a' and lookups[key] > 1
+
+    mocker.patch('nextgis._find_checkup', side_effect=find)
+    mock_post = mocker.patch('nextgis.ngw_request',
+                             return_value=Mock(status_code=200, content=json.dumps({'id': 12}).encode()))
+    checkup = dict(checkout='осмотр', water='имеется', workable='возможна', entrance='возможен',
+                   plate_exist='имеется', date_time=date_time_now(), geom='POINT(1 2)')
+
+    results = nextgis.ngw_post_wi_checkups([dict(checkup, fid_wi=1, key='save-a'),
+                                            dict(checkup, fid_wi=2, key='save-b'), dict(checkup, fid_wi=3)])
+
+    assert results == [True, True, True]
+    assert lookups == {'save-a': 2, 'save-b': 2, 3: 2}
+    assert mock_post.call_count == 2 and nextgis._backfill == {12}
+
+
+def test_checkup_ids_backfilled_in_one_patch(mocker):
+    """Поле id заполняется одним PATCH; при ошибке (и пакета, и одиночных PUT) ИД остаются в очереди."""
+    import nextgis
+    mocker.patch.object(nextgis, '_backfill', {5, 3})
+    mock_patch_response = Mock()
+    mock_patch_response.status_code = 500
+    mock_patch = mocker.patch('nextgis.requests.patch', return_value=mock_patch_response)
+    mocker.patch('nextgis.requests.put', return_value=mock_patch_response)
+
+    assert nextgis.backfill_checkup_ids() == 0
+    assert nextgis._backfill == {3, 5}
+
+    mock_patch_response.status_code = 200
+    assert nextgis.backfill_checkup_ids() == 2
+    assert json.loads(mock_patch.call_args.kwargs['data']) == [{'id': 3, 'fields': {'id': 3}},
+                                                                 {'id': 5, 'fields': {'id': 5}}]
+    assert nextgis._backfill == set() and nextgis.backfill_checkup_ids() == 0
+
+
+def test_write_features_falls_back_to_single_requests_and_retries_failed(mocker):
+    """PATCH не поддерживается (405) - объекты пишутся по одному, повторяются только неудачные изменения."""
+    import nextgis
+    mocker.patch('nextgis.time.sleep')
+    mocker.patch.object(nextgis, '_patch_unsupported', set())
+    mock_patch = mocker.patch('nextgis.requests.patch', return_value=Mock(status_code=405))
+    attempts = {}
+
+    def put(url, **kwargs):
+        feature_id = int(url.rsplit('/', 1)[1])
+        attempts[feature_id] = attempts.get(feature_id, 0) + 1
+        status = 500 if feature_id == 2 and attempts[feature_id] == 1 else 200
+        return Mock(status_code=status, json=Mock(return_value={'id': feature_id}))
+
+    mocker.patch('nextgis.requests.put', side_effect=put)
+    mock_post = mocker.patch('nextgis.requests.post',
+                             return_value=Mock(status_code=200, json=Mock(return_value={'id': 10})))
+
+    results = nextgis.ngw_write_features(91, [{'id': 1, 'fields': {'name': 'a'}}, {'id': 2, 'fields': {'name': 'b'}},
+                                              {'fields': {'name': 'c'}, 'geom': 'POINT(1 2)'}], batch=2, retries=1)
+
+    assert [(result.ok, result.feature_id) for result in results] == [(True, 1), (True, 2), (True, 10)]
+    assert attempts == {1: 1, 2: 2}
+    assert mock_post.call_count == 1 and 'id' not in json.loads(mock_post.call_args.kwargs['data'])
+    # После ответа 405 PATCH для ресурса больше не отправляется: следующие создания - сразу POST
+    assert [result.ok for result in nextgis.ngw_write_features(91, [{'fields': {'name': 'd'}}])] == [True]
+    assert mock_patch.call_count == 1 and mock_post.call_count == 2
+
+
+def test_write_features_does_not_recreate_after_unknown_batch_outcome(mocker):
+    """Ответ 5xx на PATCH: изменения пишутся по одному, создаваемые объекты не отправляются повторно."""
+    import nextgis
+    mocker.patch.object(nextgis, '_patch_unsupported', set())
+    mocker.patch('nextgis.requests.patch', return_value=Mock(status_code=502))
+    mocker.patch('nextgis.requests.put', return_value=Mock(status_code=200, json=Mock(return_value={'id': 1})))
+    mock_post = mocker.patch('nextgis.requests.post')
+
+    results = nextgis.ngw_write_features(91, [{'id': 1, 'fields': {'name': 'a'}}, {'fields': {'name': 'b'}}],
+                                         retries=0)
+
+    assert [result.ok for result in results] == [True, False]
+    assert results[1].error and mock_post.call_count == 0
+
+
+def test_drive_threads_share_credentials(mocker):
+    """Потоки пула drive: одна авторизация сервисного аккаунта на все потоки."""
+    import threading
+    import time
+    import pydrive
+    mocker.patch.object(pydrive, '_gauth', None)
+    google_auth = mocker.patch('pydrive.GoogleAuth')
+    google_auth.return_value.access_token_expired = False
+    google_auth.return_value.ServiceAuth.side_effect = lambda: time.sleep(0.05)
+    mocker.patch('pydrive._load_pydrive2')
+    seen = []
+
+    threads = [threading.Thread(target=lambda: seen.append(pydrive.login_with_service_account()))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert google_auth.call_count == 1 and seen[0] is seen[1]
 
 
 @patch('pydrive.GoogleAuth')
@@ -159,3 +329,763 @@ def test_create_folder_trashed(mock_google_drive, mock_google_auth, mocker):
 
     # Проверка
     assert folder_id == 'new_folder_id_recursive'
+
+
+def test_tracing_exports_linked_spans(tmp_path, mocker):
+    """Тестирование записи трассы: дочерние спаны связаны с корневым и попадают в отчёт."""
+    import tracing
+    trace_file = tmp_path / 'traces.jsonl'
+    mocker.patch('tracing.Config.trace_file', str(trace_file))
+
+    with tracing.start_trace('save', fid=1) as root:
+        with tracing.span('stage.1.ngw_lookup'):
+            with tracing.span('ngw.get_feature', kind='client', bytes=10):
+                pass
+
+    spans = tracing.load_spans(str(trace_file))
+    assert len(spans) == 3
+    assert {item['traceId'] for item in spans} == {root.trace_id}
+    stage = next(item for item in spans if item['name'] == 'stage.1.ngw_lookup')
+    call = next(item for item in spans if item['name'] == 'ngw.get_feature')
+    assert call['parentSpanId'] == stage['spanId']
+    assert call['kind'] == 'SPAN_KIND_CLIENT'
+    assert 'stage.1.ngw_lookup' in tracing.report(spans)
+
+
+def test_bounded_executor_rejects_when_saturated():
+    """Тестирование пула потоков: при заполненной очереди вызов сразу отклоняется."""
+    import asyncio
+    import threading
+    from executors import BoundedExecutor, ExecutorSaturated
+
+    async def run_test():
+        executor = BoundedExecutor('test', max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert executor.active == 1
+        assert executor.queue_depth == 1
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: None)
+        release.set()
+        assert await asyncio.gather(*running) == [True, True]
+        executor.shutdown()
+
+    asyncio.run(run_test())
+
+
+def test_bounded_executor_map_runs_in_caller_when_saturated():
+    """Тестирование map пула потоков: вызовы сверх пула и очереди выполняются в вызывающем потоке."""
+    import threading
+    from executors import BoundedExecutor
+
+    executor = BoundedExecutor('test', max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    def call(number):
+        # Первый вызов занимает единственный поток пула, пока второй не выполнится
+        if number:
+            release.set()
+        else:
+            release.wait(1)
+        return number, threading.current_thread().name
+
+    threads = executor.map(call, range(2))
+    assert [number for number, _ in threads] == [0, 1]
+    assert threads[0][1].startswith('test-') and threads[1][1] == threading.current_thread().name
+    assert executor.active == 0
+    executor.shutdown()
+
+
+def test_progress_reporter_coalesces_edits():
+    """Тестирование сообщения о ходе выполнения: частые обновления объединяются, итог отправляется."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from progress import ProgressReporter
+
+    async def run_test():
+        message = MagicMock()
+        message.chat.id = 'progress-test'
+        message.edit_text = AsyncMock()
+        reporter = ProgressReporter(message, 'Передача данных...', interval=0.05)
+        for step in range(1, 9):
+            reporter.append(f'{step}. этап')
+        await reporter.flush()
+        texts = [call.args[0] for call in message.edit_text.await_args_list]
+        assert len(texts) <= 2
+        assert texts[-1].endswith('8. этап')
+
+    asyncio.run(run_test())
+
+
+def test_ngw_breaker_opens_after_timeouts(mocker):
+    """Тестирование выключателя NextGIS WEB: после серии таймаутов запросы сразу отклоняются."""
+    import requests
+    import nextgis
+    from resilience import CircuitBreaker
+
+    mocker.patch('nextgis.breaker', CircuitBreaker('ngw-test', failure_threshold=2, reset_timeout=60))
+    mock_get = mocker.patch('nextgis.requests.get', side_effect=requests.Timeout('read timeout'))
+
+    for _ in range(2):
+        with pytest.raises(nextgis.NGWUnavailable):
+            get_feature(1, 1)
+    assert nextgis.breaker.state == 'open'
+
+    with pytest.raises(nextgis.NGWUnavailable):
+        get_feature(1, 1)
+    assert mock_get.call_count == 2
+    assert mock_get.call_args.kwargs['timeout'] == nextgis.Config.ngw_timeout
+
+
+def test_ngw_hedged_read_is_one_attempt(mocker):
+    """Страхующий повтор: медленный первый запрос, ответ второго; пара - одно обращение для метрик и выключателя."""
+    import threading
+    import time as time_module
+    import requests
+    import metrics
+    import nextgis
+    from resilience import CircuitBreaker
+
+    mocker.patch.object(nextgis.Config, 'ngw_hedge_delay', 0.05)
+    mocker.patch('nextgis.breaker', CircuitBreaker('ngw-test', failure_threshold=2, reset_timeout=60))
+    metrics.reset()
+    calls = []
+    lock = threading.Lock()
+
+    def slow_first(url, **kwargs):
+        with lock:
+            calls.append(url)
+            number = len(calls)
+        if number == 1:
+            time_module.sleep(0.5)
+        return Mock(status_code=200, number=number)
+
+    mocker.patch('nextgis.requests.get', side_effect=slow_first)
+    r = nextgis.ngw_request('get', 'http://ngw/api/resource/1/feature/1', hedge=True)
+    assert r.number == 2 and len(calls) == 2
+    assert metrics.counter('ngw.requests') == 1 and metrics.counter('hedge.won') == 1
+
+    # Оба запроса пары отказали - один отказ выключателя и одна ошибка в метриках
+    def slow_timeout(url, **kwargs):
+        time_module.sleep(0.1)
+        raise requests.Timeout('read timeout')
+
+    mocker.patch('nextgis.requests.get', side_effect=slow_timeout)
+    with pytest.raises(nextgis.NGWUnavailable):
+        nextgis.ngw_request('get', 'http://ngw/api/resource/1/feature/2', hedge=True)
+    assert metrics.counter('ngw.errors') == 1 and metrics.counter('ngw-test.failures') == 1
+    assert nextgis.breaker.state == 'closed'
+    metrics.reset()
+
+
+def test_concurrent_identical_reads_are_coalesced(mocker):
+    """Тестирование объединения одинаковых одновременных запросов get_feature в один."""
+    import threading
+    import time
+    import metrics
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = threading.Event()
+
+    def slow_get(*args, **kwargs):
+        started.set()
+        time.sleep(0.2)
+        response = Mock()
+        response.status_code = 200
+        response.content = json.dumps({'id': 7, 'fields': {'name': 'ПГ-1'}}).encode()
+        return response
+
+    mock_get = mocker.patch('nextgis.requests.get', side_effect=slow_get)
+    coalesced = metrics.counter('singleflight.ngw.coalesced')
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        first = pool.submit(get_feature, 91, 7, geom='no')
+        started.wait()
+        others = [pool.submit(get_feature, 91, 7, geom='no') for _ in range(4)]
+        results = [first.result()] + [future.result() for future in others]
+
+    assert mock_get.call_count == 1
+    assert all(result['fields']['name'] == 'ПГ-1' for result in results)
+    assert metrics.counter('singleflight.ngw.coalesced') - coalesced == 4
+
+
+def test_update_anonymizer_keeps_scenario_and_hides_identity():
+    """Тестирование обезличивания записываемых обновлений."""
+    from replay import Anonymizer
+
+    anonymize = Anonymizer('salt')
+    update = {'update_id': 1, 'message': {
+        'message_id': 5, 'date': 1, 'text': 'позвоните мне 89001234567',
+        'chat': {'id': 478031430, 'type': 'private', 'first_name': 'Иван', 'username': 'ivan'},
+        'from': {'id': 478031430, 'is_bot': False, 'first_name': 'Иван', 'last_name': 'Петров'},
+        'photo': [{'file_id': 'AgACAgIAAxkBAAIB', 'file_unique_id': 'AQADx', 'width': 1, 'height': 1}]}}
+
+    result = anonymize(update)['message']
+    assert result['from']['id'] == result['chat']['id'] != 478031430
+    assert result['from']['id'] == anonymize.pseudonym(478031430)
+    assert 'last_name' not in result['from'] and 'username' not in result['chat']
+    assert result['from']['first_name'] == 'Inspector'
+    assert set(result['text']) == {'*'}
+    assert result['photo'][0]['file_id'] != 'AgACAgIAAxkBAAIB'
+
+    command = anonymize({'message': {'text': '/start 125', 'entities': [{'type': 'bot_command', 'offset': 0,
+                                                                          'length': 6}]}})['message']
+    assert command['text'] == '/start 125'
+    assert command['entities'][0]['type'] == 'bot_command'
+
+    inline = anonymize({'inline_query': {'id': '1', 'query': 'Сургут Ленина 12', 'offset': '',
+                                         'from': {'id': 478031430, 'is_bot': False, 'first_name': 'Иван'}}})
+    assert inline['inline_query']['query'] == '*' * 16
+
+
+def test_update_recorder_flushes_periodically(mocker, tmp_path):
+    from aiogram.types import Update
+    from config import Config
+    from replay import UpdateRecorder, load
+
+    mocker.patch.object(Config, 'record_flush_interval', 3600)
+    path = str(tmp_path / 'updates.jsonl.gz')
+    recorder = UpdateRecorder(path, salt='salt')
+    for update_id in range(1, 4):
+        recorder.write(Update(update_id=update_id))
+    flush = mocker.spy(recorder._file, 'flush')
+    recorder.write(Update(update_id=4))
+    assert flush.call_count == 0
+    recorder.close()
+    assert [record['u']['update_id'] for record in load(path)] == [1, 2, 3, 4]
+
+
+def test_bench_compare_flags_regression():
+    """Тестирование сравнения результатов бенчмарков с базовой линией."""
+    from bench import compare
+
+    baseline = {'results': {'fsm': {'median_us': 10.0}, 'keyboards': {'median_us': 100.0}}}
+    current = {'results': {'fsm': {'median_us': 12.0}, 'keyboards': {'median_us': 50.0}, 'new': {'median_us': 1.0}}}
+
+    report, regression = compare(current, baseline, threshold=0.10)
+    assert regression is True
+    assert 'регрессия' in report and 'ускорение' in report and 'новый' in report
+    assert compare(baseline, baseline, threshold=0.10)[1] is False
+    # Бенчмарк без базовой линии - сбой сравнения, даже без регрессий
+    assert compare({'results': {'fsm': {'median_us': 10.0}, 'new': {'median_us': 1.0}}}, baseline, 0.10)[1] is True
+
+
+def test_water_source_decoded_from_bytes_and_schema_checked(mocker):
+    """Тестирование разбора водоисточника в модель и ошибки при несоответствии схеме."""
+    import nextgis
+    from fakes.ngw import make_water_sources
+    from models import SchemaError
+
+    feature = {'id': 7, **make_water_sources(7)[7]}
+    response = Mock()
+    response.status_code = 200
+    response.content = json.dumps(feature, ensure_ascii=False).encode()
+    mocker.patch('nextgis.requests.get', return_value=response)
+
+    source = nextgis.get_water_source(7)
+    assert source.id == 7
+    assert source.fields.locality == feature['fields']['Поселение']
+    assert source.folder_name.startswith(f"ИД-7 {feature['fields']['name']} ")
+
+    del feature['fields']['ИД_папки_Гугл_диск']
+    response.content = json.dumps(feature, ensure_ascii=False).encode()
+    with pytest.raises(SchemaError, match='ИД_папки_Гугл_диск'):
+        nextgis.get_water_source(8)
+
+
+def test_snapshot_roundtrip_memory_mapped_with_overlay(tmp_path):
+    """Тестирование записи снимка слоя, загрузки отображением в память и наложения изменений."""
+    import numpy as np
+    from fakes.ngw import make_water_sources
+    from models import WaterSource, decode
+    from snapshot import Snapshot
+
+    features = [{'id': fid, **feature} for fid, feature in make_water_sources(50).items()]
+    sources = decode(WaterSource, json.dumps(features, ensure_ascii=False).encode(), many=True)
+    Snapshot.from_sources(sources, synced_at=100).save(str(tmp_path))
+
+    loaded = Snapshot.load(str(tmp_path))
+    assert isinstance(loaded.columns['id'], np.memmap)
+    assert loaded.meta['max_id'] == 50 and len(loaded) == 50
+    assert loaded.get(7) == sources[6]
+    assert loaded.get(51) is None
+
+    changed = WaterSource(id=51, fields=sources[0].fields)
+    loaded.apply(changed=[changed], deleted=[7])
+    assert loaded.get(7) is None and loaded.get(51) == changed
+    assert len(loaded) == 50 and loaded.meta['max_id'] == 51
+
+    loaded.save(str(tmp_path))
+    reloaded = Snapshot.load(str(tmp_path))
+    assert reloaded.get(7) is None and reloaded.get(51) == changed
+    assert len([name for name in tmp_path.iterdir() if name.is_dir()]) == 1
+
+
+def test_sync_applies_deltas_and_emits_changes(mocker):
+    """Тестирование инкрементальной синхронизации: новые объекты, удаления, проверки и события."""
+    import asyncio
+    import snapshot
+    import sync
+    import time
+
+    mocker.patch.object(snapshot, 'layer', snapshot.Snapshot.from_sources([make_source(1), make_source(2)],
+                                                                           synced_at=1))
+    mocker.patch.object(sync.Config, 'snapshot_dir', None)
+    get_sources = mocker.patch('nextgis.get_water_sources', return_value=[make_source(3)])
+    fetch_ids = mocker.patch('nextgis.fetch_features', side_effect=lambda resource_id, **kwargs: json.dumps(
+        [{'id': 2}, {'id': 3}][kwargs['offset']:kwargs['offset'] + kwargs['limit']]).encode())
+    # Поле id не заполнено: проверки созданы не ботом или ещё без back-fill
+    checkups = {fid: make_checkup(fid, source_id, (2025, 8, day), id=None)
+                for fid, source_id, day in ((7, 2, 3), (6, 2, 5), (4, 3, 1))}
+    # Страницы по убыванию ИД объекта: 7 и 6 новые, 4 уже известен - чтение останавливается
+    pages = [[checkups[7], checkups[6]], [checkups[4]]]
+    get_checkups = mocker.patch('nextgis.get_checkups', side_effect=lambda **kwargs: pages[kwargs['offset'] // 2])
+    mocker.patch.object(sync.Config, 'snapshot_page', 2)
+
+    events = []
+    sync.subscribe(events.append)
+    try:
+        syncer = sync.LayerSync()
+        syncer.last_rebuild = time.time()
+        syncer.checkup_watermark = 5
+        asyncio.run(syncer.run_once())
+    finally:
+        sync.unsubscribe(events.append)
+
+    assert get_sources.call_args.kwargs['fld_filter'] == ['fld_ИД__gt=2']
+    assert snapshot.layer.get(3) == make_source(3) and snapshot.layer.get(1) is None
+    assert list(snapshot.layer.ids()) == [2, 3]
+    assert get_checkups.call_count == 2 and get_checkups.call_args.kwargs['order_by'] == ['-id']
+    # Из двух новых проверок водоисточника 2 хранится более поздняя по дате
+    assert syncer.checkup_watermark == 7 and syncer.checkups == [checkups[6]]
+    assert [(event.resource, len(event.changed), event.deleted) for event in events] == [
+        ('sources', 1, []), ('sources', 0, [1]), ('checkups', 2, [])]
+    # ИД читаются страницами, соседние перекрываются на один объект
+    assert [call.kwargs['offset'] for call in fetch_ids.call_args_list] == [0, 1]
+
+    # Страница не получена, страницы сдвинулись (удаление во время чтения) или ответ пустой: удалений нет,
+    # проверка повторяется в следующем цикле
+    for response in ([b'[{"id": 2}, {"id": 3}]', None], [b'[{"id": 2}, {"id": 3}]', b'[{"id": 4}]'], [b'[]']):
+        fetch_ids.side_effect = response
+        syncer.last_id_scan = 0.0
+        assert asyncio.run(syncer.scan_deleted()).deleted == []
+        assert list(snapshot.layer.ids()) == [2, 3] and syncer.last_id_scan == 0.0
+
+
+def test_sync_rebuilds_snapshot_without_modified_field(mocker):
+    """Без поля даты изменения снимок периодически пересобирается полностью: изменения объектов видны."""
+    import asyncio
+    import time
+    import snapshot
+    import sync
+
+    mocker.patch.object(snapshot, 'layer', snapshot.Snapshot.from_sources([make_source(1, name='ПГ-старое')],
+                                                                           synced_at=1))
+    mocker.patch.object(sync.Config, 'snapshot_dir', None)
+    mocker.patch.object(sync.Config, 'sync_modified_field', None)
+    mocker.patch('nextgis.backfill_checkup_ids')
+    mocker.patch('nextgis.get_checkups', return_value=[])
+    mocker.patch('nextgis.get_water_sources', return_value=[make_source(1, name='ПГ-новое')])
+
+    events = []
+    sync.subscribe(events.append)
+    try:
+        syncer = sync.LayerSync()
+        syncer.last_rebuild = time.time() - sync.Config.sync_rebuild_interval - 1
+        asyncio.run(syncer.run_once())
+    finally:
+        sync.unsubscribe(events.append)
+
+    assert snapshot.layer.get(1).fields.name == 'ПГ-новое'
+    assert [event.reloaded for event in events] == [True]
+    assert time.time() - syncer.last_rebuild < 5
+
+
+def test_search_index_prefix_typo_and_ranking():
+    """Тестирование локального поиска водоисточников: префиксы, опечатки, ранжирование, удаление."""
+    from search import SearchIndex
+
+    def source(fid, name, locality, street, building, landmark=None):
+        return make_source(fid, name=name, locality=locality, street=street, building=building, landmark=landmark)
+
+    index = SearchIndex.build([
+        source(1, 'ПГ-1', 'Сургут', 'Ленина', '12'),
+        source(2, 'ПГ-2', 'Сургут', 'Ленина', '120'),
+        source(3, 'ПГ-3', 'Лянтор', 'Мира', '12', 'у Ленина'),
+        source(4, 'ПВ-4', 'Белый Яр', 'Мира', '5'),
+    ])
+
+    found = [fid for fid, _ in index.search('ленина 12')]
+    assert found[0] == 1 and sorted(found) == [1, 2, 3]
+    assert [fid for fid, _ in index.search('лен')][:2] == [1, 2]
+    found = [fid for fid, _ in index.search('ленена 12')]
+    assert found[0] == 1 and sorted(found) == [1, 2, 3]
+    assert [fid for fid, _ in index.search('белый ёр')] == []
+    assert [fid for fid, _ in index.search('мира 5')] == [4]
+
+    index.remove(1)
+    assert sorted(fid for fid, _ in index.search('ленина 12')) == [2, 3]
+
+
+def test_export_streams_pages_and_joins_sources_locally(mocker, tmp_path):
+    """Тестирование выгрузки проверок: постраничное чтение, локальное присоединение водоисточников, форматы."""
+    import csv
+    import datetime
+    import msgspec
+    import openpyxl
+    import export
+    import snapshot
+    from models import Organization, OrganizationFields
+
+    source = make_source(7, geom='POINT(8171735.6 8680155.0)', building='5', company_id=2)
+    mocker.patch.object(snapshot, 'layer', snapshot.Snapshot.from_sources([source]))
+    mocker.patch.object(export.Config, 'export_page', 2)
+    mocker.patch('nextgis.get_organizations', return_value=[Organization(id=2, fields=OrganizationFields('МУП'))])
+    checkups = [make_checkup(fid, 7 if fid != 3 else 99, (2025, 8, fid, 12, 30), plate='отсутствует', temperature=-5.0)
+                for fid in range(1, 4)]
+    get_checkups = mocker.patch('nextgis.fetch_features', side_effect=lambda resource_id, **kwargs:
+                                msgspec.json.encode(checkups[kwargs['offset']:kwargs['offset'] + 2]))
+    get_source = mocker.patch('nextgis.get_water_source')
+
+    count = export.export(str(tmp_path / 'out.csv'), 'csv', datetime.date(2025, 8, 1), datetime.date(2025, 9, 1))
+    assert count == 3 and not get_source.called
+    assert sorted(call.kwargs['offset'] for call in get_checkups.call_args_list)[:2] == [0, 2]
+    assert get_checkups.call_args.kwargs['fld_filter'] == ['fld_Дата_время__ge=2025-08-01',
+                                                           'fld_Дата_время__lt=2025-09-01']
+    assert get_checkups.call_args.kwargs['order_by'] == ['id']
+    with open(tmp_path / 'out.csv', encoding='utf-8-sig') as file:
+        rows = list(csv.reader(file, delimiter=';'))
+    assert rows[0] == export.COLUMNS and len(rows) == 4
+    assert rows[1][3:9] == ['ПГ-7', 'Сургут', 'Мира', '5', '', 'МУП'] and rows[3][3] == ''
+
+    export.export(str(tmp_path / 'out.xlsx'), 'xlsx', datetime.date(2025, 8, 1), datetime.date(2025, 9, 1))
+    sheet = openpyxl.load_workbook(tmp_path / 'out.xlsx').active
+    assert sheet.max_row == 4 and sheet['B2'].value == datetime.datetime(2025, 8, 1, 12, 30)
+
+    export.export(str(tmp_path / 'out.geojson'), 'geojson', datetime.date(2025, 8, 1), datetime.date(2025, 9, 1))
+    with open(tmp_path / 'out.geojson', encoding='utf-8') as file:
+        collection = json.load(file)
+    lon, lat = collection['features'][0]['geometry']['coordinates']
+    assert round(lon, 2) == 73.41 and round(lat, 2) == 61.24
+    assert collection['features'][2]['geometry'] is None
+
+    # Неполученная страница - ошибка выгрузки, а не её конец
+    get_checkups.side_effect = lambda resource_id, **kwargs: (
+        None if kwargs['offset'] == 2 else msgspec.json.encode(checkups[kwargs['offset']:kwargs['offset'] + 2]))
+    with pytest.raises(RuntimeError, match='страница с 2'):
+        export.export(str(tmp_path / 'failed.csv'), 'csv', datetime.date(2025, 8, 1), datetime.date(2025, 9, 1))
+
+    assert export.parse_period([], today=datetime.date(2025, 1, 15)) == (datetime.date(2024, 12, 1),
+                                                                           datetime.date(2025, 1, 1))
+    assert export.parse_period(['2025-08-01', '2025-08-10']) == (datetime.date(2025, 8, 1),
+                                                                 datetime.date(2025, 8, 11))
+
+
+def test_coverage_overdue_and_failure_rates():
+    """Тестирование расчёта охвата проверками, просроченных водоисточников и доли отказов."""
+    import datetime
+    import analytics
+    import snapshot
+
+    layer = snapshot.Snapshot.from_sources([make_source(1, company_id=1), make_source(2, company_id=1),
+                                            make_source(3, locality='Лянтор', company_id=2),
+                                            make_source(4, locality='Лянтор')])
+    checkups = [make_checkup(1, 1, (2024, 1, 10), water='отсутствует'),  # Старая проверка с отказом
+                make_checkup(2, 1, (2025, 7, 1)),
+                make_checkup(3, 2, (2024, 12, 1)),                        # Просрочена
+                make_checkup(4, 3, (2025, 6, 1), entrance='невозможен')]
+    result = analytics.compute(analytics.sources_frame(layer), analytics.checkups_frame(checkups),
+                               {1: 'МУП', 2: 'ООО'}, 183, now=datetime.datetime(2025, 8, 1))
+
+    assert result.totals['inspected'] == 2 and result.totals['overdue'] == 2 and result.totals['never'] == 1
+    assert result.totals['no_water'] == 0 and result.totals['no_entrance'] == 1
+    assert list(result.overdue['id']) == [4, 2]
+    assert result.by_locality.loc['Сургут', 'coverage'] == 0.5
+    assert result.by_locality.loc['Лянтор', 'failure'] == 1.0
+    assert result.by_company.loc['не указан', 'sources'] == 1
+    assert 'ИД 4 ПГ-4, Лянтор - никогда' in analytics.summary(result)
+
+
+def test_coverage_not_cached_when_data_changes_during_compute(mocker):
+    """Изменение данных во время расчёта охвата: результат возвращается, но не попадает в кэш."""
+    import asyncio
+    import analytics
+    import snapshot
+    import sync
+
+    mocker.patch.object(analytics, '_cache', None)
+    mocker.patch.object(analytics, '_organizations', {})
+    mocker.patch.object(analytics, 'sources_frame')
+    mocker.patch.object(analytics, 'checkups_frame')
+    results = iter(['stale', 'fresh'])
+
+    def compute(*args):
+        result = next(results)
+        if result == 'stale':
+            analytics._invalidate(sync.Change(sync.CHECKUPS))
+        return result
+
+    mocker.patch.object(analytics, 'compute', side_effect=compute)
+
+    async def run_test():
+        assert await analytics.coverage() == 'stale'
+        assert analytics._cache is None
+        assert await analytics.coverage() == 'fresh'
+        assert await analytics.coverage() == 'fresh'
+
+    asyncio.run(run_test())
+    assert analytics.compute.call_count == 2
+    # В пул передаются копии, взятые в цикле событий
+    layer = analytics.sources_frame.call_args.args[0]
+    assert layer is not snapshot.layer and layer.overlay is not snapshot.layer.overlay
+    assert isinstance(analytics.checkups_frame.call_args.args[0], list)
+
+
+def test_startup_within_budget_without_heavy_imports():
+    """Тестирование бюджета запуска: тяжёлые зависимости не загружаются до первого использования."""
+    import startup
+    from config import Config
+
+    result = startup.measure()
+    assert result['heavy'] == []
+    assert result['seconds'] <= Config.startup_budget, startup.report(result)
+
+
+def test_readiness_after_warm_up_and_dependency_checks(mocker):
+    """Готовность: 503 до прогрева, после прогрева - по результатам проверок NextGIS WEB и Google Drive."""
+    import asyncio
+    import health
+
+    async def run_test():
+        bot = MagicMock()
+        bot.get_me = mocker.AsyncMock()
+        mocker.patch('health._ngw_probe')
+        mocker.patch('health._drive_probe', side_effect=RuntimeError('нет доступа'))
+        mocker.patch('templates.preload_companies', return_value=3)
+        mocker.patch.object(health, 'warmed_up', False)
+
+        assert (await health.readyz(None)).status == 503
+        await health.warm_up(bot, 'telegram,organizations,geo,unknown')
+        body = json.loads((await health.readyz(None)).text)
+        assert body['warmed_up'] and not body['ready']
+        assert body['dependencies']['ngw']['ok'] and body['dependencies']['ngw']['latency_ms'] is not None
+        assert 'нет доступа' in body['dependencies']['drive']['error']
+
+        mocker.patch('health._drive_probe')
+        await health.check_all(bot)
+        assert (await health.readyz(None)).status == 200
+        assert (await health.healthz(None)).status == 200
+
+    asyncio.run(run_test())
+
+
+def test_log_sampling_previews_and_correlation_ids(mocker):
+    """Журнал: выборка сообщений по категориям, сокращение тел запросов, ИД трассировки в записях."""
+    import tracing
+    from loguru import logger
+    from logsetup import Sampler, parse_rates, patch, preview
+
+    assert preview({'fields': {'Примечание': 'x' * 500}}, limit=20).endswith('симв.)')
+    assert preview(b'{"id": 1}') == '{"id": 1}'
+
+    mocker.patch.object(tracing.Config, 'trace_file', None)
+    records = []
+    sampler = Sampler(parse_rates('ngw.read=0.25, ngw.payload=0'))
+    sink = logger.patch(patch)
+    handler_id = logger.add(lambda message: records.append(message.record), filter=sampler, level='DEBUG')
+    try:
+        for number in range(8):
+            sink.bind(category='ngw.read').info(f'read {number}')
+            sink.bind(category='ngw.payload').debug('payload')
+        sink.bind(category='ngw.read').warning('read failed')
+        with tracing.start_trace('save') as root:
+            sink.info('in trace')
+        sink.info('plain')
+    finally:
+        logger.remove(handler_id)
+
+    messages = [record['message'] for record in records]
+    assert messages == ['read 0', 'read 4', 'read failed', 'in trace', 'plain']
+    assert sampler.dropped == {'ngw.read': 6, 'ngw.payload': 8}
+    assert records[3]['extra']['correlation_id'] == root.trace_id
+    assert records[4]['extra']['correlation_id'] == '-'
+
+
+def test_shutdown_drains_saves_and_persists_unfinished(mocker, tmp_path):
+    """Завершение: сохранения дожидаются срока, незавершённые (в том числе очередь /next) восстанавливаются"""
+    import asyncio
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    import shutdown
+    from states import BotStates
+
+    path = str(tmp_path / 'pending_saves.jsonl')
+    mocker.patch.object(shutdown, 'stopping', False)
+
+    async def run_test():
+        storage = MemoryStorage()
+        finished = []
+
+        async def save(user_id: int, seconds: float, data: dict):
+            state = FSMContext(storage, StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+            await state.set_data(data)
+            with shutdown.tracking(state):
+                await asyncio.sleep(seconds)
+                finished.append(user_id)
+
+        # Сохранение /save переносит опросы сессии в очередь
+        queue = {'queue': [{'fid': 31, 'uploaded': ['shot_medium_id']}, {'fid': 32}]}
+        tasks = [asyncio.create_task(save(10, 0.01, {'fid': 10})),
+                 asyncio.create_task(save(20, 10, {'fid': 20, 'uploaded': ['shot_medium_id']})),
+                 asyncio.create_task(save(30, 10, queue))]
+        await asyncio.sleep(0)
+        assert shutdown.in_flight() == 3
+        assert await shutdown.drain(timeout=0.2, path=path) == 2
+        assert shutdown.stopping and finished == [10] and tasks[1].cancelled() and tasks[2].cancelled()
+
+        bot = MagicMock()
+        bot.send_message = mocker.AsyncMock()
+        restored = MemoryStorage()
+        assert await shutdown.restore(bot, restored, path) == 2
+        key = StorageKey(bot_id=1, chat_id=20, user_id=20)
+        assert await restored.get_state(key) == BotStates.save.state
+        assert (await restored.get_data(key))['uploaded'] == ['shot_medium_id']
+        messages = {call.args[0]: call.args[1] for call in bot.send_message.await_args_list}
+        assert 'ИД 20 прервано' in messages[20] and 'ИД 31, 32 прервано' in messages[30]
+        key = StorageKey(bot_id=1, chat_id=30, user_id=30)
+        assert await restored.get_state(key) == BotStates.save.state
+        assert await restored.get_data(key) == queue
+        assert await shutdown.restore(bot, restored, path) == 0
+
+    asyncio.run(run_test())
+
+
+def test_sessions_remind_then_expire_abandoned_survey(mocker, tmp_path):
+    """Брошенный опрос: напоминание перед сроком, затем сброс с удалением снимков"""
+    import asyncio
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from config import Config
+    import sessions
+    from states import BotStates
+
+    mocker.patch.dict(sessions._activity, clear=True)
+    mocker.patch.object(Config, 'session_ttl', '*=100,save=0')
+    mocker.patch.object(Config, 'session_reminder', 30)
+    mocker.patch.object(Config, 'staging_dir', str(tmp_path))
+    clock = mocker.patch('sessions.time.monotonic', return_value=1000.0)
+    (tmp_path / 'photo1.jpg').write_bytes(b'jpg')
+
+    async def run_test():
+        storage = MemoryStorage()
+        bot = MagicMock()
+        bot.send_message = mocker.AsyncMock()
+        abandoned = StorageKey(bot_id=1, chat_id=10, user_id=10)
+        saving = StorageKey(bot_id=1, chat_id=20, user_id=20)
+        finished = StorageKey(bot_id=1, chat_id=30, user_id=30)
+        await storage.set_state(abandoned, BotStates.shot_long)
+        await storage.set_data(abandoned, {'fid': 7, 'shot_medium_id': 'photo1'})
+        await storage.set_state(saving, BotStates.save)
+        await storage.get_state(finished)
+        sessions.touched(abandoned)
+
+        assert await sessions.sweep(bot, storage) == 0
+        # Пустая запись завершённого опроса удалена, состояние save без срока
+        assert finished not in storage.storage and saving in sessions._activity
+
+        clock.return_value = 1075.0
+        assert await sessions.sweep(bot, storage) == 0
+        assert bot.send_message.await_count == 1 and 'будет сброшен' in bot.send_message.await_args.args[1]
+        await sessions.sweep(bot, storage)
+        assert bot.send_message.await_count == 1
+
+        clock.return_value = 1100.0
+        assert await sessions.sweep(bot, storage) == 1
+        assert abandoned not in storage.storage and abandoned not in sessions._activity
+        assert 'ИД 7 сброшен' in bot.send_message.await_args.args[1]
+
+    asyncio.run(run_test())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sessions_keep_queued_surveys(mocker):
+    """Сессия с завершёнными опросами в очереди /next не сбрасывается: напоминание и данные сохраняются"""
+    import asyncio
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from config import Config
+    import sessions
+    from states import BotStates
+
+    mocker.patch.dict(sessions._activity, clear=True)
+    mocker.patch.object(Config, 'session_ttl', '*=100')
+    mocker.patch.object(Config, 'session_reminder', 30)
+    clock = mocker.patch('sessions.time.monotonic', return_value=1000.0)
+
+    async def run_test():
+        storage = MemoryStorage()
+        bot = MagicMock()
+        bot.send_message = mocker.AsyncMock()
+        key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+        data = {'queue': [{'fid': 7}, {'fid': 8}]}
+        await storage.set_state(key, BotStates.fid)
+        await storage.set_data(key, data)
+        sessions.touched(key)
+
+        clock.return_value = 1075.0
+        assert await sessions.sweep(bot, storage) == 0
+        bot.send_message.assert_not_awaited()
+
+        clock.return_value = 1200.0
+        assert await sessions.sweep(bot, storage) == 0
+        await sessions.sweep(bot, storage)
+        assert bot.send_message.await_count == 1
+        assert 'ИД 7, 8' in bot.send_message.await_args.args[1]
+        assert await storage.get_state(key) == BotStates.fid and await storage.get_data(key) == data
+
+    asyncio.run(run_test())
+
+
+def test_stats_summary_from_metrics(mocker):
+    """Сводка /stats: процентили по последним значениям, доли ошибок и попаданий в кэш, пулы потоков."""
+    import asyncio
+    import metrics
+    import stats
+
+    metrics.reset()
+    for value in range(1, 101):
+        metrics.observe('handler.latency_ms', value)
+    metrics.observe('trace.save_ms', 2500)
+    metrics.inc('ngw.requests', 50)
+    metrics.inc('ngw.errors', 5)
+    metrics.inc('snapshot.hits', 3)
+    metrics.inc('snapshot.misses', 1)
+
+    async def failing(bot, method):
+        raise RuntimeError('Bot API недоступен')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(stats.telegram_calls(failing, None, None))
+
+    data = stats.collect()
+    assert data['latencies']['handler.latency_ms'] == {'count': 100, 'p50': 50, 'p95': 95, 'p99': 99}
+    assert data['errors'] == {'NextGIS WEB': (5, 50), 'Bot API': (1, 1)}
+    assert data['caches']['snapshot'] == (3, 4)
+    text = stats.render(data)
+    assert f'(последние {stats.Config.metrics_window} значений)' in text
+    assert 'Обработчики: 50 / 95 / 99' in text and 'NextGIS WEB: 10.0% (5 из 50)' in text
+    assert 'snapshot: 75% (3 из 4)' in text and 'drive: 0 / 0 / 0' in text
+    metrics.reset()
+
+
+def test_percentile_nearest_rank():
+    """Процентиль методом ближайшего ранга: пустой список, малые выборки, границы 0 и 100."""
+    from tracing import percentile
+
+    assert percentile([], 50) == 0.0
+    assert percentile([1, 2], 50) == 1
+    assert [percentile(list(range(1, 11)), q) for q in (10, 50, 90, 95, 100)] == [1, 5, 9, 10, 10]
+    assert [percentile(list(range(1, 101)), q) for q in (1, 50, 95, 99)] == [1, 50, 95, 99]
+    assert percentile([3, 1, 2], 0) == 1
@@ -0,0 +1,228 @@
+""" Трассировка этапов конвейера сохранения (/save)
+Каждый этап и каждое внешнее обращение (NextGIS WEB, Google Drive, Telegram) оформляется спаном
+с длительностью, размером передаваемых данных и результатом. Спаны одного сохранения связаны
+общим идентификатором трассы (save_id) и по завершении корневого спана дописываются в JSON-lines
+файл (Config.trace_file). Формат записи повторяет span из OTLP/JSON (OpenTelemetry):
+traceId, spanId, parentSpanId, name, kind, startTimeUnixNano, endTimeUnixNano, attributes, status.
+
+Отчёт по накопленным трассам:
+    python tracing.py [файл] [--top N]
+выводит самые медленные трассы и процентили длительности по этапам.
+"""
+import argparse
+import contextvars
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from loguru import logger
+
+import metrics
+from config import Config
+
+SERVICE_NAME = 'bot_fire_water_sources'
+
+# Текущий (активный) спан в контексте задачи asyncio
+_current_span = contextvars.ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+
+
+class Span:
+    """ Спан - отрезок работы с именем, временем начала и окончания и атрибутами """
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'message', 'buffer')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: str = 'internal',
+                 buffer: list = None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.status = 'unset'
+        self.message = None
+        # Общий для всей трассы список завершённых спанов
+        self.buffer = buffer if buffer is not None else []
+
+    def set(self, **attributes):
+        """ Добавить атрибуты спана (размер данных, результат и т.п.) """
+        self.attributes.update(attributes)
+
+    def fail(self, exc: BaseException):
+        self.status = 'error'
+        self.message = f'{type(exc).__name__}: {exc}'
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict:
+        """ Представление спана в формате OTLP/JSON """
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': f'SPAN_KIND_{self.kind.upper()}',
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': f'STATUS_CODE_{self.status.upper()}', 'message': self.message or ''},
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+        }
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    """ Атрибут в виде пары key/value с типизированным значением (как в OTLP) """
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def current_trace_id():
+    """ Идентификатор текущей трассы (save_id) или None вне трассы """
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """ Корневой спан новой трассы. По его завершении вся трасса записывается в файл """
+    root = Span(name, trace_id=secrets.token_hex(16), **attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.fail(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(root)
+        export(root.buffer)
+        # Длительность и результат трассы - в скользящие окна метрик (/stats)
+        metrics.observe(f'trace.{name}_ms', root.duration_ms)
+        metrics.inc(f'trace.{name}.count')
+        if root.status == 'error':
+            metrics.inc(f'trace.{name}.errors')
+
+
+@contextmanager
+def span(name: str, kind: str = 'internal', **attributes):
+    """ Дочерний спан текущей трассы (этап или внешний вызов: kind='client').
+    Вне трассы спан создаётся, но никуда не записывается """
+    parent = _current_span.get()
+    if parent is None:
+        current = Span(name, trace_id=secrets.token_hex(16), kind=kind, **attributes)
+    else:
+        current = Span(name, trace_id=parent.trace_id, parent_id=parent.span_id, kind=kind,
+                       buffer=parent.buffer, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.fail(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current)
+
+
+def _finish(current: Span):
+    current.end_ns = time.time_ns()
+    if current.status == 'unset':
+        current.status = 'ok'
+    current.buffer.append(current)
+
+
+def export(spans: list, path: str = None):
+    """ Дописать завершённые спаны в JSON-lines файл (одна строка - один спан) """
+    path = path or Config.trace_file
+    if not path or not spans:
+        return
+    try:
+        lines = ''.join(json.dumps(item.to_otlp(), ensure_ascii=False) + '\n' for item in spans)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _write_lock, open(path, 'a', encoding='utf-8') as file:
+            file.write(lines)
+    except Exception as exc:
+        logger.error(f'Ошибка записи трассы в {path}: {exc}')
+
+
+# --- Отчёт по трассам ---
+def load_spans(path: str) -> list:
+    spans = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def span_duration_ms(record: dict) -> float:
+    return (int(record['endTimeUnixNano']) - int(record['startTimeUnixNano'])) / 1e6
+
+
+def percentile(values: list, q: float) -> float:
+    """ Процентиль q (0..100) методом ближайшего ранга """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def report(spans: list, top: int = 10) -> str:
+    """ Текстовый отчёт: самые медленные трассы и процентили по именам спанов """
+    traces = defaultdict(list)
+    for record in spans:
+        traces[record['traceId']].append(record)
+
+    roots = [record for record in spans if not record['parentSpanId']]
+    roots.sort(key=span_duration_ms, reverse=True)
+
+    lines = [f'Трасс: {len(roots)}, спанов: {len(spans)}', '', f'Самые медленные трассы (top {top}):']
+    for root in roots[:top]:
+        status = root['status']['code'].replace('STATUS_CODE_', '')
+        lines.append(f"{span_duration_ms(root):10.1f} ms  {root['traceId']}  {root['name']}  {status}")
+        children = [record for record in traces[root['traceId']] if record['parentSpanId'] == root['spanId']]
+        children.sort(key=lambda record: int(record['startTimeUnixNano']))
+        for child in children:
+            lines.append(f"{span_duration_ms(child):18.1f} ms  {child['name']}")
+
+    durations = defaultdict(list)
+    for record in spans:
+        durations[record['name']].append(span_duration_ms(record))
+
+    lines += ['', f"{'Спан':40} {'n':>6} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+    for name in sorted(durations, key=lambda key: percentile(durations[key], 95), reverse=True):
+        values = durations[name]
+        lines.append(f'{name:40} {len(values):6d} ' +
+                     ' '.join(f'{percentile(values, q):9.1f}' for q in (50, 90, 95, 99)) +
+                     f' {max(values):9.1f}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Отчёт по трассам сохранения (/save)')
+    parser.add_argument('path', nargs='?', default=Config.trace_file, help='JSON-lines файл трасс')
+    parser.add_argument('--top', type=int, default=10, help='Количество самых медленных трасс')
+    args = parser.parse_args()
+    print(report(load_spans(args.path), top=args.top))